@@ -4,6 +4,7 @@
 """
 # Standart library.
 import logging
+import os
 # My stuff.
 # General.
 from infiniworld import events
@@ -11,11 +12,14 @@ from infiniworld import evtman
 from infiniworld import models
 from infiniworld.controllers.player import PlayerController
 from infiniworld.controllers.loop import GameLoopController
+from infiniworld.models import areafile
+from infiniworld.models.autosave import Autosave
 from controllers.keyboard import StartScreenKeyboardController
 from controllers.keyboard import GameScreenKeyboardController
 from controllers.keyboard import PauseScreenKeyboardController
 from controllers.keyboard import GameOverScreenKeyboardController
 # Pygame related.
+import directories
 import pygame_
 # Bunny related.
 import assets
@@ -46,6 +50,8 @@ class Game(evtman.SingleListener):
         self._status_text_view = None
         self._game_over_view = None
         self._time = 0
+        self._area_file = None
+        self._autosave = None
         #
         with pygame_.Pygame():
             self._pygame_view = pygame_.PygameView(event_manager,
@@ -60,6 +66,19 @@ class Game(evtman.SingleListener):
             # Run the game until a QuitEvent is posted.
             self._game_loop_controller.run()
             LOGGER.info("Stopping...")
+            if self._autosave:
+                self._autosave.close()
+                self._area_file.close()
+    def startAutosave(self):
+        """Save the area of the bunny every now and then, in a new file."""
+        path = os.path.join(directories.DIR_VAR_SAV, 'bunny.area')
+        for old in (path, path + '.idx'):
+            if os.path.exists(old):
+                os.remove(old)
+        self._area_file = areafile.AreaFile(path)
+        # The spawners live in the area of the bunny, I know it.
+        self._autosave = Autosave(self._event_manager, self._fox_spawner.area,
+                                  self._area_file)
     def onStartGameCommand(self, unused):
         self._pygame_view.removeView(self._title_view)
         self._title_view.unregister()
@@ -88,6 +107,7 @@ class Game(evtman.SingleListener):
         self._keyboard_controller = GameScreenKeyboardController(self._event_manager)
         self.post(models.events.ControlEntityEvent(0))
         self.post(models.events.ViewAreaEvent(0))
+        self.startAutosave()
         self.post(events.PausePhysicsRequest(False))
     def onGameOverEvent(self, unused):
         self._keyboard_controller.unregister()
@@ -3,15 +3,20 @@
 # Standard library.
 from __future__ import division
 
+import math
+import multiprocessing
 import random
 # My stuff.
 import infiniworld
+from infiniworld.models.spawnpoints import SpawnPointTable
 import world
 
-def GenerateInterestingTileMap(size, obstacle_density):
+def GenerateInterestingTileMap(size, obstacle_density, rng=random):
     """This generator plants seeds that grow regions on a certain type.  You
     end up with big patches of the same.
 
+    The random numbers come from `rng`, a random.Random or the random module.
+
     """
     min_x = -size[0] // 2
     max_x = min_x + size[0] - 1
@@ -29,11 +34,11 @@ def GenerateInterestingTileMap(size, obstacle_density):
     for unused in range(seeds_nb):
         # I need to make a list because random.choice doesn't work on sets:
         # sets don't support indexing.
-        seed = random.choice(list(available))
+        seed = rng.choice(list(available))
         available.remove(seed)
         seeds.add(seed)
-        nature = random.choice(natures)
-        obstacle = random.random()
+        nature = rng.choice(natures)
+        obstacle = rng.random()
         height = 1 if obstacle < obstacle_density else 0
         tile = infiniworld.models.tile.Tile(nature, height)
         tiles[seed] = tile
@@ -59,7 +64,7 @@ def GenerateInterestingTileMap(size, obstacle_density):
             seeds |= around
             available -= around
             for seed in around:
-                obstacle = random.random()
+                obstacle = rng.random()
                 height = 1 if obstacle < obstacle_density else 0
                 tile = infiniworld.models.tile.Tile(nature, height)
                 tiles[seed] = tile
@@ -79,14 +84,242 @@ def GenerateInterestingTileMap(size, obstacle_density):
     tile_map = infiniworld.models.tile.TileMap(tiles)
     return tile_map
 
-def GenerateWorld(event_manager, area_size):
-    """Procedural generation, woohoo !"""
-    world_model = infiniworld.models.WorldModel(event_manager)
+# Natures of the tiles of the grid of GenerateBiomesTileMap that have not been
+# reached yet, and of the margin around the map.
+_FREE = 0xff
+_MARGIN = 0xfe
+
+def GenerateBiomesTileMap(size, obstacle_density, seed=None):
+    """Same patches as GenerateInterestingTileMap, in linear time.
+
+    GenerateInterestingTileMap makes a list of all the free tiles for each
+    seed it plants, and shuffles sets of tuples around to grow the regions: a
+    1024*1024 map takes minutes.  Here the seeds are drawn in one go, and the
+    regions grow all together, breadth first, on a flat bytearray of natures.
+    Every tile is looked at once, it takes seconds.  The tiles are packed
+    directly and the map is built from the rows, see TileMap.fromGrid.
+
+    The same seed gives the same map.
+
+    """
+    tile_module = infiniworld.models.tile
+    rng = random.Random(seed)
+    width, height = size
+    min_x = -width // 2
+    min_y = -height // 2
+    natures = tile_module.NATURES_FROM_ID.keys()
+    natures.remove(tile_module.NATURE_RUBBER)
+    # The grid has a margin of one tile all around the map, so that all the
+    # tiles of the map have 8 neighbors: no need to check the bounds.
+    stride = width + 2
+    grid = bytearray(chr(_MARGIN) * stride)
+    for unused in xrange(height):
+        grid += chr(_MARGIN) + chr(_FREE) * width + chr(_MARGIN)
+    grid += chr(_MARGIN) * stride
+    neighbors = (-stride - 1, -stride, -stride + 1, -1, 1,
+                 stride - 1, stride, stride + 1)
+    seeds_nb = max(1, width * height // 100)
+    frontier = []
+    for tile_index in rng.sample(xrange(width * height), seeds_nb):
+        index = (tile_index // width + 1) * stride + tile_index % width + 1
+        grid[index] = rng.choice(natures)
+        frontier.append(index)
+    # Now, contaminate the universe, one ring around the regions at a time.
+    while frontier:
+        grown = []
+        for index in frontier:
+            nature = grid[index]
+            for offset in neighbors:
+                neighbor = index + offset
+                if grid[neighbor] == _FREE:
+                    grid[neighbor] = nature
+                    grown.append(neighbor)
+        frontier = grown
+    # Pack the tiles, without the margin, and raise the obstacles.
+    packed = bytearray(width * height)
+    height_bit = tile_module.HEIGHT_BIT
+    rand = rng.random
+    for y in xrange(height):
+        row = (y + 1) * stride + 1
+        start = y * width
+        packed[start:start + width] = grid[row:row + width]
+        for index in xrange(start, start + width):
+            if rand() < obstacle_density:
+                packed[index] |= height_bit
+    # Center is low.
+    for x in xrange(-1, 2):
+        for y in xrange(-1, 2):
+            if 0 <= x - min_x < width and 0 <= y - min_y < height:
+                packed[(y - min_y) * width + x - min_x] &= ~height_bit & 0xff
+    # Borders are high.
+    for x in xrange(width):
+        packed[x] |= height_bit
+        packed[(height - 1) * width + x] |= height_bit
+    for y in xrange(height):
+        packed[y * width] |= height_bit
+        packed[y * width + width - 1] |= height_bit
+    return tile_module.TileMap.fromGrid((min_x, min_y), width, packed)
+
+#------------------------------  Infinite maps.  ------------------------------
+
+def latticeValue(seed, x, y):
+    """Return a float in [0, 1) that only depends on the arguments.
+
+    A few multiplications and shifts to mix the bits of the integers: this is
+    not cryptography, it only has to look random on a map.
+
+    """
+    value = (seed * 0x9e3779b1 + x * 0x85ebca6b + y * 0xc2b2ae35) & 0xffffffff
+    value = ((value ^ (value >> 15)) * 0x2c1b3c6d) & 0xffffffff
+    value = ((value ^ (value >> 12)) * 0x297a2d39) & 0xffffffff
+    return (value ^ (value >> 15)) / 4294967296
+
+def valueNoise(seed, x, y, scale, lattice):
+    """Return the coherent noise at (x, y), between 0 and 1.
+
+    The noise has random values at the points of a square lattice of step
+    `scale`, and is smoothly interpolated between them.  `lattice` is a
+    dictionary in which the values of the lattice are kept: the tiles of a
+    chunk share most of them.
+
+    """
+    cell_x = math.floor(x / scale)
+    cell_y = math.floor(y / scale)
+    frac_x = x / scale - cell_x
+    frac_y = y / scale - cell_y
+    cell_x = int(cell_x)
+    cell_y = int(cell_y)
+    corners = []
+    for corner in ((cell_x, cell_y), (cell_x + 1, cell_y),
+                   (cell_x, cell_y + 1), (cell_x + 1, cell_y + 1)):
+        key = (seed, scale, corner)
+        value = lattice.get(key)
+        if value is None:
+            value = lattice[key] = latticeValue(seed, corner[0], corner[1])
+        corners.append(value)
+    # Smoothstep: the slopes match on the edges of the cells.
+    frac_x = frac_x * frac_x * (3 - 2 * frac_x)
+    frac_y = frac_y * frac_y * (3 - 2 * frac_y)
+    bottom = corners[0] + (corners[1] - corners[0]) * frac_x
+    top = corners[2] + (corners[3] - corners[2]) * frac_x
+    return bottom + (top - bottom) * frac_y
+
+def fractalNoise(seed, x, y, octaves, lattice):
+    """Sum of value noises, `octaves` is a list of (scale, weight)."""
+    total = 0
+    for index, (scale, weight) in enumerate(octaves):
+        total += weight * valueNoise(seed + index, x, y, scale, lattice)
+    return total
+
+# Each octave is (scale in tiles, weight).  The weights add up to 1.
+NOISE_OCTAVES = ((48, .6), (16, .3), (5, .1))
+# Different seeds for the different noises of the same world.
+_ELEVATION_SALT = 0
+_MOISTURE_SALT = 1000
+_OBSTACLE_SALT = 2000
+# (highest elevation, nature).  Moisture decides between grass and dirt.
+# The elevation is around .5 most of the time, these give roughly the same
+# proportions as GenerateInterestingTileMap.
+ELEVATIONS = ((.30, infiniworld.models.tile.NATURE_DEEPWATER),
+              (.36, infiniworld.models.tile.NATURE_SHALLOWWATER),
+              (.41, infiniworld.models.tile.NATURE_SAND),
+              (.68, None),
+              (1, infiniworld.models.tile.NATURE_STONE))
+
+def GenerateNoiseChunk(seed, obstacle_density, chunk_x, chunk_y, size):
+    """Return the packed tiles of a chunk of an infinite map, as a string.
+
+    The result only depends on the arguments, not on the chunks that were
+    generated before: chunks can be generated in any order, anywhere, and
+    come back identical after they were evicted.  The natures follow a
+    coherent noise (the elevation, and the moisture for the lowlands) so that
+    they make patches across chunks.  The obstacles are scattered like in
+    GenerateInterestingTileMap.  Like there, the center is low.
+
+    """
+    tile_module = infiniworld.models.tile
+    seed &= 0xffffffff
+    lattice = {}
+    packed = bytearray(size * size)
+    index = 0
+    for y in xrange(chunk_y * size, (chunk_y + 1) * size):
+        for x in xrange(chunk_x * size, (chunk_x + 1) * size):
+            elevation = fractalNoise(seed + _ELEVATION_SALT, x, y,
+                                     NOISE_OCTAVES, lattice)
+            for highest, nature in ELEVATIONS:
+                if elevation < highest:
+                    break
+            if nature is None:
+                moisture = fractalNoise(seed + _MOISTURE_SALT, x, y,
+                                        NOISE_OCTAVES, lattice)
+                if moisture < .5:
+                    nature = tile_module.NATURE_DIRT
+                else:
+                    nature = tile_module.NATURE_GRASS
+            obstacle = latticeValue(seed + _OBSTACLE_SALT, x, y)
+            height = (obstacle < obstacle_density and
+                      not (-1 <= x <= 1 and -1 <= y <= 1))
+            packed[index] = tile_module.packTile(nature, int(height))
+            index += 1
+    return str(packed)
+
+def _generateNoiseChunkTask(task):
+    """GenerateNoiseChunk with a tuple of arguments, for the process pool."""
+    return GenerateNoiseChunk(*task)
+
+
+class NoiseChunkGenerator(object):
+    """Generator of the chunks of an infinite TileMap.  See GenerateNoiseChunk.
+
+    When the TileMap needs many chunks at once (see TileMap.loadAround), they
+    are generated on a pool of processes.  Call `close` when you're done with
+    it, it stops the processes.
+
+    """
+    # Below that many chunks, it's faster to generate them here than to bother
+    # the pool.
+    MIN_BATCH = 4
+    def __init__(self, seed, obstacle_density=.2, workers=None):
+        object.__init__(self)
+        self.seed = seed
+        self.obstacle_density = obstacle_density
+        self._workers = workers or multiprocessing.cpu_count()
+        self._pool = None
+    def __call__(self, chunk_x, chunk_y, size):
+        return GenerateNoiseChunk(self.seed, self.obstacle_density,
+                                  chunk_x, chunk_y, size)
+    def generateChunks(self, chunk_coords, size):
+        """Return {chunk_coord: packed tiles} for all these chunks."""
+        tasks = [(self.seed, self.obstacle_density, chunk_x, chunk_y, size)
+                 for chunk_x, chunk_y in chunk_coords]
+        if len(tasks) < self.MIN_BATCH or self._workers < 2:
+            results = [_generateNoiseChunkTask(task) for task in tasks]
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self._workers)
+            results = self._pool.map(_generateNoiseChunkTask, tasks)
+        return dict(zip(chunk_coords, results))
+    def close(self):
+        """Stop the processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+
+def GenerateWorld(event_manager, area_size, seed=None):
+    """Procedural generation, woohoo !
+
+    With a seed, the world is deterministic, see WorldModel.
+
+    """
+    world_model = infiniworld.models.WorldModel(event_manager, seed)
     area_model = world_model.createArea()
-    tile_map = GenerateInterestingTileMap(area_size, .2)
-    coords = set([coord
-                  for coord, tile_ in tile_map.tiles.iteritems()
-                  if tile_.height == 0])
+    tile_map = GenerateBiomesTileMap(
+        area_size, .2, world_model.getRandom('gen').getrandbits(64))
+    coords = SpawnPointTable(sorted(coord
+                                    for coord, (unused, height) in
+                                    tile_map.makeSummary().iteritems()
+                                    if height == 0))
     area_model.tile_map = tile_map
     # Place the bunny: the player character.
     creature = world_model.createEntity(world.BunnyModel)
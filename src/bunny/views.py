@@ -242,24 +242,31 @@ class CreatureView(MyEntityView):
     DAMAGE_COOLDOWN = .5
     def __init__(self, event_manager, entity_id):
         MyEntityView.__init__(self, event_manager, entity_id)
-        self._damage_time = 0
+        # Time of the AreaView when we're not red anymore.
+        self._hurt_until = 0
         self._hurt = False
+        self._heal_timer = None
         # pylint: disable-msg=E1121
         self._hurt_surface = pygame.Surface((32, 32))
     def render(self):
-        """Displays us, with a red hue if we're hurt."""
-        if not self._dirty:
-            return
-        self._dirty = False
+        """Displays us, with a red hue fading away if we're hurt."""
         if self._hurt:
+            # Fading, so it changes all the time.
             image = self._original_image.copy()
-            intensity = int(255 * self._damage_time / self.DAMAGE_COOLDOWN)
+            time_left = self._hurt_until - self.area_view.timers.now
+            intensity = int(255 * max(time_left, 0) / self.DAMAGE_COOLDOWN)
             # We become red by removing the blue and the green from our sprite.
             self._hurt_surface.fill((0, intensity, intensity))
             image.blit(self._hurt_surface, (0, 0), None, pygame.BLEND_RGB_SUB)
             self.sprite.image = image
-        else:
+        elif self._dirty:
+            self._dirty = False
             self.sprite.image = self._original_image
+    def heal(self):
+        """Not red anymore."""
+        self._hurt = False
+        self._heal_timer = None
+        self._dirty = True
     def leaveCorpse(self):
         """Special effect when creature dies."""
         factory = pygame_.ENTITY_VIEW_FACTORIES[self.CORPSE]
@@ -270,20 +277,24 @@ class CreatureView(MyEntityView):
         """We're dead: leave a corpse behind."""
         if event.entity_id == self._entity_id:
             self.leaveCorpse()
+    def showHurt(self):
+        """Become red for a little while."""
+        # The AreaView tells us when it's over: no need to watch the time
+        # flow.
+        timers = self.area_view.timers
+        self._hurt = True
+        self._hurt_until = timers.now + self.DAMAGE_COOLDOWN
+        if self._heal_timer is not None:
+            self._heal_timer.cancel()
+        self._heal_timer = timers.schedule(self.DAMAGE_COOLDOWN, self.heal)
     def onAttackEvent(self, event):
-        """We're under attack: become red for a little while."""
+        """We're under attack."""
         if event.victim == self._entity_id:
-            self._hurt = True
-            self._damage_time = self.DAMAGE_COOLDOWN
-            self._dirty = True
-    def onRunPhysicsEvent(self, event):
-        """Time flows: update our red appearance if we're hurt."""
-        if self._hurt:
-            self._damage_time -= event.timestep
-            if self._damage_time <= 0:
-                self._damage_time = 0
-                self._hurt = False
-            self._dirty = True
+            self.showHurt()
+    def onAreaAttackEvent(self, event):
+        """We're under attack with others."""
+        if self._entity_id in event.victims:
+            self.showHurt()
 
 class BunnyView(CreatureView):
     """We're cute."""
@@ -4,8 +4,6 @@
 """
 from __future__ import division
 import math
-import random
-from operator import itemgetter
 from infiniworld.events import StatusTextEvent
 from infiniworld.evtman import Event
 from infiniworld.evtman import SingleListener
@@ -13,6 +11,7 @@ from infiniworld.models import EntityModel
 from infiniworld.models.events import DestroyEntityRequest
 from infiniworld.models.events import AttackEvent
 from infiniworld.geometry import Vector
+from infiniworld import physics
 
 #---------------------------------  Events.  ----------------------------------
 
@@ -40,6 +39,13 @@ class CreatureDiedEvent(Event):
 
 # pylint: enable-msg=R0903
 
+#----------------------------  Collision layers.  -----------------------------
+
+# Foxes don't care about carrots, and carrots only care about bunnies.
+LAYER_BUNNY = physics.LAYER_DEFAULT
+LAYER_FOX = 1 << 2
+LAYER_ITEM = 1 << 3
+
 #--------------------------------  Creatures.  --------------------------------
 
 class CreatureModel(EntityModel):
@@ -48,10 +54,13 @@ class CreatureModel(EntityModel):
     MAX_HEALTH = 1
     DAMAGE_COOLDOWN = .5
     ATTACK_COOLDOWN = .5
-    def __init__(self, event_manager, entity_id):
-        EntityModel.__init__(self, event_manager, entity_id)
-        self._attack_cooldown = 0
-        self._damage_cooldown = 0
+    # The cooldowns are the times when we can attack and be hurt again.
+    SNAPSHOT_FIELDS = EntityModel.SNAPSHOT_FIELDS + (
+        '_attack_ready', '_damage_ready', '_health')
+    def reset(self, entity_id):
+        EntityModel.reset(self, entity_id)
+        self._attack_ready = 0.
+        self._damage_ready = 0.
         self._health_max = self.MAX_HEALTH
         self._health = self._health_max
     def die(self):
@@ -79,24 +88,24 @@ class CreatureModel(EntityModel):
     def changeHealth(self, offset):
         """Shortcut for setting the health with a relative value."""
         self.setHealth(self._health + offset)
-    def runAI(self, timestep):
-        """Basic AI of creatures."""
-        self._damage_cooldown -= timestep
-        if self._damage_cooldown < 0:
-            self._damage_cooldown = 0
-        self._attack_cooldown -= timestep
-        if self._attack_cooldown < 0:
-            self._attack_cooldown = 0
     def onHealthRequest(self, event):
         """Medical files are public domain."""
         if event.entity_id == self.entity_id:
             self.post(HealthEvent(self.entity_id, self._health))
+    def hurt(self):
+        """Lose health, unless we were hurt a moment ago."""
+        now = self.getTime()
+        if now >= self._damage_ready:
+            self._damage_ready = now + self.DAMAGE_COOLDOWN
+            self.changeHealth(-1)
     def onAttackEvent(self, event):
         """We're under attack!"""
         if event.victim == self.entity_id:
-            if self._damage_cooldown == 0:
-                self._damage_cooldown = self.DAMAGE_COOLDOWN
-                self.changeHealth(-1)
+            self.hurt()
+    def onAreaAttackEvent(self, event):
+        """We're under attack, and we're not alone."""
+        if self.entity_id in event.victims:
+            self.hurt()
 
 class BunnyModel(CreatureModel):
     """Our hero !"""
@@ -107,8 +116,13 @@ class BunnyModel(CreatureModel):
     DAMAGE_COOLDOWN = .5
     ATTACK_COOLDOWN = .3
     MAX_HEALTH = 10
-    def __init__(self, event_manager, entity_id):
-        CreatureModel.__init__(self, event_manager, entity_id)
+    SHOCK_WAVE_RADIUS = 8
+    SHOCK_WAVE_STRENGTH = 60
+    SHOCK_WAVE_HIT_IMPULSE = 12
+    COLLISION_LAYER = LAYER_BUNNY
+    SNAPSHOT_FIELDS = CreatureModel.SNAPSHOT_FIELDS + ('_carrots',)
+    def reset(self, entity_id):
+        CreatureModel.reset(self, entity_id)
         self._carrots = 0
     def setCarrots(self, value):
         """Inventory management :D."""
@@ -116,42 +130,31 @@ class BunnyModel(CreatureModel):
         self.post(CarrotEvent(self._carrots))
     def giveCarrot(self):
         """Shortcut for picking up a carrot."""
-        # This is called by the CarrotModel when it is collided by a bunny.
+        # This is called by the CarrotModel when a bunny walks on it.
         self.setCarrots(self._carrots + 1)
     def onAttackRequest(self, event):
         """Player wants us to attack."""
         if event.attacker != self.entity_id:
             return
-        if self._attack_cooldown > 0:
+        now = self.getTime()
+        if now < self._attack_ready:
             self.post(StatusTextEvent("Too soon!"))
             return
         if not self._carrots:
             self.post(StatusTextEvent("Not enough carrots!"))
             return
-        self._attack_cooldown = self.ATTACK_COOLDOWN
+        self._attack_ready = now + self.ATTACK_COOLDOWN
         self.post(StatusTextEvent("Psy-wave!"))
         # This is going to make the view display a special effect showing
         # the psy wave.
         self.post(ShockWaveEvent(self.entity_id))
         self.setCarrots(self._carrots - 1)
-        entities = self.area.entity_map.getNear(self.body.pos, 8)
-        impulse_max = 20
-        for entity in entities:
-            if not (entity.exists and entity.body.solid):
-                continue
-            if entity == self:
-                continue
-            difference = entity.body.pos - self.body.pos
-            try:
-                impulse = (60 * entity.body.one_over_mass /
-                           difference.norm() ** .5)
-            except ZeroDivisionError:
-                impulse = impulse_max
-            impulse = difference.normalized() * impulse
-            entity.body.vel += impulse
-            # The shock is so strong the creature may be hurt.
-            if impulse.norm() >= impulse_max * .6:
-                self.post(AttackEvent(self.entity_id, entity.entity_id))
+        # The shock is so strong the creatures close enough may be hurt.
+        self.area.applyRadialImpulse(self.body.pos, self.SHOCK_WAVE_RADIUS,
+                                     self.SHOCK_WAVE_STRENGTH,
+                                     exclude=(self.entity_id,),
+                                     attacker=self.entity_id,
+                                     hit_impulse=self.SHOCK_WAVE_HIT_IMPULSE)
 
 class ZombieFoxModel(CreatureModel):
     """Enemies, they're evil."""
@@ -163,44 +166,38 @@ class ZombieFoxModel(CreatureModel):
     PERCEPTION_RADIUS = 4
     ATTACK_RADIUS = (BODY_RADIUS + BunnyModel.BODY_RADIUS) * 1.1
     CHANGE_DIRECTION_COOLDOWN = 2
-    def __init__(self, event_manager, entity_id):
-        CreatureModel.__init__(self, event_manager, entity_id)
-        self._change_direction_cooldown = 0
+    COLLISION_LAYER = LAYER_FOX
+    COLLISION_MASK = physics.LAYER_ALL & ~LAYER_ITEM
+    # They come and go by the hundreds.
+    POOLED = True
+    SNAPSHOT_FIELDS = CreatureModel.SNAPSHOT_FIELDS + (
+        '_change_direction_ready',)
+    def reset(self, entity_id):
+        CreatureModel.reset(self, entity_id)
+        self._change_direction_ready = 0.
     def randomWalk(self):
         """Goes somewhere stupidely, like zombies do."""
-        self._change_direction_cooldown = self.CHANGE_DIRECTION_COOLDOWN
-        self._change_direction_cooldown *= .8 + .4 * random.random()
-        angle = random.random() * 2 * math.pi
+        rng = self.area.world.getRandom('ai')
+        cooldown = self.CHANGE_DIRECTION_COOLDOWN * (.8 + .4 * rng.random())
+        self._change_direction_ready = self.getTime() + cooldown
+        angle = rng.random() * 2 * math.pi
         self._walk_force.vector = Vector.fromDirection(angle,
                                                        self.WALK_STRENGTH)
-    def runAI(self, timestep):
-        CreatureModel.runAI(self, timestep)
-        self._change_direction_cooldown -= timestep
-        if self._change_direction_cooldown < 0:
-            self._change_direction_cooldown = 0
-
-        # Looking for nearby bunnies.
-        entities = self.area.entity_map.getNear(self.body.pos,
-                                                self.PERCEPTION_RADIUS)
-        entities = [entity
-                    for entity in entities
-                    if entity.NAME == 'Bunny' and entity.exists]
-        if entities:
-            # Sort by distance.
-            distances = [entity.body.pos.dist(self.body.pos)
-                         for entity in entities]
-            entities = zip(entities, distances)
-            entities.sort(key=itemgetter(1))
-            # The closest.
-            bunny, distance = entities[0]
+    def perceive(self):
+        """Chase the closest bunny in sight, or wander."""
+        # Looking for nearby bunnies.  The area knows who sees them.
+        bunny, distance = self.area.perception.findClosest(
+            self, 'Bunny', self.PERCEPTION_RADIUS)
+        now = self.getTime()
+        if bunny is not None:
             direction = (bunny.body.pos - self.body.pos).normalized()
-            if distance <= self.ATTACK_RADIUS and self._attack_cooldown == 0:
-                self._attack_cooldown = self.ATTACK_COOLDOWN
+            if distance <= self.ATTACK_RADIUS and now >= self._attack_ready:
+                self._attack_ready = now + self.ATTACK_COOLDOWN
                 self._walk_force.vector.zero()
                 self.post(AttackEvent(self.entity_id, bunny.entity_id))
             else:
                 self._walk_force.vector = direction * self.WALK_STRENGTH
-        elif self._change_direction_cooldown == 0:
+        elif now >= self._change_direction_ready:
             self.randomWalk()
 
 #----------------------------------  Items.  ----------------------------------
@@ -210,45 +207,65 @@ class CarrotModel(EntityModel):
     NAME = 'Carrot'
     BODY_MASS = 1
     SOLID = False
+    COLLISION_LAYER = LAYER_ITEM
+    COLLISION_MASK = LAYER_BUNNY
     BODY_RADIUS = 0.5
     WALK_STRENGTH = 30
-    def reactToCollision(self, collider):
-        """The `collider` entity bumped into us."""
-        if collider.NAME == 'Bunny':
+    POOLED = True
+    def reactToTrigger(self, entity):
+        """The `entity` walked on us."""
+        if entity.NAME == 'Bunny':
             self.exists = False
             self.post(DestroyEntityRequest(self.entity_id))
-            collider.giveCarrot()
-            collider.changeHealth(1)
+            entity.giveCarrot()
+            entity.changeHealth(1)
             self.post(StatusTextEvent('Om nom nom!'))
 
 #---------------------------------  Spawner.  ---------------------------------
 
 class SpawnerModel(SingleListener):
     """This creates entities as the time goes."""
+    SNAPSHOT_FIELDS = ('_timer', '_active')
     def __init__(self, event_manager):
         SingleListener.__init__(self, event_manager)
         self.area = None
+        # A SpawnPointTable.
         self.coords = None
         self.factory = None
         self.period = None
         self._timer = 0
         self._active = True
-    def spawn(self):
-        """Create an entity."""
+    def spawn(self, count=1):
+        """Create entities, on free tiles.
+
+        In a crowded area, fewer entities may be created.
+
+        """
         world = self.area.world
-        entity = world.createEntity(self.factory)
-        # I have to put the set of coords into a list otherwise random.choice
-        # doesn't work.
-        entity.body.pos = Vector(random.choice(list(self.coords)))
-        world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        rng = world.getRandom('spawn')
+        for coord in self.coords.sample(rng, count, self.area,
+                                        self.factory.BODY_RADIUS):
+            entity = world.createEntity(self.factory)
+            entity.body.pos = Vector(coord)
+            world.moveEntityToArea(entity.entity_id, self.area.area_id)
     def onRunPhysicsEvent(self, event):
         """Create entities if it is time to do so"""
         if not self._active:
             return
         self._timer += event.timestep
         how_many, self._timer = divmod(self._timer, self.period)
-        for unused in xrange(int(how_many)):
-            self.spawn()
+        if how_many:
+            self.spawn(int(how_many))
     def onGameOverEvent(self, unused):
         """Don't create anything anymore when the game is over."""
         self._active = False
+    def onTilesChangedEvent(self, event):
+        """Don't spawn in the walls that appeared, do where they were."""
+        if (event.changes is None or self.area is None or
+            event.area_id != self.area.area_id):
+            return
+        for coord, (unused, height) in event.changes.iteritems():
+            if height:
+                self.coords.discard(coord)
+            else:
+                self.coords.add(coord)
@@ -0,0 +1,45 @@
+#! /usr/bin/python
+"""Benchmark of the terrain generators of bunny.gen.
+
+Run it from the src directory:
+
+    python -m devtools.benchgen
+
+For square maps of growing size, it prints the time it takes to generate the
+map with GenerateInterestingTileMap and with GenerateBiomesTileMap, and the
+time per tile.  The old generator is quadratic, so it stops at OLD_MAX_SIZE.
+
+"""
+from __future__ import division
+import random
+import time
+
+from bunny import gen
+
+SIZES = (32, 64, 128, 256, 512, 1024)
+OLD_MAX_SIZE = 256
+OBSTACLE_DENSITY = .2
+
+
+def timeGenerator(generator, size, seed):
+    """Return the time it takes to generate a size*size map, in seconds."""
+    start = time.time()
+    generator((size, size), OBSTACLE_DENSITY, seed)
+    return time.time() - start
+
+def main():
+    """Sweep and print."""
+    print "%6s %12s %12s %10s" % ("size", "interesting", "biomes", "us/tile")
+    for size in SIZES:
+        if size <= OLD_MAX_SIZE:
+            old = "%12.3f" % timeGenerator(gen.GenerateInterestingTileMap,
+                                           size, random.Random(0))
+        else:
+            old = "%12s" % "-"
+        new = timeGenerator(gen.GenerateBiomesTileMap, size, 0)
+        print "%6i %s %12.3f %10.2f" % (size, old, new,
+                                        new / size ** 2 * 1e6)
+    print "Timings in seconds."
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#! /usr/bin/python
+"""Benchmark of the EntityMap: chunk scale vs entity density vs query radius.
+
+Run it from the src directory:
+
+    python -m devtools.benchmap
+
+For every density and query radius, it prints the time per getNear call (and
+a distance check on what it returns) for each scale, the scale that was the
+fastest, and the scale the EntityMap picks by itself when left to tune itself
+on the same queries.
+
+"""
+from __future__ import division
+import random
+import timeit
+
+from infiniworld.geometry import Vector
+from infiniworld.models.entitymap import EntityMap
+from infiniworld import physics
+
+# Size of the square area the entities are scattered in.
+AREA_SIZE = 64
+# Entities per 100 square meters.
+DENSITIES = (1, 5, 20, 50)
+# Radius of the queries: collision pruning, fox perception, psy-wave.
+RADII = (1, 4, 8)
+QUERIES = 2000
+
+
+class DummyEntity(object):
+    """The EntityMap only needs the entity to have a body with a position."""
+    def __init__(self, pos):
+        object.__init__(self)
+        self.body = physics.Particle(1, pos)
+
+
+def randomPos():
+    """A position in the benchmark area."""
+    half = AREA_SIZE / 2
+    return Vector(random.uniform(-half, half), random.uniform(-half, half))
+
+def makeEntities(density):
+    """Scatter entities on the benchmark area."""
+    number = int(AREA_SIZE ** 2 * density / 100)
+    return [DummyEntity(randomPos()) for unused in xrange(number)]
+
+def makeMap(entities, scale, auto_scale=False):
+    """Return an EntityMap containing the entities."""
+    entity_map = EntityMap(scale, auto_scale)
+    for entity in entities:
+        entity_map.add(entity)
+    return entity_map
+
+def timeQueries(entity_map, positions, radius):
+    """Return the average time of a getNear call, in microseconds."""
+    get_near = entity_map.getNear
+    def queries():
+        """What we actually time.
+
+        The callers always look at what they got: a distance check is the
+        cheapest thing they do with it.
+
+        """
+        for pos in positions:
+            for entity in get_near(pos, radius):
+                entity.body.pos.dist(pos)
+    duration = min(timeit.repeat(queries, number=1, repeat=3))
+    return duration / len(positions) * 1e6
+
+def tunedScale(entities, positions, radius):
+    """Return the scale the EntityMap chooses for these queries."""
+    entity_map = makeMap(entities, EntityMap.DEFAULT_SCALE, True)
+    # Let it converge: one retune can only go to the best scale measured at
+    # the current scale, so give it a few rounds.
+    for unused in xrange(len(EntityMap.SCALES)):
+        for pos in positions[:EntityMap.RETUNE_QUERIES]:
+            entity_map.getNear(pos, radius)
+        entity_map.retune()
+    return entity_map.scale
+
+def main():
+    """Sweep and print."""
+    random.seed(0)
+    scales = EntityMap.SCALES
+    header = "%8s %6s " % ("density", "radius")
+    header += " ".join("%7s" % ("s=%i" % scale) for scale in scales)
+    header += " %6s %6s" % ("best", "tuned")
+    print header
+    for density in DENSITIES:
+        entities = makeEntities(density)
+        # Queries are centered on entities, like they are in the game.
+        positions = [random.choice(entities).body.pos
+                     for unused in xrange(QUERIES)]
+        for radius in RADII:
+            timings = []
+            for scale in scales:
+                entity_map = makeMap(entities, scale)
+                timings.append(timeQueries(entity_map, positions, radius))
+            best = scales[timings.index(min(timings))]
+            tuned = tunedScale(entities, positions, radius)
+            line = "%8i %6g " % (density, radius)
+            line += " ".join("%7.1f" % timing for timing in timings)
+            line += " %6i %6i" % (best, tuned)
+            print line
+    print "Timings in microseconds per getNear call."
+
+if __name__ == '__main__':
+    main()
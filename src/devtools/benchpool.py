@@ -0,0 +1,77 @@
+#! /usr/bin/python
+"""Benchmark of the ParallelPhysics: speedup vs number of processes.
+
+Run it from the src directory:
+
+    python -m devtools.benchpool
+
+It fills a big open area with a crowd of entities running around, and times
+runPhysics serially and then with pools of 1, 2, 4 and 8 processes.  It
+prints the time per update and the speedup against the serial loop.
+
+Don't expect anything above 1 on a single core machine: the pool only adds
+the cost of pickling the bodies back and forth.
+
+"""
+from __future__ import division
+import random
+import time
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models.parallel import ParallelPhysics
+
+# Size of the square area the entities are scattered in.
+AREA_SIZE = 200
+ENTITIES = (500, 2000)
+WORKERS = (1, 2, 4, 8)
+UPDATES = 20
+TIMESTEP = .05
+
+
+def makeArea(number):
+    """Return an area full of moving entities.  Without tiles, it's open."""
+    random.seed(0)
+    world = WorldModel(EventManager())
+    area = world.createArea()
+    half = AREA_SIZE / 2
+    for unused in xrange(number):
+        entity = world.createEntity(EntityModel)
+        entity.body.pos = Vector(random.uniform(-half, half),
+                                 random.uniform(-half, half))
+        entity.body.vel = Vector(random.uniform(-5, 5),
+                                 random.uniform(-5, 5))
+        world.moveEntityToArea(entity.entity_id, area.area_id)
+    return area
+
+def timeUpdates(area):
+    """Return the average duration of runPhysics, in milliseconds."""
+    start = time.time()
+    for unused in xrange(UPDATES):
+        area.runPhysics(TIMESTEP)
+    return (time.time() - start) / UPDATES * 1e3
+
+def main():
+    """Sweep and print."""
+    header = "%8s %8s" % ("entities", "serial")
+    header += " ".join("%14s" % ("%i procs" % workers) for workers in WORKERS)
+    print header
+    for number in ENTITIES:
+        serial = timeUpdates(makeArea(number))
+        line = "%8i %8.1f" % (number, serial)
+        for workers in WORKERS:
+            area = makeArea(number)
+            physics = ParallelPhysics(area, workers)
+            physics.MIN_ENTITIES = 0
+            try:
+                duration = timeUpdates(area)
+            finally:
+                physics.close()
+            line += " %7.1f (x%.2f)" % (duration, serial / duration)
+        print line
+    print "Timings in milliseconds per update."
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#! /usr/bin/python
+"""Memory used by the tiles: dictionary of Tile objects vs packed chunks.
+
+Run it from the src directory:
+
+    python -m devtools.benchtiles
+
+For square maps of growing size, it prints the memory taken by the old
+storage (a dictionary {(x, y): Tile}) and by the TileMap with its chunks of
+packed bytes, as measured by devtools.sizeof.total_size.
+
+"""
+from __future__ import division
+import random
+
+from devtools.sizeof import total_size
+from infiniworld.models import tile
+
+SIZES = (64, 128, 256, 512)
+NATURES = tuple(nature for nature in tile.NATURES_FROM_ID
+                if nature != tile.NATURE_RUBBER)
+
+
+def makeTiles(size):
+    """Return a dictionary of random Tile objects."""
+    random.seed(0)
+    half = size // 2
+    return dict(((x, y), tile.Tile(random.choice(NATURES),
+                                   int(random.random() < .2)))
+                for x in xrange(-half, half)
+                for y in xrange(-half, half))
+
+def objectContent(obj):
+    """total_size does not look into objects on its own."""
+    return [obj.__dict__]
+
+def slotsContent(obj):
+    """Same thing for objects with slots."""
+    return [getattr(obj, name) for name in obj.__slots__]
+
+def main():
+    """Measure and print."""
+    handlers = {tile.Tile: objectContent,
+                tile.TileMap: objectContent,
+                tile.TileChunk: slotsContent,
+                tile.TileAccess: objectContent,
+                tile.MemoryChunkStore: objectContent}
+    print "%6s %12s %12s %10s %8s" % ("size", "dict (B)", "chunks (B)",
+                                      "B/tile", "ratio")
+    for size in SIZES:
+        tiles = makeTiles(size)
+        dict_size = total_size(tiles, handlers)
+        tile_map = tile.TileMap(tiles)
+        del tiles
+        map_size = total_size(tile_map, handlers)
+        print "%6i %12i %12i %10.2f %8.1f" % (size, dict_size, map_size,
+                                               map_size / size ** 2,
+                                               dict_size / map_size)
+
+if __name__ == '__main__':
+    main()
@@ -126,8 +126,15 @@ class Listener(object):
         """
 
 class EventManager(object):
-    """An EventManager forward Events to the registered Listeners."""
-    def __init__(self):
+    """An EventManager forward Events to the registered Listeners.
+
+    The listeners of an event are called in no particular order: it depends
+    on where they are in memory.  Create the EventManager with ordered=True to
+    have them called in the order they registered, at the cost of a sort for
+    every event.  Deterministic simulations need that.
+
+    """
+    def __init__(self, ordered=False):
         object.__init__(self)
         # Dictionary of handlers interested by events. The key is an event
         # class name and the values are a set of handlers. This allows us to
@@ -153,6 +160,10 @@ class EventManager(object):
         # end of this queue.  Events are processed in the order they are
         # posted.
         self._event_queue = []
+        # Registration number of each Listener, for ordered dispatching.
+        self._ordered = ordered
+        self._registrations = 0
+        self._order = weakref.WeakKeyDictionary()
 
     def strHandlers(self):
         """Return a string of events and handlers on each line.  For debugging.
@@ -182,6 +193,8 @@ class EventManager(object):
                 # If I don't, I keep a pointer to the instance, and therefore
                 # it never leaves the dictionary.
                 handlers[listener] = handler.im_func
+        self._registrations += 1
+        self._order[listener] = self._registrations
         LOGGER.debug("%r registered to %r." % (listener, self))
 
     def unregister(self, listener):
@@ -192,6 +205,7 @@ class EventManager(object):
             if listener in handlers:
                 del handlers[listener]
                 did_something = True
+        self._order.pop(listener, None)
         if not did_something:
             raise NotRegisteredError()
         LOGGER.debug("%r unregistered from %r..." % (listener, self))
@@ -212,7 +226,11 @@ class EventManager(object):
             event_name = event.__class__.__name__
             handlers = self._handlers.get(event_name, None)
             if handlers:
-                for listener, handler in handlers.items():
+                items = handlers.items()
+                if self._ordered:
+                    order = self._order
+                    items.sort(key=lambda item: order[item[0]])
+                for listener, handler in items:
                     # We are iterating over a copy of the items.  This
                     # guarantees us that we won't be hit by an error if the
                     # dictionary changes size ((un)registration) during the
@@ -239,6 +257,16 @@ class SingleListener(Listener):
     def __init__(self, event_manager):
         """Registers the SingleListener to the given event manager."""
         Listener.__init__(self)
+        self._event_manager = None
+        self.register(event_manager)
+    def register(self, event_manager):
+        """Register the SingleListener to an event manager.
+
+        The constructor does it for you.  Call this only to give a new event
+        manager to a SingleListener that you unregistered, for example when it
+        was moved to another process.
+
+        """
         self._event_manager = event_manager
         event_manager.register(self)
     def unregister(self):
@@ -2,6 +2,7 @@
 """AreaModel.
 
 """
+from collections import deque
 from operator import attrgetter
 import logging
 import math
@@ -11,10 +12,12 @@ from infiniworld.evtman import SingleListener
 import tile
 import events
 from entitymap import EntityMap
+from perception import Perception
 from errors import AlreadyInAreaError
 from errors import NotInAreaError
 from infiniworld import physics
 from infiniworld import geometry
+from infiniworld.time_ import wallClock
 
 LOGGER = logging.getLogger('world')
 
@@ -67,10 +70,40 @@ class AreaModel(SingleListener):
 
     """
     COLLISION_ATTEMPTS = 5
+    # When an entity ends a physics update less than that far from where it
+    # started, we consider that it did not move.  See runPhysics.
+    MOVE_EPSILON = 1e-6
+    # Number of updates a contact is remembered while not touching.  Things
+    # pushed against a wall bounce off it and come back the next update.
+    CONTACT_PATIENCE = 2
+    # The chunks of tiles closer than that to an interest point (see below)
+    # are kept in memory, so that the views have something to show.
+    PRELOAD_RADIUS = 16
+    # Simulation levels of detail.  Entities far from everything that matters
+    # (the controlled entity, the camera...) don't need to be simulated as
+    # carefully as those under the player's nose.  Each tier is a tuple:
+    # (distance to the closest interest point up to which the tier applies,
+    #  number of physics updates between two simulations of the entity,
+    #  integrator).
+    # The first tier must cover at least what the AreaView shows.  The last
+    # tier has no limit.
+    LOD_TIERS = ((16, 1, physics.rk4),
+                 (32, 2, physics.rk4),
+                 (None, 3, physics.rk2))
+    # The entities perceive (see EntityModel.perceive) once every that many
+    # updates, not all during the same one: they are spread in that many
+    # buckets by entity_id, and one bucket goes per update.
+    AI_BUCKETS = 4
+    # Seconds of perception per update.  What does not fit waits for the next
+    # update.  Deterministic areas ignore it: it depends on the machine.
+    AI_BUDGET = .004
     def __init__(self, event_manager, world, area_id):
         SingleListener.__init__(self, event_manager)
         self.area_id = area_id
         self.world = world
+        # In deterministic mode, everything is done in the order of the
+        # entity ids.  See WorldModel.
+        self.deterministic = world is not None and world.deterministic
         # Only keep weak references to the entities because they are owned by
         # the World itself, not by the area.  They can move between areas, or
         # even be in no area at all.
@@ -79,19 +112,111 @@ class AreaModel(SingleListener):
         # the landscape.  By fix, I mean that these features cannot move.
         # However, one can imagine that some of these features appear,
         # disappear or change.  For example, a door can open.
+        self._tile_map = None
         self.tile_map = tile.TileMap()
         # The entity map is here ONLY for performance purposes.  It allows a
         # relatively quick access to the entities in a region.  This helps us
         # limiting the number of entities to look for during collisions, or
         # when a creature is looking around for nearby victims.
-        self.entity_map = EntityMap()
+        self.entity_map = EntityMap(ordered=self.deterministic)
         # Useful for collision detection: entities are colliding if the
         # distance between them is smaller than the sum of their radii. Keeping
         # track of the biggest possible radius helps you delimiting the area
         # containing the entities you may be colliding with.  Nothing beyond
         # your_radius + biggest_radius can touch you.
         self._biggest_entity_radius = 0
+        # Non-solid entities do not collide, they are sensors: they notice
+        # whoever overlaps them (a bunny on a carrot).  We keep them aside so
+        # that the trigger pass doesn't have to look at every entity.
+        self._sensors = {}
+        # The (sensor_id, entity_id) pairs that overlapped at the end of the
+        # last physics update.  Only new pairs trigger something.
+        self._overlaps = set()
+        # Contacts that survive between two physics updates.  For each
+        # entity_id, a dictionary whose keys identify what it was touching
+        # recently: entity ids for entities, coordinates for tiles.  The values
+        # count the updates since they last touched.  A fox pushing against a
+        # wall or against the bunny touches the same thing update after
+        # update, so we resolve these contacts first, see warmStart.
+        self._contacts = {}
+        # The (collider_id, collidee_id) pairs that already reacted during
+        # this physics update, see reportCollisions.
+        self._reported = set()
+        # Level of detail.  The interest points are positions around which
+        # the simulation must be perfect.  The entity controlled by the player
+        # is always one of them, the others are set with setInterestPoint.
+        # When there is no interest point at all, everybody gets the best
+        # tier.
+        self._controlled_entity_id = None
+        self._interest_points = {}
+        self._physics_updates = 0
+        # For each entity_id, the index of its tier in LOD_TIERS and the time
+        # it accumulated while waiting for its turn.
+        self._tiers = {}
+        self._lod_time = {}
+        # Sets of entity ids, see AI_BUCKETS.  The entities whose turn came
+        # and who did not perceive yet wait in the queue, they're also in the
+        # set.
+        self._ai_buckets = [set() for unused in xrange(self.AI_BUCKETS)]
+        self._ai_queue = deque()
+        self._ai_queued = set()
+        # Who sees whom, for the entities that perceive.
+        self.perception = Perception(self)
+        # Set by parallel.ParallelPhysics when the area is big enough to
+        # deserve several processes.
+        self.parallel_physics = None
+        # Set by prefetch.ChunkPrefetcher when the area is infinite.
+        self.chunk_prefetcher = None
         LOGGER.debug("Area %i created.", area_id)
+    def _getTileMap(self):
+        """Return the TileMap of this area."""
+        return self._tile_map
+    def _setTileMap(self, tile_map):
+        """Use that TileMap, and hear about its chunks being loaded."""
+        if self._tile_map is not None:
+            self._tile_map.chunk_loaded_callback = None
+        self._tile_map = tile_map
+        tile_map.chunk_loaded_callback = self.chunkLoaded
+    tile_map = property(_getTileMap, _setTileMap, None, "TileMap of the area.")
+    def chunkLoaded(self, chunk_coord):
+        """A chunk of the tile map arrived in memory: tell the views."""
+        tiles = self._tile_map.makeChunkSummary(chunk_coord)
+        self.post(events.TilesChangedEvent(self.area_id, tiles, None))
+    def flushTileChanges(self):
+        """Tell everyone about the tiles that changed since the last time."""
+        changes = self._tile_map.takeChanges()
+        if changes is None:
+            return
+        # The entities standing on a tile that changed must feel the new
+        # material right away, not when they move to the next tile.
+        for coord, unused in changes.iteritems():
+            for entity in self.entity_map.getNear(geometry.Vector(coord), 1):
+                if tileCoordAt(entity.body.pos) == coord:
+                    self.affectEntityWithTile(entity)
+        if self.parallel_physics is not None:
+            self.parallel_physics.addTileChanges(changes)
+        self.post(events.TilesChangedEvent(self.area_id, None, changes))
+    def preloadTiles(self):
+        """Bring in memory the chunks of tiles around the interest points.
+
+        If the tile map cannot hold them all, it is allowed to: otherwise it
+        would evict some to load the others, and generate them again at the
+        next update.
+
+        """
+        points = self.getInterestPoints()
+        tile_map = self._tile_map
+        if tile_map.max_chunks is not None and tile_map.generator is not None:
+            needed = (len(points) *
+                      tile_map.countChunksAround(self.PRELOAD_RADIUS))
+            if tile_map.max_chunks < needed:
+                LOGGER.warning("Area %i: max_chunks raised from %i to %i "
+                               "to hold the chunks to preload.",
+                               self.area_id, tile_map.max_chunks, needed)
+                tile_map.max_chunks = needed
+        for point in points:
+            tile_map.loadAround(point, self.PRELOAD_RADIUS)
+
     def findBiggestEntityRadius(self):
         """How far we have to look when testing collisions between entities."""
         radius = 0
@@ -114,8 +239,12 @@ class AreaModel(SingleListener):
         self.entities[entity_id] = entity
         self.affectEntityWithTile(entity)
         self.entity_map.add(entity)
+        if not entity.body.solid:
+            self._sensors[entity_id] = entity
         if entity.body.radius > self._biggest_entity_radius:
             self._biggest_entity_radius = entity.body.radius
+        self._ai_buckets[entity_id % self.AI_BUCKETS].add(entity_id)
+        self.perception.addEntity(entity)
         self.post(events.EntityEnteredAreaEvent(entity.makeSummary()))
     def removeEntity(self, entity):
         """Remove the entity from the area."""
@@ -125,6 +254,14 @@ class AreaModel(SingleListener):
         except KeyError:
             raise NotInAreaError()
         self.entity_map.remove(entity)
+        self._sensors.pop(entity_id, None)
+        self._contacts.pop(entity_id, None)
+        self._tiers.pop(entity_id, None)
+        self._lod_time.pop(entity_id, None)
+        self._ai_buckets[entity_id % self.AI_BUCKETS].discard(entity_id)
+        # It stays in the queue, it's skipped when its turn comes.
+        self._ai_queued.discard(entity_id)
+        self.perception.removeEntity(entity)
         entity.area = None
         self.findBiggestEntityRadius()
         self.post(events.EntityLeftAreaEvent(entity_id, self.area_id))
@@ -135,11 +272,10 @@ class AreaModel(SingleListener):
         """Apply the effect of tile on which the entity stands."""
         coord = tileCoordAt(entity.body.pos)
         try:
-            tile_ = self.tile_map.tiles[coord]
+            nature = self.tile_map.getNature(coord)
         except KeyError:
             friction = 0
         else:
-            nature = tile_.nature
             material = tile.MATERIALS[nature]
             friction = material.friction
         entity.friction_force.mu = friction
@@ -156,49 +292,62 @@ class AreaModel(SingleListener):
         x_min, x_max, y_min, y_max = tileCoordsAround(entity.body.pos,
                                                       entity.body.radius)
         coords = set()
-        tiles = self.tile_map.tiles
+        is_solid_at = self.tile_map.isSolidAt
         for tile_x in range(x_min, x_max + 1):
             for tile_y in range(y_min, y_max + 1):
-                try:
-                    # Underscore because module with the name "tile".
-                    tile_ = tiles[(tile_x, tile_y)]
-                except KeyError:
-                    pass
-                else:
-                    if tile_.isSolid():
-                        coords.add((tile_x, tile_y))
+                if is_solid_at((tile_x, tile_y)):
+                    coords.add((tile_x, tile_y))
         return coords
 
+    def makeTileBody(self, coord):
+        """Return a physical body for the tile at the given coordinates."""
+        tile_nature = self.tile_map.getNature(coord)
+        material = tile.MATERIALS[tile_nature]
+        return physics.RectangularBody(float('inf'),
+                                       geometry.Vector(coord),
+                                       True,
+                                       material,
+                                       1., 1.)
+
     def detectCollisionsWithTiles(self, collider):
         """Return a set of Collision objects."""
-        coords = self.pruneTiles(collider)
         collisions = set()
+        if not collider.body.mask & physics.LAYER_TERRAIN:
+            # Ghosts walk through walls.
+            return collisions
+        coords = self.pruneTiles(collider)
         for coord in coords:
-            tile_nature = self.tile_map.tiles[coord].nature
-            material = tile.MATERIALS[tile_nature]
-            tile_body = physics.RectangularBody(float('inf'),
-                                            geometry.Vector(coord),
-                                            True,
-                                            material,
-                                            1., 1.)
+            tile_body = self.makeTileBody(coord)
             collision = tile_body.collidesCircle(collider.body)
             if collision:
+                collision.contact_key = coord
                 collisions.add(collision)
         return collisions
 
     def detectCollisionsWithEntities(self, collider):
         """Return a set of Collision objects."""
         collisions = set()
-        entities = self.entity_map.getNear(collider.body.pos,
-                                           collider.body.radius +
+        body = collider.body
+        layer = body.layer
+        mask = body.mask
+        entities = self.entity_map.getNear(body.pos,
+                                           body.radius +
                                            self._biggest_entity_radius)
         for collidee in entities:
-            if not collidee.exists:
+            other = collidee.body
+            if not (collidee.exists and other.solid):
+                # Nobody bumps into non-solid entities, they are taken care of
+                # by the triggers.
+                continue
+            # Same as physics.interact, inlined because this is the hottest
+            # loop of the engine.
+            if not (layer & other.mask and other.layer & mask):
                 continue
             if collider is not collidee:
-                collision = collidee.body.collidesCircle(collider.body)
+                collision = other.collidesCircle(body)
                 if collision is not None:
                     collision.entity = collidee
+                    collision.contact_key = collidee.entity_id
                     collisions.add(collision)
         return collisions
 
@@ -217,10 +366,9 @@ class AreaModel(SingleListener):
         """
         collidees = []
         if not entity.body.solid:
-            # Non solid objects cannot collide anything. BUT they can be
-            # collided with.  For example: an item to be picked on the floor.
-            # Since the item is not supposed to move we don't care what it
-            # collides, however we want other creatures to pick it up.
+            # Non solid objects cannot collide anything, and nothing collides
+            # with them.  They are sensors: an item to be picked up on the
+            # floor for example.  See processTriggers.
             return False
         collisions = self.detectCollisionsWithTiles(entity)
         collisions |= self.detectCollisionsWithEntities(entity)
@@ -228,37 +376,122 @@ class AreaModel(SingleListener):
         if collisions:
             # Sort the collision by distance.  We reverse the order to make the
             # popping of the closest collision easier.
+            # Collisions are in a set: ties are broken by contact key so that
+            # the order does not depend on where they are in memory.
             collisions = sorted(collisions,
-                                key=attrgetter('distance'),
+                                key=attrgetter('distance', 'contact_key'),
                                 reverse=True)
             while collisions:
                 collision = collisions.pop()
                 if collision.entity:
                     collidees.append(collision.entity)
-                if collision.collidee.solid:
-                    # Change the position of the collider only so that it
-                    # does not collide any more.
-                    collision.correctPosition()
-                    # Since the position changed, we must update that.
-                    self.entity_map.move(entity)
-                    # And here we apply the elastic collision formula, which
-                    # changes the velocities of the two bodies.
-                    collision.correctVelocity()
-                    # With all that, the position of the collidee did not
-                    # change.  But it may change in the next time step due to
-                    # mere integration since its velocity changed.
-                    result = True
-                    break # Stop at the first collision.
+                # All the collidees are solid: tiles are only considered when
+                # high, and non-solid entities are skipped by the detection.
+                #
+                # Change the position of the collider only so that it does
+                # not collide any more.
+                collision.correctPosition()
+                # Since the position changed, we must update that.
+                self.entity_map.move(entity)
+                # And here we apply the elastic collision formula, which
+                # changes the velocities of the two bodies.
+                collision.correctVelocity()
+                # With all that, the position of the collidee did not change.
+                # But it may change in the next time step due to mere
+                # integration since its velocity changed.
+                result = True
+                # Chances are we'll be touching the same thing next time.
+                self._contacts.setdefault(entity.entity_id,
+                                          {})[collision.contact_key] = 0
+                break # Stop at the first collision.
         # And this is to stop sending EntityMovedEvent all over the place when
         # the speed is measured in micrometer per century.
         if entity.body.vel.norm() < 0.01:
             entity.body.vel.zero()
+        self.reportCollisions(entity, collidees)
+        return result
+
+    def reportCollisions(self, entity, collidees):
+        """The collidees react to the entity bumping into them.
+
+        Once per physics update: an entity pushing against another one finds
+        it again at every piece of its time step, and in warmStart.
+
+        """
+        reported = self._reported
         for collidee in collidees:
+            pair = (entity.entity_id, collidee.entity_id)
+            if pair in reported:
+                continue
             if entity.exists and collidee.exists:
+                reported.add(pair)
                 collidee.reactToCollision(entity)
-        return result
 
-    def moveEntityByPhysics(self, entity, timestep):
+    def detectContact(self, entity, key):
+        """Return the Collision between the entity and a known contact.
+
+        `key` is the contact key of the collidee: an entity_id or a tile
+        coordinate.  Return None if they do not collide anymore, or if the
+        collidee is not there anymore.
+
+        """
+        body = entity.body
+        if isinstance(key, tuple):
+            if not self.tile_map.isSolidAt(key):
+                return None
+            collision = self.makeTileBody(key).collidesCircle(body)
+        else:
+            collidee = self.entities.get(key)
+            if collidee is None or not collidee.exists:
+                return None
+            other = collidee.body
+            if not (other.solid and physics.interact(body, other)):
+                return None
+            collision = other.collidesCircle(body)
+            if collision is not None:
+                collision.entity = collidee
+        if collision is not None:
+            collision.contact_key = key
+        return collision
+
+    def warmStart(self, entity):
+        """Resolve first the contacts the entity had at the last update.
+
+        An entity walking against a wall, or a fox pinned to the bunny, keeps
+        touching the same thing at every update.  Instead of finding that
+        collision again among everything that's around, we test these known
+        contacts directly and correct them right away.  Most of the time,
+        when processCollisions runs after that there's nothing left to do.
+        Either way, the collidee reacts once per update, see
+        reportCollisions.
+
+        Contacts that have not been touching for a few updates are forgotten.
+
+        """
+        entity_id = entity.entity_id
+        contacts = self._contacts.get(entity_id)
+        if not contacts:
+            return
+        collidees = []
+        for key, misses in contacts.items():
+            collision = self.detectContact(entity, key)
+            if collision is None:
+                if misses < self.CONTACT_PATIENCE:
+                    contacts[key] = misses + 1
+                else:
+                    del contacts[key]
+                continue
+            contacts[key] = 0
+            collision.correctPosition()
+            collision.correctVelocity()
+            if collision.entity:
+                collidees.append(collision.entity)
+        if not contacts:
+            del self._contacts[entity_id]
+        self.entity_map.move(entity)
+        self.reportCollisions(entity, collidees)
+
+    def moveEntityByPhysics(self, entity, timestep, integrator=physics.rk4):
         """Run the physics (integration + collisions) on the given entity.
 
         Integration.
@@ -321,7 +554,7 @@ class AreaModel(SingleListener):
         # go.  body.integrate does not really modify the position and velocity
         # of the body; it simply returns the position and velocity that the
         # body would have after that integration.
-        new_pos, new_vel = body.integrate(timestep)
+        new_pos, new_vel = body.integrate(timestep, integrator)
         if body.pos == new_pos and body.vel == new_vel:
             # Not only the entity did not move, it does not change speed
             # either. Then we are done.  We return False to say that we are not
@@ -340,7 +573,8 @@ class AreaModel(SingleListener):
         if distance > body.radius:
             iter_nb = int(math.ceil(distance / body.radius))
             for unused in xrange(iter_nb):
-                stuck = self.moveEntityByPhysics(entity, timestep / iter_nb)
+                stuck = self.moveEntityByPhysics(entity, timestep / iter_nb,
+                                                 integrator)
                 if stuck:
                     # No need to process the other pieces of the time step: we
                     # are stuck here.
@@ -357,7 +591,8 @@ class AreaModel(SingleListener):
         body.pos = new_pos
         body.vel = new_vel
         self.entity_map.move(entity)
-        attempt = 5
+        self.warmStart(entity)
+        attempt = self.COLLISION_ATTEMPTS
         collided = True # Dummy value to start the loop.
         while attempt and collided:
             collided = self.processCollisions(entity)
@@ -371,22 +606,251 @@ class AreaModel(SingleListener):
             stuck = True
         return stuck
 
-    def runPhysics(self, timestep):
-        """Uses physics to move all the entities."""
-        for entity in self.entities.itervalues():
+    def processTriggers(self):
+        """Find who started overlapping the sensors since the last update.
+
+        Sensors are the non-solid entities.  Each of them looks around itself
+        in the entity map for entities overlapping it.  For every pair that
+        did not overlap at the previous update, the sensor reacts and a
+        TriggerEnteredEvent is posted.
+
+        This runs once per physics update, after everybody moved.  So it
+        doesn't matter in which order the entities moved, nor which collision
+        they processed first.
+
+        """
+        overlaps = set()
+        entered = []
+        biggest_radius = self._biggest_entity_radius
+        sensors = self._sensors.items()
+        if self.deterministic:
+            sensors.sort()
+        for sensor_id, sensor in sensors:
+            if not sensor.exists:
+                continue
+            body = sensor.body
+            near = self.entity_map.getNear(body.pos,
+                                           body.radius + biggest_radius)
+            for entity in near:
+                if entity is sensor or not entity.exists:
+                    continue
+                if not physics.interact(body, entity.body):
+                    continue
+                if body.overlapsCircle(entity.body):
+                    pair = (sensor_id, entity.entity_id)
+                    overlaps.add(pair)
+                    if pair not in self._overlaps:
+                        entered.append((sensor, entity))
+        self._overlaps = overlaps
+        # The reactions come last: they can destroy entities, and we don't
+        # want that to happen while we're looking around.
+        for sensor, entity in entered:
+            if sensor.exists and entity.exists:
+                self.post(events.TriggerEnteredEvent(sensor.entity_id,
+                                                     entity.entity_id))
+                sensor.reactToTrigger(entity)
+
+    #---------------------------  Level of detail.  ---------------------------
+
+    def setInterestPoint(self, key, pos):
+        """Entities around `pos` must be simulated with the best precision.
+
+        `key` is whatever you want, it is used to move or remove the point.
+
+        """
+        self._interest_points[key] = pos
+    def removeInterestPoint(self, key):
+        """Forget about the interest point."""
+        del self._interest_points[key]
+    def getInterestPoints(self):
+        """Return the list of the positions of the interest points."""
+        points = self._interest_points.values()
+        controlled = self.entities.get(self._controlled_entity_id)
+        if controlled is not None:
+            points.append(controlled.body.pos)
+        return points
+    def findTier(self, entity, points):
+        """Return the index of the tier the entity belongs to."""
+        if not points:
+            return 0
+        pos = entity.body.pos
+        distance_sq = min(pos.distsq(point) for point in points)
+        for index, (distance_max, unused, unused) in enumerate(self.LOD_TIERS):
+            if distance_max is None or distance_sq <= distance_max ** 2:
+                return index
+        # Only happens if someone forgot to leave the last tier unlimited.
+        return len(self.LOD_TIERS) - 1
+    def scheduleEntities(self, timestep):
+        """Return the entities to simulate during this update.
+
+        It is a list of (entity, timestep, integrator) tuples.  The timestep is
+        the time accumulated by the entity since it was last simulated.
+
+        Entities of the same tier are not all simulated during the same
+        update: they are spread using their entity_id.  When an entity moves
+        to a better tier it is simulated right away with the time it
+        accumulated, so that it catches up before anyone can see it.
+
+        """
+        self._physics_updates += 1
+        points = self.getInterestPoints()
+        scheduled = []
+        entities = self.entities.items()
+        if self.deterministic:
+            entities.sort()
+        for entity_id, entity in entities:
             if not entity.exists:
                 continue
-            before = entity.body.pos
-            self.moveEntityByPhysics(entity, timestep)
-            after = entity.body.pos
-            if before != after:
-                entity.is_moving = True
-                self.post(events.EntityMovedEvent(entity.entity_id, after))
-                self.affectEntityWithTile(entity)
-            if entity.is_moving:
-                if entity.body.vel == geometry.Vector(0, 0):
-                    entity.is_moving = False
-                    self.post(events.EntityStoppedEvent(entity.entity_id))
+            tier = self.findTier(entity, points)
+            old_tier = self._tiers.get(entity_id, tier)
+            self._tiers[entity_id] = tier
+            unused, period, integrator = self.LOD_TIERS[tier]
+            accumulated = self._lod_time.get(entity_id, 0) + timestep
+            if (tier < old_tier or
+                (self._physics_updates + entity_id) % period == 0):
+                self._lod_time[entity_id] = 0
+                scheduled.append((entity, accumulated, integrator))
+            else:
+                self._lod_time[entity_id] = accumulated
+        return scheduled
+
+    def runPerception(self):
+        """Have the entities of the bucket of this update perceive.
+
+        They go after those that did not fit in the budget of the previous
+        updates.  At least one entity perceives per update, however slow it
+        is, so that the queue always moves.
+
+        """
+        bucket = self._ai_buckets[self._physics_updates % self.AI_BUCKETS]
+        if self.deterministic:
+            bucket = sorted(bucket)
+        queue = self._ai_queue
+        queued = self._ai_queued
+        for entity_id in bucket:
+            if entity_id not in queued:
+                queued.add(entity_id)
+                queue.append(entity_id)
+        budget = None if self.deterministic else self.AI_BUDGET
+        start = wallClock()
+        perceived = 0
+        self.perception.startPass()
+        while queue:
+            if (budget is not None and perceived and
+                wallClock() - start > budget):
+                break
+            entity_id = queue.popleft()
+            if entity_id not in queued:
+                continue # Left the area while waiting.
+            queued.discard(entity_id)
+            entity = self.entities[entity_id]
+            if entity.exists:
+                entity.perceive()
+                perceived += 1
+        self.perception.endPass()
+    def reportMove(self, entity, before):
+        """Tell the world the entity moved from `before`, or stopped."""
+        after = entity.body.pos
+        if before != after and before.dist(after) < self.MOVE_EPSILON:
+            # Something pinned against a wall gets pushed in and out of it at
+            # every update, and never ends up exactly where it was because of
+            # rounding errors.  That's not a move.
+            entity.body.pos = after = before
+            self.entity_map.move(entity)
+        if before != after:
+            entity.is_moving = True
+            self.post(events.EntityMovedEvent(entity.entity_id, after))
+            self.affectEntityWithTile(entity)
+        if entity.is_moving:
+            if entity.body.vel == geometry.Vector(0, 0):
+                entity.is_moving = False
+                self.post(events.EntityStoppedEvent(entity.entity_id))
+
+    def runPhysics(self, timestep):
+        """Uses physics to move all the entities.
+
+        The entities also think here, just before moving, since it is what
+        decides where they want to go.
+
+        """
+        # Between two updates is a good time to re-bucket the entity map if
+        # the crowd has changed a lot, nobody is iterating over it.  Only if
+        # the map has auto_scale, see EntityMap.
+        if self.entity_map.retune():
+            LOGGER.debug("Area %i: entity map scale changed to %r.",
+                         self.area_id, self.entity_map.scale)
+        self.flushTileChanges()
+        if self.chunk_prefetcher is not None:
+            self.chunk_prefetcher.handOver()
+        self.preloadTiles()
+        scheduled = self.scheduleEntities(timestep)
+        for entity, entity_timestep, unused in scheduled:
+            if entity.exists:
+                entity.runAI(entity_timestep)
+        self.runPerception()
+        self._reported = set()
+        parallel = self.parallel_physics
+        if parallel is not None and parallel.isWorthIt(scheduled):
+            befores = [(entity, entity.body.pos)
+                       for entity, unused, unused in scheduled]
+            parallel.moveEntities(scheduled)
+            for entity, before in befores:
+                if entity.exists:
+                    self.reportMove(entity, before)
+        else:
+            for entity, entity_timestep, integrator in scheduled:
+                if not entity.exists:
+                    continue
+                before = entity.body.pos
+                self.moveEntityByPhysics(entity, entity_timestep, integrator)
+                self.reportMove(entity, before)
+        self.processTriggers()
+
+    #----------------------------  Area of effect.  ---------------------------
+
+    def applyRadialImpulse(self, center, radius, strength, falloff=.5,
+                           exclude=(), attacker=None, hit_impulse=None):
+        """Push the entities around `center` away from it, all at once.
+
+        The existing solid entities closer than `radius` to the center get an
+        impulse of strength / (mass * distance ** falloff) away from it.  The
+        entity right at the center is not pushed: there is no away.  Those
+        whose entity_id is in `exclude` are spared.
+
+        Return the list of (entity_id, impulse) of those that were pushed,
+        in the order of their entity_id if the area is deterministic.
+
+        With a `hit_impulse`, those pushed at least that hard are hit by the
+        `attacker`: a single AreaAttackEvent tells them all.
+
+        """
+        center_x = center.x
+        center_y = center.y
+        radius_sq = radius * radius
+        pushed = []
+        hits = []
+        for entity in self.entity_map.getNear(center, radius):
+            body = entity.body
+            if (not entity.exists or not body.solid or
+                entity.entity_id in exclude):
+                continue
+            pos = body.pos
+            d_x = pos.x - center_x
+            d_y = pos.y - center_y
+            distance_sq = d_x * d_x + d_y * d_y
+            if distance_sq > radius_sq or distance_sq == 0:
+                continue
+            distance = math.sqrt(distance_sq)
+            impulse = strength * body.one_over_mass / distance ** falloff
+            # The direction is (d_x, d_y) / distance.
+            factor = impulse / distance
+            body.vel += geometry.Vector(d_x * factor, d_y * factor)
+            pushed.append((entity.entity_id, impulse))
+            if hit_impulse is not None and impulse >= hit_impulse:
+                hits.append(entity.entity_id)
+        if hits:
+            self.post(events.AreaAttackEvent(attacker, frozenset(hits)))
+        return pushed
 
 
     #--------------------------------  Events.  -------------------------------
@@ -430,3 +894,6 @@ class AreaModel(SingleListener):
     def onRunPhysicsEvent(self, event):
         """The main loop tells us to move our entities."""
         self.runPhysics(event.timestep)
+    def onControlEntityEvent(self, event):
+        """The player's entity is the most important interest point."""
+        self._controlled_entity_id = event.entity_id
@@ -0,0 +1,314 @@
+#! /usr/bin/python
+"""Save files of the areas: the chunks of tiles and the entities.
+
+An area file is a log: records are only ever appended to it.  A record is
+either the packed tiles of a chunk (see tile.TileChunk) or a pickled entity
+(pickled like when it goes to another process, see WorldModel.exportEntity).
+Saving a chunk again appends a new record.  The old one stays where it is and
+is simply forgotten.  What was written is never written over, so a reader
+never waits for a save, and a crash in the middle of a save only loses the
+record being written.  When there is too much garbage (see getGarbage),
+`compact` rewrites the file with only the live records.
+
+The index file goes next to it.  It says where the records are, with 21
+bytes per record, and it is appended to at the same time as the data.  The
+data file is memory-mapped.  Opening a world reads nothing, and the system
+pages the chunks in when the tile map asks for them.  The index is read the
+first time something is looked for.
+
+An AreaFile can be written by a thread while another one reads it (see
+autosave.Autosave): a lock keeps them from getting in each other's way.
+
+An AreaFile is a chunk store for a TileMap (see tile.MemoryChunkStore).
+Games keep them in directories.DIR_VAR_SAV.
+
+"""
+from __future__ import division
+import cPickle
+import mmap
+import os
+import struct
+import threading
+
+from errors import AreaFileError
+import tile
+
+MAGIC = 'IWAREA01'
+# Kinds of records.
+CHUNK = 'C'
+ENTITY = 'E'
+# Says that the entity is not in the area anymore.
+DELETED = 'D'
+# Kind, two integers (the chunk coordinates, or the entity_id and 0), length
+# of the data that follows.
+RECORD = struct.Struct('<ciiI')
+# Kind, the same two integers, offset of the data in the file, its length.
+INDEX_ENTRY = struct.Struct('<ciiQI')
+
+
+class AreaFile(object):
+    """Memory-mapped save file of an area.  See the module docstring.
+
+    The data goes in `path`, the index in `path` + '.idx'.  They are created
+    if they don't exist.
+
+    """
+    def __init__(self, path):
+        object.__init__(self)
+        self.path = path
+        self._index_path = path + '.idx'
+        self._data = None
+        self._index = None
+        self._map = None
+        # {(kind, a, b): (offset, length)} of the live records.  None until
+        # the index is read.
+        self._records = None
+        # Reentrant: compact reads while it holds it.
+        self._lock = threading.RLock()
+        # Bytes appended to the files since they were opened, for the stats.
+        self.bytes_written = 0
+        self._open()
+
+    def _open(self):
+        """Open the files, create them if needed, map the data."""
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as data:
+                data.write(MAGIC)
+            open(self._index_path, 'wb').close()
+        self._data = open(self.path, 'r+b')
+        if self._data.read(len(MAGIC)) != MAGIC:
+            self._data.close()
+            raise AreaFileError("%s is not an area file." % self.path)
+        self._data.seek(0, os.SEEK_END)
+        self._index = open(self._index_path, 'a+b')
+        self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        self._records = None
+    def _remap(self):
+        """Map the data again: it grew since."""
+        self._data.flush()
+        self._map.close()
+        self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+    def close(self):
+        """Close the files.  What was saved is on the disk."""
+        with self._lock:
+            self.flush()
+            self._map.close()
+            self._data.close()
+            self._index.close()
+    def flush(self):
+        """Give what was saved to the system.
+
+        There's no fsync: the system writes it when it wants, the game does
+        not wait for the disk.  See sync.
+
+        """
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+    def sync(self):
+        """Flush, and wait until what was saved is really on the disk.
+
+        That can take a while: don't call it from the game loop.
+
+        """
+        with self._lock:
+            self.flush()
+            os.fsync(self._data.fileno())
+            os.fsync(self._index.fileno())
+
+    def _remember(self, kind, a, b, offset, length):
+        """Update the live records with a new one."""
+        if kind == DELETED:
+            self._records.pop((ENTITY, a, b), None)
+        else:
+            self._records[(kind, a, b)] = (offset, length)
+    def _readIndex(self):
+        """Read the index, and index the records that it missed."""
+        self._records = {}
+        data_size = self._data.tell()
+        self._index.seek(0)
+        blob = self._index.read()
+        entry_size = INDEX_ENTRY.size
+        end = len(MAGIC)
+        valid = 0
+        while valid + entry_size <= len(blob):
+            kind, a, b, offset, length = INDEX_ENTRY.unpack_from(blob, valid)
+            if offset + length > data_size:
+                break
+            self._remember(kind, a, b, offset, length)
+            end = max(end, offset + length)
+            valid += entry_size
+        if valid != len(blob):
+            # We crashed while writing the index: what comes after the last
+            # good entry goes.  It will be rebuilt from the data.
+            self._index.truncate(valid)
+        self._index.seek(0, os.SEEK_END)
+        self._recover(end, data_size)
+    def _recover(self, offset, data_size):
+        """Index the records of the data file from `offset` to the end.
+
+        They are those that were written before a crash, when the index was
+        not.  A record that was not written completely is cut off.
+
+        """
+        if offset == data_size:
+            return
+        if data_size > len(self._map):
+            self._remap()
+        while offset + RECORD.size <= data_size:
+            kind, a, b, length = RECORD.unpack_from(self._map, offset)
+            start = offset + RECORD.size
+            if start + length > data_size:
+                break
+            self._index.write(INDEX_ENTRY.pack(kind, a, b, start, length))
+            self._remember(kind, a, b, start, length)
+            offset = start + length
+        if offset != data_size:
+            self._map.close()
+            self._data.truncate(offset)
+            self._data.seek(0, os.SEEK_END)
+            self._map = mmap.mmap(self._data.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+    def _append(self, kind, a, b, data):
+        """Write a record at the end, and index it."""
+        with self._lock:
+            if self._records is None:
+                self._readIndex()
+            offset = self._data.tell() + RECORD.size
+            self._data.write(RECORD.pack(kind, a, b, len(data)))
+            self._data.write(data)
+            self._index.write(INDEX_ENTRY.pack(kind, a, b, offset, len(data)))
+            self._remember(kind, a, b, offset, len(data))
+            self.bytes_written += RECORD.size + len(data) + INDEX_ENTRY.size
+    def _read(self, kind, a, b):
+        """Return the data of the live record, or None."""
+        with self._lock:
+            if self._records is None:
+                self._readIndex()
+            found = self._records.get((kind, a, b))
+            if found is None:
+                return None
+            offset, length = found
+            if offset + length > len(self._map):
+                self._remap()
+            return self._map[offset:offset + length]
+    def _getKeys(self, kind):
+        """Return the list of the (a, b) of the live records of that kind."""
+        with self._lock:
+            if self._records is None:
+                self._readIndex()
+            return [(a, b) for record_kind, a, b in self._records
+                    if record_kind == kind]
+
+    def __len__(self):
+        return len(self._getKeys(CHUNK))
+    def loadChunk(self, chunk_coord):
+        """Return the data saved for the chunk, or None."""
+        return self._read(CHUNK, chunk_coord[0], chunk_coord[1])
+    def hasChunk(self, chunk_coord):
+        """Was the chunk saved?  Only the index is looked at."""
+        with self._lock:
+            if self._records is None:
+                self._readIndex()
+            return (CHUNK, chunk_coord[0], chunk_coord[1]) in self._records
+    def saveChunk(self, chunk_coord, data):
+        """Append the data of the chunk."""
+        self._append(CHUNK, chunk_coord[0], chunk_coord[1], str(data))
+    def getChunkCoords(self):
+        """Return the list of the coordinates of the saved chunks."""
+        return self._getKeys(CHUNK)
+    def iterChunks(self):
+        """Iterate over the (chunk_coord, data) of the saved chunks."""
+        for chunk_coord in self._getKeys(CHUNK):
+            yield chunk_coord, self._read(CHUNK, chunk_coord[0],
+                                          chunk_coord[1])
+    def loadEntity(self, entity_id):
+        """Return the record saved for the entity, or None."""
+        return self._read(ENTITY, entity_id, 0)
+    def saveEntity(self, entity_id, record):
+        """Append the record of the entity, a string."""
+        self._append(ENTITY, entity_id, 0, record)
+    def deleteEntity(self, entity_id):
+        """The entity is not in the area anymore."""
+        self._append(DELETED, entity_id, 0, '')
+    def getEntityIds(self):
+        """Return the sorted list of the ids of the saved entities."""
+        return sorted(entity_id for entity_id, unused
+                      in self._getKeys(ENTITY))
+
+    def getGarbage(self):
+        """Return the fraction of the file taken by dead records."""
+        with self._lock:
+            if self._records is None:
+                self._readIndex()
+            total = self._data.tell() - len(MAGIC)
+            if not total:
+                return 0
+            live = sum(RECORD.size + length
+                       for unused, length in self._records.itervalues())
+        return 1 - live / total
+    def compact(self):
+        """Rewrite the files with only the live records."""
+        with self._lock:
+            self._compact()
+    def _compact(self):
+        """Body of compact, with the lock held."""
+        if self._records is None:
+            self._readIndex()
+        path = self.path + '.tmp'
+        for old in (path, path + '.idx'):
+            if os.path.exists(old):
+                os.remove(old)
+        compacted = AreaFile(path)
+        # Sorted: the chunks next to each other on the map end up next to
+        # each other in the file.
+        for (kind, a, b) in sorted(self._records):
+            compacted._append(kind, a, b, self._read(kind, a, b))
+        compacted.close()
+        self.close()
+        os.rename(path, self.path)
+        os.rename(path + '.idx', self._index_path)
+        self._open()
+
+
+def saveArea(area, area_file):
+    """Write the tiles of the area that changed, and its entities.
+
+    From now on, the file is where the tile map saves its chunks.
+
+    """
+    tile_map = area.tile_map
+    if tile_map.store is not area_file:
+        tile_map.setStore(area_file)
+    tile_map.flush()
+    saved = set()
+    for entity_id, entity in sorted(area.entities.items()):
+        if not entity.exists:
+            continue
+        record = cPickle.dumps(entity, cPickle.HIGHEST_PROTOCOL)
+        # The entities that did not change don't make garbage.
+        if area_file.loadEntity(entity_id) != record:
+            area_file.saveEntity(entity_id, record)
+        saved.add(entity_id)
+    for entity_id in area_file.getEntityIds():
+        if entity_id not in saved:
+            area_file.deleteEntity(entity_id)
+    area_file.flush()
+
+def loadArea(world, area_file, generator=None):
+    """Create an area in the world with what the file has, return it.
+
+    The chunks stay in the file until the tile map needs them.  Give the
+    generator if the area is infinite.
+
+    """
+    area = world.createArea()
+    area.tile_map = tile.TileMap(generator=generator, store=area_file)
+    for entity_id in area_file.getEntityIds():
+        entity = cPickle.loads(area_file.loadEntity(entity_id))
+        world.importEntity(entity, area.area_id)
+        # pylint: disable-msg=W0212
+        # Accessing a protected member: the world must never give that
+        # entity_id to another entity.
+        world._entity_id_max = max(world._entity_id_max, entity_id)
+    return area
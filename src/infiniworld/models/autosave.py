@@ -0,0 +1,237 @@
+#! /usr/bin/python
+"""Saving an area every now and then, without stopping the game.
+
+saveArea (see areafile) does everything in the game loop: it pickles all the
+entities, compares them with what the file has, writes, and the game hitches
+for as long as it takes.  The Autosave splits the work in two.
+
+Between two physics updates, the game loop only takes a snapshot of what
+changed since the last save: a copy of the bytes of the modified chunks, and
+the pickles of the entities that moved, appeared or went away.  That's the
+only moment where nothing moves, and it's short because only what changed is
+copied, and cPickle pickles an entity in about 50 microseconds.  The thread
+could pickle them itself, but then it would read entities that the game is
+changing at the same time.  A thread then writes the snapshot to the
+AreaFile and waits for the disk (fsync) while the game goes on.
+
+The Autosave is also the store of the tile map while it runs: the chunks the
+tile map evicts go through the same thread, in order, and the chunks that are
+not written yet are found in memory if the tile map asks for them again.
+
+"""
+import logging
+import cPickle
+import Queue
+import threading
+
+from infiniworld.evtman import SingleListener
+from infiniworld.time_ import wallClock
+import areafile
+
+LOGGER = logging.getLogger('world')
+# Kind of the item that ends a save: the thread syncs the file.
+SYNC = 'S'
+
+
+class Autosave(SingleListener):
+    """Saves what changed in an area to an AreaFile, every `period` seconds.
+
+    The seconds are those of the game, counted with the RunPhysicsEvents.
+    Creating it makes it the store of the tile map of the area, closing it
+    saves one last time and gives the tile map to the file.  The file stays
+    open: it belongs to whoever gave it.
+
+    The entities that moved, entered or left the area are saved.  Those that
+    change in other ways (health, inventory...) must be marked with
+    markEntity, or they will only be saved the next time they move.
+
+    """
+    # Seconds of game between two saves.
+    PERIOD = 30
+    def __init__(self, event_manager, area, area_file, period=None):
+        SingleListener.__init__(self, event_manager)
+        self._area = area
+        self._file = area_file
+        if period is None:
+            period = self.PERIOD
+        self.period = period
+        self._elapsed = 0
+        # (kind, key, data) for the thread, with the kinds of areafile, and
+        # SYNC.  None to stop.
+        self._queue = Queue.Queue()
+        # {chunk_coord: data} of the chunks that the thread did not write
+        # yet.  Shared with the thread.
+        self._lock = threading.Lock()
+        self._pending = {}
+        # The entities to save the next time, and those that are in the file.
+        self._dirty = set(area.entities)
+        self._saved = set(area_file.getEntityIds())
+        self._dirty.update(self._saved)
+        # Statistics, see getStats.
+        self._saves = 0
+        self._last_pause = 0
+        self._max_pause = 0
+        self._last_write_time = 0
+        self._chunks = 0
+        self._entities = 0
+        self._bytes_before = area_file.bytes_written
+        self._thread = threading.Thread(target=self._work, name='Autosave')
+        self._thread.daemon = True
+        self._thread.start()
+        tile_map = area.tile_map
+        if tile_map.store is area_file:
+            # Nothing to copy.
+            tile_map.store = self
+        else:
+            tile_map.setStore(self)
+
+    def _work(self):
+        """Body of the thread: write what is queued, until None."""
+        area_file = self._file
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            kind, key, data = item
+            # pylint: disable-msg=W0703
+            # Catching all the exceptions: the thread must go on, the next
+            # save may work.
+            try:
+                if kind == areafile.CHUNK:
+                    area_file.saveChunk(key, data)
+                    with self._lock:
+                        # Unless it was saved again since.
+                        if self._pending.get(key) is data:
+                            del self._pending[key]
+                elif kind == areafile.ENTITY:
+                    area_file.saveEntity(key, data)
+                elif kind == areafile.DELETED:
+                    area_file.deleteEntity(key)
+                else:
+                    area_file.sync()
+                    # The key of a SYNC is when the snapshot was taken.
+                    self._last_write_time = wallClock() - key
+            except Exception:
+                LOGGER.exception("Area %i: could not autosave %r %r.",
+                                 self._area.area_id, kind, key)
+            # pylint: enable-msg=W0703
+            self._queue.task_done()
+
+    def __len__(self):
+        return len(self.getChunkCoords())
+    def loadChunk(self, chunk_coord):
+        """Return the data saved for the chunk, or None."""
+        with self._lock:
+            data = self._pending.get(chunk_coord)
+        if data is None:
+            data = self._file.loadChunk(chunk_coord)
+        return data
+    def hasChunk(self, chunk_coord):
+        """Was the chunk saved, or is it waiting to be?"""
+        # No lock: a membership test of a dictionary is atomic, and a chunk
+        # leaves _pending after it is in the file.
+        return chunk_coord in self._pending or self._file.hasChunk(chunk_coord)
+    def saveChunk(self, chunk_coord, data):
+        """Have the thread append the data of the chunk to the file."""
+        data = str(data)
+        with self._lock:
+            self._pending[chunk_coord] = data
+        self._queue.put((areafile.CHUNK, chunk_coord, data))
+        self._chunks += 1
+    def getChunkCoords(self):
+        """Return the list of the coordinates of the saved chunks."""
+        with self._lock:
+            chunk_coords = set(self._pending)
+        chunk_coords.update(self._file.getChunkCoords())
+        return list(chunk_coords)
+    def iterChunks(self):
+        """Iterate over the (chunk_coord, data) of the saved chunks."""
+        for chunk_coord in self.getChunkCoords():
+            yield chunk_coord, self.loadChunk(chunk_coord)
+
+    def markEntity(self, entity_id):
+        """The entity changed: save it the next time."""
+        self._dirty.add(entity_id)
+    def save(self):
+        """Take a snapshot of what changed and give it to the thread."""
+        area = self._area
+        start = wallClock()
+        # The modified chunks come back through saveChunk.
+        area.tile_map.flush()
+        for entity_id in sorted(self._dirty):
+            entity = area.entities.get(entity_id)
+            if entity is not None and entity.exists:
+                record = cPickle.dumps(entity, cPickle.HIGHEST_PROTOCOL)
+                self._queue.put((areafile.ENTITY, entity_id, record))
+                self._saved.add(entity_id)
+                self._entities += 1
+            elif entity_id in self._saved:
+                self._queue.put((areafile.DELETED, entity_id, None))
+                self._saved.discard(entity_id)
+        self._dirty.clear()
+        self._queue.put((SYNC, start, None))
+        self._last_pause = wallClock() - start
+        self._max_pause = max(self._max_pause, self._last_pause)
+        self._saves += 1
+    def waitForThread(self):
+        """Return when everything that was saved is on the disk."""
+        self._queue.join()
+    def getStats(self):
+        """Return a dictionary with the statistics of the autosave.
+
+        * saves: how many snapshots were taken,
+        * last_pause, max_pause: how long the game loop waited for them, in
+          seconds,
+        * last_write_time: how long it took the thread to write the last
+          complete save, fsync included, in seconds,
+        * chunks, entities: how many were written,
+        * bytes_written: to the file, index included,
+        * backlog: records waiting for the thread.
+
+        """
+        return {'saves': self._saves,
+                'last_pause': self._last_pause,
+                'max_pause': self._max_pause,
+                'last_write_time': self._last_write_time,
+                'chunks': self._chunks,
+                'entities': self._entities,
+                'bytes_written': self._file.bytes_written - self._bytes_before,
+                'backlog': self._queue.qsize()}
+    def close(self):
+        """Save one last time, stop the thread, detach from the tile map."""
+        self.save()
+        self._queue.put(None)
+        self._thread.join()
+        self.unregister()
+        self._area.tile_map.store = self._file
+        LOGGER.debug("Area %i: autosave stats %r.", self._area.area_id,
+                     self.getStats())
+
+    def onRunPhysicsEvent(self, event):
+        """Count the time, save when it's time."""
+        self._elapsed += event.timestep
+        if self._elapsed >= self.period:
+            self._elapsed -= self.period
+            self.save()
+    def onEntityMovedEvent(self, event):
+        """Save the entity the next time, it moved."""
+        if event.entity_id in self._area.entities:
+            self._dirty.add(event.entity_id)
+    def onEntityStoppedEvent(self, event):
+        """Save the entity the next time, it stopped somewhere."""
+        if event.entity_id in self._area.entities:
+            self._dirty.add(event.entity_id)
+    def onEntityEnteredAreaEvent(self, event):
+        """Save the entity the next time, it's new here."""
+        summary = event.entity_summary
+        if summary['area_id'] == self._area.area_id:
+            self._dirty.add(summary['entity_id'])
+    def onEntityLeftAreaEvent(self, event):
+        """Delete the entity from the file the next time."""
+        if event.area_id == self._area.area_id:
+            self._dirty.add(event.entity_id)
+    def onEntityDestroyedEvent(self, event):
+        """Delete the entity from the file the next time."""
+        if event.entity_id in self._saved:
+            self._dirty.add(event.entity_id)
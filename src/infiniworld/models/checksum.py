@@ -0,0 +1,54 @@
+#! /usr/bin/python
+"""Hashes of the simulation state, to check that two runs are identical.
+
+Lockstep networking and replays rely on the simulation being deterministic
+(see WorldModel).  When it's not, the sooner we notice the better: record
+the hash of the state at every physics update on both sides, and compare.
+
+The hash is made from a world Snapshot, so it covers everything a snapshot
+saves.
+
+"""
+import hashlib
+
+from infiniworld.evtman import SingleListener
+from snapshot import takeWorldSnapshot
+
+def hashWorld(world, extras=()):
+    """Return a hexadecimal digest of the state of the world."""
+    snapshot = takeWorldSnapshot(world, extras)
+    digest = hashlib.md5()
+    digest.update(snapshot._entity_ids.tostring())
+    digest.update(repr(snapshot._area_ids))
+    digest.update(snapshot._values.tostring())
+    digest.update(snapshot._extra_values.tostring())
+    return digest.hexdigest()
+
+def findDivergence(hashes1, hashes2):
+    """Return the index of the first update where the hashes differ.
+
+    Return None if they are the same for as long as both lists go.
+
+    """
+    for index, (hash1, hash2) in enumerate(zip(hashes1, hashes2)):
+        if hash1 != hash2:
+            return index
+    return None
+
+
+class StateHashRecorder(SingleListener):
+    """Records the hash of the world at each physics update.
+
+    With an ordered event manager, create it after the world: it then
+    receives the RunPhysicsEvent after the areas, and hashes the state they
+    leave at the end of each update.
+
+    """
+    def __init__(self, event_manager, world, extras=()):
+        SingleListener.__init__(self, event_manager)
+        self._world = world
+        self._extras = extras
+        self.hashes = []
+    def onRunPhysicsEvent(self, unused):
+        """Hash after each update."""
+        self.hashes.append(hashWorld(self._world, self._extras))
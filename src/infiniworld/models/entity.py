@@ -27,8 +27,38 @@ class EntityModel(SingleListener):
     BODY_RADIUS = 0.5 # m.
     WALK_STRENGTH = 0 # N.
     SOLID = True
+    # See physics.interact.
+    COLLISION_LAYER = physics.LAYER_DEFAULT
+    COLLISION_MASK = physics.LAYER_ALL
+    # Attributes holding numbers that a snapshot must save.  See snapshot.py.
+    SNAPSHOT_FIELDS = ('_age', 'exists', 'is_moving')
+    # Keep the dead ones to reuse them, see WorldModel.createEntity.  Only
+    # for classes whose reset puts everything back as new.
+    POOLED = False
     def __init__(self, event_manager, entity_id):
         SingleListener.__init__(self, event_manager)
+        # Physics.
+        self.body = physics.CircularBody(self.BODY_MASS,
+                                         geometry.Vector(),
+                                         self.SOLID,
+                                         materials.MATERIAL_FLESH,
+                                         self.BODY_RADIUS,
+                                         self.COLLISION_LAYER,
+                                         self.COLLISION_MASK)
+        self._walk_force = physics.ConstantForce(geometry.Vector())
+        self.friction_force = physics.KineticFrictionForce(0)
+        self.body.forces.append(self._walk_force)
+        self.body.forces.append(self.friction_force)
+        self.reset(entity_id)
+
+    def reset(self, entity_id):
+        """Make the entity brand new, with that entity_id.
+
+        The constructor calls it, and so does the WorldModel when it reuses a
+        dead entity.  Subclasses set their own attributes here, not in their
+        constructor, and call this one first.
+
+        """
         self.entity_id = entity_id
         self._area = None
         self._age = 0
@@ -43,22 +73,29 @@ class EntityModel(SingleListener):
         # engine, but now we must take care that it ignores every entity that
         # does not exist.
         self.exists = True
-        # Physics.
-        self.body = physics.CircularBody(self.BODY_MASS,
-                                         geometry.Vector(),
-                                         self.SOLID,
-                                         materials.MATERIAL_FLESH,
-                                         self.BODY_RADIUS)
-        self._walk_force = physics.ConstantForce(geometry.Vector())
-        self.friction_force = physics.KineticFrictionForce(0)
-        self.body.forces.add(self._walk_force)
-        self.body.forces.add(self.friction_force)
+        self.body.pos = geometry.Vector()
+        self.body.vel = geometry.Vector()
+        self._walk_force.vector = geometry.Vector()
+        self.friction_force.mu = 0
         self._walk_strentgh = self.WALK_STRENGTH
         self.is_moving = False
         # Final stuff.
         self.post(events.EntityCreatedEvent(entity_id))
         LOGGER.debug("Entity %i created.", entity_id)
 
+    def __getstate__(self):
+        """Pickling support.
+
+        Entities can travel to other processes, see WorldModel.exportEntity.
+        They travel alone: neither their area nor their event manager come
+        along.
+
+        """
+        state = self.__dict__.copy()
+        state['_area'] = None
+        state['_event_manager'] = None
+        return state
+
     def _getArea(self):
         """Return the AreaModel containing this EntityModel."""
         if self._area is None:
@@ -89,20 +126,48 @@ class EntityModel(SingleListener):
                 "pos": self.body.pos.copy()}
 
     def runAI(self, timestep):
-        """Artificial intelligence."""
+        """Artificial intelligence, the cheap part that runs every update.
+
+        Keeping on walking...  Looking around is for perceive.
+
+        """
         # Obviously pretty stupid.
 
+    def perceive(self):
+        """Look around and decide what to do, the expensive part of the AI.
+
+        The AreaModel calls it every AI_BUCKETS updates, see runPerception.
+
+        """
+        # Don't see much either.
+
+    def getTime(self):
+        """Return the time of the game, in seconds, see WorldModel.timers."""
+        return self.area.world.timers.now
+
     def reactToCollision(self, collider):
         """The `collider` entity bumped into us."""
         # Don't care.
 
+    def reactToTrigger(self, entity):
+        """The `entity` started overlapping us.
+
+        Only non-solid entities are sensors, so only they get called.
+
+        """
+        # Don't care either.
+
     def onMoveEntityRequest(self, event):
         """Push the entity according to the player's wish."""
         if event.entity_id == self.entity_id:
             self._walk_force.vector = event.force * self._walk_strentgh
 
     def onRunPhysicsEvent(self, event):
-        """Time passes."""
+        """Time passes.
+
+        The AI is not run from here: the AreaModel decides when and how often
+        its entities think, see AreaModel.runPhysics.
+
+        """
         if self.area_id is not None:
             self._age += event.timestep
-            self.runAI(event.timestep)
@@ -3,6 +3,32 @@
 
 """
 from __future__ import division
+from operator import attrgetter
+
+# Chunk coordinates are packed into a single integer before being used as
+# dictionary keys.  A tuple has to be allocated (and hashed) every time we look
+# for a chunk, an integer is much cheaper.  The x coordinate goes in the high
+# bits and the y coordinate in the low bits, both shifted by KEY_BIAS so that
+# negative coordinates stay positive.  This works as long as the chunk
+# coordinates stay within +/- 2**27, which is a LOT of chunks.  I don't go
+# bigger than that because the keys must fit in a C long for xrange.
+KEY_BITS = 28
+KEY_BIAS = 1 << (KEY_BITS - 1)
+KEY_MASK = (1 << KEY_BITS) - 1
+
+def packChunkCoord(chunk_x, chunk_y):
+    """Return the integer key corresponding to the chunk coordinates."""
+    return ((chunk_x + KEY_BIAS) << KEY_BITS) | (chunk_y + KEY_BIAS)
+
+def unpackChunkKey(key):
+    """Return the chunk coordinates (x, y) packed in the integer key."""
+    return (key >> KEY_BITS) - KEY_BIAS, (key & KEY_MASK) - KEY_BIAS
+
+def chunkKeyAt(pos, scale):
+    """Same as chunkCoordAt, but returns a packed key instead of a tuple."""
+    chunk_x = int((.5 + pos.x / scale) // 1)
+    chunk_y = int((.5 + pos.y / scale) // 1)
+    return ((chunk_x + KEY_BIAS) << KEY_BITS) | (chunk_y + KEY_BIAS)
 
 def chunkCoordAt(pos, scale):
     """Return the coordinate of the chunk corresponding to the position.
@@ -59,18 +85,59 @@ class EntityMap(object):
     # Another thing I did for the performance is to introduce the scale factor
     # and the notion of chunk.  It's MUCH faster to check 4 chunks of 8*8 tiles
     # than 16*16 = 256 tiles (most of which don't contain any entity anyway).
-    def __init__(self):
+
+    # But there is no scale that is good for everything.  Big chunks are bad
+    # when the entities are packed (a horde of foxes): we return tons of
+    # entities that are nowhere near.  Small chunks are bad when the entities
+    # are sparse or when the queries are large (the psy-wave): we look into
+    # tons of empty chunks.  So the map measures what is asked of it and picks
+    # the scale that would have been the cheapest, see `retune`.
+
+    # Only when asked to, with auto_scale.  getNear returns whole chunks: more
+    # than what is within the radius, and how much more depends on the scale.
+    # Re-bucketing changes what every caller gets, so it's only for maps
+    # whose callers all check the true distance themselves.
+    SCALES = (1, 2, 4, 8, 16, 32)
+    DEFAULT_SCALE = 8
+    # Relative costs of looking into one chunk and of returning one entity.
+    # Returning an entity costs more since the caller usually runs a distance
+    # check or a collision test on it.  Measured with devtools.benchmap.
+    CHUNK_COST = 1.
+    CANDIDATE_COST = 2.
+    # Number of getNear calls to observe before considering a new scale.
+    RETUNE_QUERIES = 500
+    # Only change the scale if we expect it to cost less than that fraction of
+    # the current cost.  Re-bucketing is not free, and we don't want to
+    # oscillate between two scales that are just as good.
+    RETUNE_GAIN = .8
+    def __init__(self, scale=DEFAULT_SCALE, auto_scale=False, ordered=False):
         object.__init__(self)
         self._entities = {}
-        self._coords = {} #weakref.WeakKeyDictionary()
-        self.scale = 8
+        self._keys = {} #weakref.WeakKeyDictionary()
+        self.scale = scale
+        self.auto_scale = auto_scale
+        # The order of the entities in a set depends on where they are in
+        # memory, which changes from one run to the next.  When ordered,
+        # getNear returns a list sorted by entity_id instead.  For the
+        # deterministic mode, see WorldModel.
+        self.ordered = ordered
+        self.resetStats()
+    def __len__(self):
+        return len(self._keys)
     def getAt(self, coord):
-        """Return a set of the entities at the given chunk coordinates."""
+        """Return a set of the entities at the given chunk coordinates.
+
+        The set is empty if there is nobody there.  Don't modify it.
+
+        """
+        return self._entities.get(packChunkCoord(*coord), frozenset())
+    def _getOrCreate(self, key):
+        """Return the set of entities of a chunk, creating it if needed."""
         try:
-            entity_set = self._entities[coord]
+            entity_set = self._entities[key]
         except KeyError:
             entity_set = set() #weakref.WeakSet()
-            self._entities[coord] = entity_set
+            self._entities[key] = entity_set
         return entity_set
     def add(self, entity):
         """Add the entity to the tile corresponding to its position.
@@ -79,17 +146,19 @@ class EntityMap(object):
         use move.
 
         """
-        coord = chunkCoordAt(entity.body.pos, self.scale)
-        self.getAt(coord).add(entity)
-        self._coords[entity] = coord
+        key = chunkKeyAt(entity.body.pos, self.scale)
+        self._getOrCreate(key).add(entity)
+        self._keys[entity] = key
+    def getChunkCoord(self, entity):
+        """Return the coordinates of the chunk where the map has the entity."""
+        return unpackChunkKey(self._keys[entity])
     def remove(self, entity):
         """Remove the entity from the tile corresponding to its position."""
-        coord = self._coords[entity]
-        entities = self.getAt(coord)
+        key = self._keys.pop(entity)
+        entities = self._entities[key]
         entities.remove(entity)
         if not entities:
-            del self._entities[coord]
-        del self._coords[entity]
+            del self._entities[key]
     def move(self, entity):
         """Remove the entity from the tile at old_pos and add it to its pos.
 
@@ -97,15 +166,15 @@ class EntityMap(object):
         method AFTER setting the position of your entity.
 
         """
-        old_coord = self._coords[entity]
-        new_coord = chunkCoordAt(entity.body.pos, self.scale)
-        if old_coord != new_coord:
-            entities = self.getAt(old_coord)
+        old_key = self._keys[entity]
+        new_key = chunkKeyAt(entity.body.pos, self.scale)
+        if old_key != new_key:
+            entities = self._entities[old_key]
             entities.remove(entity)
             if not entities:
-                del self._entities[old_coord]
-            self.getAt(new_coord).add(entity)
-            self._coords[entity] = new_coord
+                del self._entities[old_key]
+            self._getOrCreate(new_key).add(entity)
+            self._keys[entity] = new_key
     def getNear(self, pos, radius):
         """Used for pruning entities in a collision, for instance.
 
@@ -114,12 +183,94 @@ class EntityMap(object):
 
         All the tiles covered by that definitions are examined for entities.
 
-        All the found entities are returned in a set.
+        All the found entities are returned in a set, or in a list sorted by
+        entity_id if the map is ordered.
 
         """
         x_min, x_max, y_min, y_max = chunkCoordsAround(pos, radius, self.scale)
         result = set()
-        for x in xrange(x_min, x_max + 1):
-            for y in xrange(y_min, y_max + 1):
-                result.update(self.getAt((x, y)))
+        chunks = self._entities
+        # Thanks to the packing, the keys of a column of chunks are
+        # consecutive integers.
+        y_min += KEY_BIAS
+        y_max += KEY_BIAS + 1
+        for x in xrange(x_min + KEY_BIAS, x_max + KEY_BIAS + 1):
+            column = x << KEY_BITS
+            for key in xrange(column + y_min, column + y_max):
+                entities = chunks.get(key)
+                if entities:
+                    result.update(entities)
+        self._queries += 1
+        self._radius_sum += radius
+        self._chunks_visited += (x_max - x_min + 1) * (y_max - y_min)
+        self._candidates += len(result)
+        if self.ordered:
+            return sorted(result, key=attrgetter('entity_id'))
         return result
+
+    #-----------------------------  Self-tuning.  -----------------------------
+
+    def resetStats(self):
+        """Forget what we measured about the queries."""
+        self._queries = 0
+        self._radius_sum = 0
+        self._chunks_visited = 0
+        self._candidates = 0
+    def estimateCost(self, scale, radius, density):
+        """Estimated cost of a getNear call at that scale.
+
+        `radius` is the radius of the query, and `density` the number of
+        entities per square meter around the places we query.
+
+        A square of side 2 * radius covers on average 2 * radius / scale + 1
+        chunks in each direction.  The entities we return are those living in
+        these chunks, which cover a square of side 2 * radius + scale.
+
+        """
+        chunks = (2 * radius / scale + 1) ** 2
+        candidates = density * (2 * radius + scale) ** 2
+        return self.CHUNK_COST * chunks + self.CANDIDATE_COST * candidates
+    def bestScale(self):
+        """Return the scale that would have served the measured queries best.
+
+        Return None if we have not measured enough.
+
+        """
+        if self._queries < self.RETUNE_QUERIES:
+            return None
+        radius = self._radius_sum / self._queries
+        area = self._chunks_visited * self.scale ** 2
+        density = self._candidates / area
+        costs = [(self.estimateCost(scale, radius, density), scale)
+                 for scale in self.SCALES]
+        best_cost, best_scale = min(costs)
+        current_cost = self.estimateCost(self.scale, radius, density)
+        if best_cost < current_cost * self.RETUNE_GAIN:
+            return best_scale
+        return self.scale
+    def rebucket(self, scale):
+        """Redistribute all the entities in chunks of a different size."""
+        entities = self._keys.keys()
+        self._entities = {}
+        self._keys = {}
+        self.scale = scale
+        for entity in entities:
+            self.add(entity)
+    def retune(self):
+        """Change the scale if the measured queries call for it.
+
+        This is cheap enough to be called at every physics update: nothing
+        happens until enough queries have been measured.  Return True if the
+        entities were re-bucketed.
+
+        """
+        if not self.auto_scale:
+            return False
+        scale = self.bestScale()
+        if scale is None:
+            return False
+        self.resetStats()
+        if scale == self.scale:
+            return False
+        self.rebucket(scale)
+        return True
@@ -9,3 +9,7 @@ class AlreadyInAreaError(WorldError):
     """The area already contains what you are trying to add to it."""
 class NotInAreaError(WorldError):
     """The area does not contain that object."""
+class ShardError(WorldError):
+    """A shard process failed to do what it was asked.  See shard.py."""
+class AreaFileError(WorldError):
+    """The file is not an area file.  See areafile.py."""
@@ -50,6 +50,21 @@ class EntityLeftAreaEvent(Event):
     """An entity left an area."""
     attributes = ('entity_id', 'area_id')
 
+class TriggerEnteredEvent(Event):
+    """An entity started overlapping a non-solid entity (a sensor)."""
+    to_log = False
+    attributes = ('sensor_id', 'entity_id')
+
+class TilesChangedEvent(Event):
+    """Tiles of an area appeared or changed.
+
+    `tiles` is a tile.TileMapSummary of the chunks that appeared, `changes` a
+    tile.TileChanges of the tiles that changed.  Either can be None.
+
+    """
+    attributes = ('area_id', 'tiles', 'changes')
+    to_log = False
+
 class AreaContentRequest(Event):
     """Send that when you need to know what an area contains."""
     attributes = ('area_id',)
@@ -75,4 +90,8 @@ class AttackRequest(Event):
 class AttackEvent(Event):
     """A creature attacks another."""
     attributes = ('attacker', 'victim')
+
+class AreaAttackEvent(Event):
+    """A creature attacks many others at once.  `victims` is a frozenset."""
+    attributes = ('attacker', 'victims')
 # pylint: enable-msg=R0903
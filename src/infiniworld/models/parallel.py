@@ -0,0 +1,315 @@
+#! /usr/bin/python
+"""Physics of a single area spread over several processes.
+
+A huge area full of foxes is too much for one core.  ParallelPhysics cuts the
+area into square regions aligned on the chunks of the entity map, and each
+region is simulated by a process of a multiprocessing.Pool.
+
+A region owns the bodies whose center is in it, those that move during the
+update and those that don't: the others may push them.  Around a moving body,
+a margin we call the halo is wide enough for anything it could touch during
+the update.  When the halo of a body near a border reaches a body of the next
+region, the two regions are simulated together, in the same task: a collision
+between two bodies is always resolved in one place, the way the serial physics
+does it.  The bodies are moved and collided exactly like AreaModel does it,
+with the same code, in the order of their entity_id.
+
+The halo is measured at the start of the update.  It assumes that no body
+goes faster than SPEED_MARGIN times the fastest of them, counting for each
+body its speed plus what its forces add during the time step.  The margin
+covers a bounce: a wall keeps the speed, and a body hit by a heavier one gets
+at most twice the speed of the other.  Forces that grow quickly with the
+speed, or chains of collisions, can go beyond that.  Two bodies that meet
+anyway from two tasks don't see each other: they may overlap at the end of
+the update, and the next update, with both of them in its halo, pushes them
+apart.
+
+Reconciliation is simple and deterministic: every body belongs to a single
+task, and only that task modifies it.  The results are applied in entity_id
+order, and so are the reactions to the collisions.  A crowd spread over every
+border ends up in a single task: it is then as slow as the serial physics, but
+not wrong.
+
+"""
+from __future__ import division
+import math
+import multiprocessing
+
+from infiniworld.evtman import EventManager
+from area import AreaModel
+from entitymap import EntityMap
+from entitymap import packChunkCoord
+import tile
+
+# Every process of the pool has its own AreaModel in which the regions are
+# simulated.  Its tile map is set when the process starts, and patched with the
+# tile changes that come with the tasks.
+_WORKER_AREA = None
+# Version of the last TileChanges the process applied.
+_WORKER_TILES_VERSION = 0
+
+def _initWorker(tiles_summary):
+    """Prepare a pool process: build its area and its tile map."""
+    # pylint: disable-msg=W0603
+    # Using the global statement.  That's how pool processes keep state.
+    global _WORKER_AREA
+    area = AreaModel(EventManager(), None, -1)
+    area.tile_map = tile.TileMap.fromSummary(tiles_summary)
+    _WORKER_AREA = area
+
+
+class BodyProxy(object):
+    """Stands for an EntityModel in a pool process.
+
+    The AreaModel only needs an id, a body, and the existence flag.  Instead of
+    reacting to collisions, the proxy writes them down so that the real entity
+    can react in the main process.
+
+    """
+    def __init__(self, entity_id, body, collisions):
+        object.__init__(self)
+        self.entity_id = entity_id
+        self.body = body
+        self.exists = True
+        self._collisions = collisions
+    def reactToCollision(self, collider):
+        """Remember that `collider` bumped into us."""
+        self._collisions.append((collider.entity_id, self.entity_id))
+
+
+def simulateRegion(task):
+    """Move the bodies owned by a region.  Runs in a pool process.
+
+    `task` is a tuple (owned, scale, biggest_radius, tile_changes):
+    * owned: list of (entity_id, body, timestep, integrator, contacts) sorted
+      by entity_id, with a timestep of None for the bodies that don't move,
+    * scale: that of the entity map of the real area,
+    * biggest_radius: of all the entities of the real area,
+    * tile_changes: list of the TileChanges since the pool started.
+
+    Return the list of (entity_id, pos, vel, contacts) for the owned bodies,
+    and the list of (collider_id, collidee_id) collisions.
+
+    """
+    # pylint: disable-msg=W0603
+    # Using the global statement.  That's how pool processes keep state.
+    global _WORKER_TILES_VERSION
+    owned, scale, biggest_radius, tile_changes = task
+    area = _WORKER_AREA
+    # Making a change twice does no harm, but there's no need to.
+    for changes in tile_changes:
+        if changes.version > _WORKER_TILES_VERSION:
+            area.tile_map.applyChanges(changes)
+            _WORKER_TILES_VERSION = changes.version
+    collisions = []
+    area.entity_map = EntityMap(scale, False)
+    area.entities = {}
+    area._biggest_entity_radius = biggest_radius
+    area._contacts = {}
+    area._reported = set()
+    proxies = []
+    for entity_id, body, timestep, integrator, contacts in owned:
+        proxy = BodyProxy(entity_id, body, collisions)
+        proxies.append((proxy, timestep, integrator))
+        area.entities[entity_id] = proxy
+        area.entity_map.add(proxy)
+        if contacts:
+            area._contacts[entity_id] = contacts
+    for proxy, timestep, integrator in proxies:
+        if timestep is not None:
+            area.moveEntityByPhysics(proxy, timestep, integrator)
+    results = []
+    for proxy, unused, unused in proxies:
+        body = proxy.body
+        results.append((proxy.entity_id, body.pos, body.vel,
+                        area._contacts.get(proxy.entity_id)))
+    return results, collisions
+
+
+class ParallelPhysics(object):
+    """Runs the physics of an AreaModel in a pool of processes.
+
+    Creating it attaches it to the area, closing it detaches it.  The tile map
+    is sent to the processes when the pool starts: call `restart` if the area
+    gets another tile map.  The changes to the tiles are sent with the tasks,
+    see addTileChanges.
+
+    """
+    # A region is a square of that many chunks of the entity map.
+    REGION_CHUNKS = 4
+    # Below that many entities to simulate, the serial loop is faster than
+    # sending everything to the other processes.
+    MIN_ENTITIES = 200
+    # All the tile changes since the pool started go with every task: we never
+    # know which process gets which task.  Past that many changed tiles, it's
+    # time to restart the pool with the new tile map.
+    MAX_TILE_CHANGES = 256
+    # How much faster than measured the bodies may go, see the module
+    # docstring.
+    SPEED_MARGIN = 2
+    def __init__(self, area, workers=None):
+        object.__init__(self)
+        self._area = area
+        self._workers = workers or multiprocessing.cpu_count()
+        self._pool = None
+        self._tile_changes = []
+        self._changed_tiles = 0
+        self.restart()
+        area.parallel_physics = self
+    def restart(self):
+        """(Re)start the pool with the current tile map of the area."""
+        if self._pool is not None:
+            self._pool.terminate()
+        tiles_summary = self._area.tile_map.makeSummary()
+        self._pool = multiprocessing.Pool(self._workers, _initWorker,
+                                          (tiles_summary,))
+        self._tile_changes = []
+        self._changed_tiles = 0
+    def addTileChanges(self, changes):
+        """The processes will make these TileChanges before their next task."""
+        self._tile_changes.append(changes)
+        self._changed_tiles += len(changes)
+        if self._changed_tiles > self.MAX_TILE_CHANGES:
+            self.restart()
+    def close(self):
+        """Stop the processes and let the area do its physics alone again."""
+        self._pool.terminate()
+        self._pool = None
+        self._area.parallel_physics = None
+    def isWorthIt(self, scheduled):
+        """Is there enough to do to bother the pool?"""
+        return len(scheduled) >= self.MIN_ENTITIES
+
+    def splitInRegions(self, scheduled):
+        """Return the tasks for simulateRegion, sorted by region.
+
+        A task is a group of regions: those where a moving body could touch
+        a body of another region during the update are grouped together,
+        see the module docstring.
+
+        """
+        area = self._area
+        region_size = area.entity_map.scale * self.REGION_CHUNKS
+        biggest_radius = area._biggest_entity_radius
+        # The halo must contain everything that can touch a moving body by
+        # the end of the update: the body itself can move, and so can the
+        # other one.  Each can go as far as its speed takes it, and its
+        # forces speed it up on the way.
+        speed_max = 0
+        timestep_max = 0
+        for entity, timestep, unused in scheduled:
+            body = entity.body
+            accel = body.accel(body.pos, body.vel, 0)
+            speed = body.vel.norm() + accel.norm() * timestep
+            speed_max = max(speed_max, speed)
+            timestep_max = max(timestep_max, timestep)
+        halo = 2 * (biggest_radius +
+                    self.SPEED_MARGIN * speed_max * timestep_max)
+        # {entity_id: (timestep, integrator)} of the moving bodies.
+        moving = {}
+        for entity, timestep, integrator in scheduled:
+            if entity.exists:
+                moving[entity.entity_id] = (timestep, integrator)
+        # {region key: [owned bodies]}, for simulateRegion.  The bodies that
+        # don't move only matter if they are solid.
+        owned = {}
+        homes = {}
+        moving_regions = set()
+        for entity_id in sorted(area.entities.keys()):
+            entity = area.entities[entity_id]
+            if not entity.exists:
+                continue
+            if entity_id in moving:
+                timestep, integrator = moving[entity_id]
+            elif entity.body.solid:
+                timestep = integrator = None
+            else:
+                continue
+            pos = entity.body.pos
+            key = packChunkCoord(int(math.floor(pos.x / region_size)),
+                                 int(math.floor(pos.y / region_size)))
+            homes[entity_id] = key
+            if timestep is not None:
+                moving_regions.add(key)
+            owned.setdefault(key, []).append(
+                (entity_id, entity.body, timestep, integrator,
+                 area._contacts.get(entity_id)))
+        # {region key: set of the region keys of its group}.  All the regions
+        # of a group share the same set.
+        groups = dict((key, set([key])) for key in owned)
+        for entity_id in sorted(moving):
+            entity = area.entities[entity_id]
+            body = entity.body
+            if not body.solid:
+                continue
+            pos = body.pos
+            # Far from the borders, the halo stays in the region.
+            if (math.floor((pos.x - halo) / region_size) ==
+                math.floor((pos.x + halo) / region_size) and
+                math.floor((pos.y - halo) / region_size) ==
+                math.floor((pos.y + halo) / region_size)):
+                continue
+            group = groups[homes[entity_id]]
+            for other in area.entity_map.getNear(pos, halo):
+                if not (other.exists and other.body.solid):
+                    continue
+                other_group = groups[homes[other.entity_id]]
+                if other_group is group:
+                    continue
+                other_pos = other.body.pos
+                if (abs(other_pos.x - pos.x) > halo or
+                    abs(other_pos.y - pos.y) > halo):
+                    continue
+                # Merge the smaller group into the bigger one.
+                if len(other_group) > len(group):
+                    group, other_group = other_group, group
+                group |= other_group
+                for key in other_group:
+                    groups[key] = group
+        scale = area.entity_map.scale
+        tasks = []
+        for key in sorted(owned):
+            group = groups[key]
+            if key != min(group) or not group & moving_regions:
+                # Done with its first region, or nothing moves in there.
+                continue
+            bodies = []
+            for group_key in group:
+                bodies.extend(owned[group_key])
+            if len(group) > 1:
+                bodies.sort(key=lambda item: item[0])
+            tasks.append((bodies, scale, biggest_radius, self._tile_changes))
+        return tasks
+
+    def moveEntities(self, scheduled):
+        """Simulate the scheduled entities on the pool, and apply the results.
+
+        `scheduled` is what AreaModel.scheduleEntities returns.
+
+        """
+        area = self._area
+        tasks = self.splitInRegions(scheduled)
+        results = self._pool.map(simulateRegion, tasks)
+        collisions = []
+        moved = []
+        for region_results, region_collisions in results:
+            moved.extend(region_results)
+            collisions.extend(region_collisions)
+        moved.sort(key=lambda item: item[0])
+        for entity_id, pos, vel, contacts in moved:
+            entity = area.entities[entity_id]
+            entity.body.pos = pos
+            entity.body.vel = vel
+            area.entity_map.move(entity)
+            if contacts:
+                area._contacts[entity_id] = contacts
+            else:
+                area._contacts.pop(entity_id, None)
+        # The colliders are always owned bodies: only them are moved.
+        for collider_id, collidee_id in sorted(set(collisions)):
+            collider = area.entities.get(collider_id)
+            collidee = area.entities.get(collidee_id)
+            if collider is None or collidee is None:
+                continue
+            if collider.exists and collidee.exists:
+                collidee.reactToCollision(collider)
@@ -0,0 +1,103 @@
+#! /usr/bin/python
+"""Who sees whom in an area.
+
+A zombie fox looks for the bunnies around it: a query of the entity map, a
+filter and a sort, for every fox.  There are hundreds of foxes and one
+bunny.  Perception turns the question around: once per perception pass, it
+asks the entity map who is around each bunny, and writes down for every fox
+the closest bunny it sees.  The foxes read their line of the table.
+
+The table says exactly what the queries of the foxes would say: a watcher
+sees a target when it is at most `radius` away.  A query of the entity map
+returns whole chunks (see EntityMap.getNear), more than that and more or less
+depending on the scale of the map, so both sides check the true distance.
+When two targets are as close, the one with the smallest entity_id wins.
+
+"""
+
+
+class Perception(object):
+    """The perception service of an AreaModel, see the module docstring.
+
+    The area tells it which entities come and go, and when a perception pass
+    starts and ends (see AreaModel.runPerception).  The tables are only kept
+    during a pass: nothing moves then.  Outside of a pass, findClosest asks
+    the entity map directly.
+
+    """
+    def __init__(self, area):
+        object.__init__(self)
+        self._area = area
+        # {NAME: {entity_id: entity}} of the entities of the area.
+        self._named = {}
+        # {(name, radius): {watcher_id: (target, distance)}} during a pass,
+        # None outside.
+        self._tables = None
+
+    def addEntity(self, entity):
+        """The entity entered the area."""
+        self._named.setdefault(entity.NAME, {})[entity.entity_id] = entity
+    def removeEntity(self, entity):
+        """The entity left the area."""
+        named = self._named[entity.NAME]
+        del named[entity.entity_id]
+        if not named:
+            del self._named[entity.NAME]
+    def getNamed(self, name):
+        """Return the {entity_id: entity} of the entities with that NAME."""
+        return self._named.get(name, {})
+
+    def startPass(self):
+        """Nothing moves until endPass, the tables can be kept."""
+        self._tables = {}
+    def endPass(self):
+        """Things may move again, forget the tables."""
+        self._tables = None
+
+    def findClosest(self, watcher, name, radius):
+        """Return the closest target with that NAME seen by the watcher.
+
+        The result is a tuple (target, distance), or (None, None) if the
+        watcher sees nothing.  Only the existing targets are seen.
+
+        """
+        if self._tables is None:
+            return self.findClosestDirectly(watcher, name, radius)
+        table = self._tables.get((name, radius))
+        if table is None:
+            table = self.makeTable(name, radius)
+            self._tables[(name, radius)] = table
+        return table.get(watcher.entity_id, (None, None))
+    def findClosestDirectly(self, watcher, name, radius):
+        """Same as findClosest, with a query around the watcher."""
+        pos = watcher.body.pos
+        best = (None, None)
+        for entity in self._area.entity_map.getNear(pos, radius):
+            if entity.NAME != name or not entity.exists:
+                continue
+            distance = entity.body.pos.dist(pos)
+            if distance > radius:
+                continue
+            if (best[0] is None or distance < best[1] or
+                (distance == best[1] and
+                 entity.entity_id < best[0].entity_id)):
+                best = (entity, distance)
+        return best
+    def makeTable(self, name, radius):
+        """Return {watcher_id: (target, distance)} for all the watchers."""
+        entity_map = self._area.entity_map
+        table = {}
+        for target_id, target in sorted(self.getNamed(name).items()):
+            if not target.exists:
+                continue
+            pos = target.body.pos
+            for watcher in entity_map.getNear(pos, radius):
+                distance = pos.dist(watcher.body.pos)
+                if distance > radius:
+                    continue
+                best = table.get(watcher.entity_id)
+                # The targets come in the order of their ids: the first one
+                # wins the ties.
+                if best is None or distance < best[1]:
+                    table[watcher.entity_id] = (target, distance)
+        return table
@@ -0,0 +1,147 @@
+#! /usr/bin/python
+"""Generation of the chunks of tiles before the player gets there.
+
+On an infinite map, when the bunny walks into a chunk that was never
+generated, the TileMap generates it right away, in the middle of the physics
+update: the game hitches.  The ChunkPrefetcher watches where the controlled
+entity goes and how fast, and has the chunks ahead of it generated by a
+background thread.  They are handed to the tile map between two physics
+updates, so that the tile map finds them in memory when it needs them.
+
+"""
+import logging
+import Queue
+import threading
+
+from infiniworld.evtman import SingleListener
+
+LOGGER = logging.getLogger('world')
+
+
+class ChunkPrefetcher(SingleListener):
+    """Generates the chunks ahead of the controlled entity of an area.
+
+    Creating it attaches it to the area, closing it detaches it and stops the
+    thread.  It keeps statistics, see getStats.
+
+    Only the generation is done by the thread.  The chunks that are in the
+    store are not asked for: the tile map loads them quickly enough.
+
+    """
+    # How far ahead we look, in seconds of travel at the current velocity.
+    LOOKAHEAD = 2
+    def __init__(self, event_manager, area):
+        SingleListener.__init__(self, event_manager)
+        self._area = area
+        # (chunk_coord, generator, chunk_size) for the thread, None to stop.
+        self._requests = Queue.Queue()
+        # (chunk_coord, tiles) from the thread.  The tiles are None if the
+        # generator failed.
+        self._ready = Queue.Queue()
+        # The chunks that were asked for and not handed over yet.
+        self._pending = set()
+        # Chunks handed over to the tile map before it needed them, and
+        # chunks that came too late: the tile map had them already.
+        self._hits = 0
+        self._wasted = 0
+        self._generated_before = area.tile_map.generated_chunks
+        self._thread = threading.Thread(target=self._work,
+                                        name='ChunkPrefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+        area.chunk_prefetcher = self
+
+    def _work(self):
+        """Body of the thread: generate what is asked for, until None."""
+        while True:
+            request = self._requests.get()
+            if request is None:
+                self._requests.task_done()
+                return
+            chunk_coord, generator, size = request
+            # pylint: disable-msg=W0703
+            # Catching all the exceptions: the thread must go on.  The tile
+            # map will try again itself, and fail loudly.
+            try:
+                tiles = generator(chunk_coord[0], chunk_coord[1], size)
+            except Exception:
+                LOGGER.exception("Could not generate chunk %r.", chunk_coord)
+                tiles = None
+            # pylint: enable-msg=W0703
+            self._ready.put((chunk_coord, tiles))
+            self._requests.task_done()
+
+    def prefetchAround(self, pos, vel):
+        """Ask for the chunks around where something at pos goes."""
+        area = self._area
+        tile_map = area.tile_map
+        if tile_map.generator is None:
+            return
+        ahead = pos + vel * self.LOOKAHEAD
+        for chunk_coord in tile_map.getChunkCoordsAround(ahead,
+                                                         area.PRELOAD_RADIUS):
+            if chunk_coord in self._pending or tile_map.hasChunk(chunk_coord):
+                continue
+            self._pending.add(chunk_coord)
+            self._requests.put((chunk_coord, tile_map.generator,
+                                tile_map.CHUNK_SIZE))
+    def handOver(self):
+        """Give the chunks that are ready to the tile map.
+
+        The AreaModel calls it between two physics updates.
+
+        """
+        tile_map = self._area.tile_map
+        while True:
+            try:
+                chunk_coord, tiles = self._ready.get_nowait()
+            except Queue.Empty:
+                return
+            self._pending.discard(chunk_coord)
+            if tiles is not None and tile_map.offerChunk(chunk_coord, tiles):
+                self._hits += 1
+            else:
+                self._wasted += 1
+    def waitForThread(self):
+        """Return when the thread has done everything it was asked."""
+        self._requests.join()
+    def getStats(self):
+        """Return a dictionary with the statistics of the prefetcher.
+
+        * hits: chunks that were ready before the tile map needed them,
+        * misses: chunks the tile map had to generate itself,
+        * wasted: chunks that came when the tile map had them already,
+        * pending: chunks asked for and not handed over yet.
+
+        """
+        tile_map = self._area.tile_map
+        return {'hits': self._hits,
+                'misses': tile_map.generated_chunks - self._generated_before,
+                'wasted': self._wasted,
+                'pending': len(self._pending)}
+    def close(self):
+        """Stop the thread, and let the area generate its chunks alone."""
+        # Forget what was not done yet.
+        while True:
+            try:
+                self._requests.get_nowait()
+            except Queue.Empty:
+                break
+            self._requests.task_done()
+        self._requests.put(None)
+        self._thread.join()
+        self.unregister()
+        self._area.chunk_prefetcher = None
+        LOGGER.debug("Area %i: chunk prefetch stats %r.",
+                     self._area.area_id, self.getStats())
+
+    def onEntityMovedEvent(self, event):
+        """Look ahead of the controlled entity."""
+        area = self._area
+        # pylint: disable-msg=W0212
+        # Accessing a protected member: the area decides who's controlled.
+        if event.entity_id != area._controlled_entity_id:
+            return
+        entity = area.entities.get(event.entity_id)
+        if entity is not None:
+            self.prefetchAround(event.pos, entity.body.vel)
@@ -0,0 +1,389 @@
+#! /usr/bin/python
+"""A world whose areas live in other processes.
+
+The normal WorldModel simulates all its areas in the main process.  The
+ShardedWorldModel gives each area, or group of areas, to a long-lived worker
+process: a shard.  Each shard runs a LocalWorldModel with its own event
+manager, and does the physics and the AI of its areas by itself.
+
+The ShardedWorldModel stays in the main process and coordinates.  It knows
+which area is in which shard and where each entity is, and it keeps the last
+summary of every entity.  It never holds an EntityModel.
+
+Events travel both ways:
+
+* Down: the events in ShardedWorldModel.FORWARDED_EVENTS (the player pushing
+  the bunny around, the view asking for the content of an area...) are sent
+  to all the shards.  They are posted there in the order they were handled.
+* Up: when a shard is done with a command (like running the physics), it
+  sends back all the events that its models posted, except those that only
+  matter locally (SHARD_LOCAL_EVENTS) and those that came down.  The
+  coordinator posts them in the main event manager, for the views.
+
+Moving an entity to an area of another shard is a migration: the entity is
+exported from its shard (WorldModel.exportEntity), pickled, and imported
+into the other one with all its state.
+
+Entities can be created inside a shard, by a spawner for example.  To avoid
+asking the coordinator for ids, the shards share the ids like stripes: shard
+i of n uses i, i + n, i + 2n...
+
+"""
+import logging
+import multiprocessing
+import traceback
+
+import events
+from area import AreaModel
+from entity import EntityModel
+from errors import ShardError
+from world import nextThing
+from world import WorldModel
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.evtman import EventManager
+from infiniworld.evtman import SingleListener
+
+LOGGER = logging.getLogger('world')
+
+# Posted by the shards but only handled there: the coordinator does not care.
+SHARD_LOCAL_EVENTS = ('RunPhysicsEvent', 'DestroyEntityRequest')
+
+
+class ShardEventManager(EventManager):
+    """Event manager of a shard: writes down the events that must go up."""
+    def __init__(self, local_events):
+        EventManager.__init__(self)
+        self._local_events = frozenset(local_events)
+        self.outbox = []
+    def post(self, event):
+        """Add an Event to the event queue, and to the outbox if needed."""
+        EventManager.post(self, event)
+        if event.__class__.__name__ not in self._local_events:
+            self.outbox.append(event)
+    def postFromCoordinator(self, event):
+        """Add an Event that came down to the queue, but not to the outbox."""
+        EventManager.post(self, event)
+    def flushOutbox(self):
+        """Return the events that must go up, and forget them."""
+        outbox = self.outbox
+        self.outbox = []
+        return outbox
+
+
+class LocalWorldModel(WorldModel):
+    """The part of a sharded world that is simulated by one shard."""
+    def __init__(self, event_manager, shard_index, shard_count):
+        WorldModel.__init__(self, event_manager)
+        self._entity_id_max = shard_index - shard_count
+        self._shard_count = shard_count
+        self._migrations = []
+    def newEntityId(self):
+        """Return an entity_id that no shard ever used."""
+        self._entity_id_max += self._shard_count
+        return self._entity_id_max
+    def addArea(self, area_id):
+        """Create the area that the coordinator gave to this shard."""
+        self._areas[area_id] = AreaModel(self._event_manager, self, area_id)
+    def moveEntityToArea(self, entity_id, area_id_new):
+        """Move the entity to the new area, even if it's in another shard."""
+        if area_id_new is None or area_id_new in self._areas:
+            WorldModel.moveEntityToArea(self, entity_id, area_id_new)
+        else:
+            entity = self.exportEntity(entity_id)
+            self._migrations.append((entity, area_id_new))
+            LOGGER.debug("Entity %r leaves for area %r." %
+                         (entity_id, area_id_new))
+    def flushMigrations(self):
+        """Return the (entity, area_id) that must go to other shards."""
+        migrations = self._migrations
+        self._migrations = []
+        return migrations
+
+
+class ShardServer(object):
+    """Runs in a shard process and obeys the coordinator.
+
+    Every public method is a command that the coordinator can send.
+
+    """
+    def __init__(self, shard_index, shard_count, forwarded):
+        object.__init__(self)
+        self.event_manager = ShardEventManager(SHARD_LOCAL_EVENTS +
+                                               tuple(forwarded))
+        self.world = LocalWorldModel(self.event_manager,
+                                     shard_index, shard_count)
+        # The last summary sent up for each entity.
+        self._summaries = {}
+    def createArea(self, area_id):
+        """Create an area, with the id chosen by the coordinator."""
+        self.world.addArea(area_id)
+    def createEntity(self, factory, area_id):
+        """Create an entity and put it in the area."""
+        entity = self.world.createEntity(factory)
+        self.world.moveEntityToArea(entity.entity_id, area_id)
+        return entity.entity_id
+    def destroyEntity(self, entity_id):
+        """Remove an entity from the world, forever."""
+        self.world.destroyEntity(self.world.entities[entity_id])
+    def moveEntityToArea(self, entity_id, area_id):
+        """Move an entity between two areas of this shard."""
+        self.world.moveEntityToArea(entity_id, area_id)
+    def exportEntity(self, entity_id):
+        """Give an entity away."""
+        return self.world.exportEntity(entity_id)
+    def importEntity(self, entity, area_id):
+        """Receive an entity from another shard."""
+        self.world.importEntity(entity, area_id)
+    def runPhysics(self, timestep):
+        """Time passes."""
+        self.event_manager.postFromCoordinator(RunPhysicsEvent(timestep))
+    def call(self, function, args):
+        """Run function(world, *args) here and return its result."""
+        return function(self.world, *args)
+    def flushSummaries(self):
+        """Return the summaries that changed, None for the entities gone."""
+        changed = {}
+        entities = self.world.entities
+        for entity_id, entity in entities.iteritems():
+            summary = entity.makeSummary()
+            if self._summaries.get(entity_id) != summary:
+                self._summaries[entity_id] = summary
+                changed[entity_id] = summary
+        for entity_id in self._summaries.keys():
+            if entity_id not in entities:
+                del self._summaries[entity_id]
+                changed[entity_id] = None
+        return changed
+
+def runShard(connection, shard_index, shard_count, forwarded):
+    """Main function of a shard process."""
+    server = ShardServer(shard_index, shard_count, forwarded)
+    while True:
+        command = connection.recv()
+        name = command[0]
+        if name == 'stop':
+            break
+        if name == 'post':
+            # Nobody waits for an answer.  The event will be handled with the
+            # next command.
+            server.event_manager.postFromCoordinator(command[1])
+            continue
+        # pylint: disable-msg=W0703
+        # Catching Exception: whatever goes wrong must be told to the
+        # coordinator, who is blocked waiting for our answer.
+        try:
+            result = getattr(server, name)(*command[1:])
+            server.event_manager.pump()
+            reply = (result,
+                     server.event_manager.flushOutbox(),
+                     server.world.flushMigrations(),
+                     server.flushSummaries())
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+        else:
+            connection.send(('ok', reply))
+        # pylint: enable-msg=W0703
+    connection.close()
+
+
+class ShardProcess(object):
+    """The coordinator's handle on a shard process."""
+    def __init__(self, shard_index, shard_count, forwarded):
+        object.__init__(self)
+        self.shard_index = shard_index
+        self._connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=runShard,
+            args=(child_connection, shard_index, shard_count, forwarded))
+        self._process.daemon = True
+        self._process.start()
+    def send(self, *command):
+        """Send a command.  Call receive for the answer, except for posts."""
+        self._connection.send(command)
+    def receive(self):
+        """Wait for the answer to the last command.
+
+        Return (result, events, migrations, summaries).
+
+        """
+        status, reply = self._connection.recv()
+        if status == 'error':
+            raise ShardError("Shard %i failed:\n%s" %
+                             (self.shard_index, reply))
+        return reply
+    def stop(self):
+        """Ask the process to finish and wait for it."""
+        self._connection.send(('stop',))
+        self._process.join()
+        self._connection.close()
+
+
+class ShardedWorldModel(SingleListener):
+    """The coordinator of a world simulated by several processes.
+
+    It looks like a WorldModel to the rest of the game, except that it deals
+    in ids: createArea and createEntity return ids, not models.  The models
+    are in the shards and never leave them, except to migrate.
+
+    """
+    # Events of the main event manager that the shards need to hear about.
+    # Each shard posts them to its local models.  Games add their own with
+    # the `forwarded` argument of the constructor.
+    FORWARDED_EVENTS = ('MoveEntityRequest', 'ControlEntityEvent',
+                        'AreaContentRequest')
+    def __init__(self, event_manager, shard_count=None, forwarded=()):
+        # The handlers depend on that, so it must be set before registering.
+        self._forwarded = self.FORWARDED_EVENTS + tuple(forwarded)
+        SingleListener.__init__(self, event_manager)
+        if shard_count is None:
+            shard_count = multiprocessing.cpu_count()
+        self._shards = [ShardProcess(shard_index, shard_count,
+                                     self._forwarded)
+                        for shard_index in xrange(shard_count)]
+        self._area_id_max = -1
+        self._area_shards = {}
+        # entity_id: area_id, like in the WorldModel, but no model.
+        self.entities = {}
+        self.summaries = {}
+        self._entity_shards = {}
+    def getHandlers(self):
+        """The forwarded events all go to forwardEvent."""
+        handlers = SingleListener.getHandlers(self)
+        for event_name in self._forwarded:
+            handlers.setdefault(event_name, self.forwardEvent)
+        return handlers
+    def close(self):
+        """Stop the shards."""
+        for shard in self._shards:
+            shard.stop()
+        self._shards = []
+    def unregister(self):
+        """Also stops the shards."""
+        self.close()
+        SingleListener.unregister(self)
+
+    def _call(self, shard_index, *command):
+        """Run a command in a shard, process what comes back, return result."""
+        shard = self._shards[shard_index]
+        shard.send(*command)
+        reply = shard.receive()
+        return self._processReply(shard_index, reply)
+    def _processReply(self, shard_index, reply):
+        """Learn from the summaries, migrate and post what a shard sent."""
+        result, shard_events, migrations, summaries = reply
+        for entity_id, summary in summaries.iteritems():
+            if summary is None:
+                # Gone, unless it already showed up in another shard.
+                if self._entity_shards.get(entity_id) == shard_index:
+                    del self._entity_shards[entity_id]
+                    del self.entities[entity_id]
+                    del self.summaries[entity_id]
+            else:
+                self._entity_shards[entity_id] = shard_index
+                self.entities[entity_id] = summary['area_id']
+                self.summaries[entity_id] = summary
+        for event in shard_events:
+            self.post(event)
+        for entity, area_id in migrations:
+            shard_new = self._area_shards.get(area_id)
+            if shard_new is None:
+                # Nobody has that area.  The entity was given away already:
+                # it goes back where it came from, in no area.
+                LOGGER.warning("Entity %r cannot go to unknown area %r, "
+                               "it stays in shard %i in no area." %
+                               (entity.entity_id, area_id, shard_index))
+                shard_new = shard_index
+                area_id = None
+            self._call(shard_new, 'importEntity', entity, area_id)
+        return result
+
+    def createArea(self, shard_index=None):
+        """Create a new area in a shard and return its id.
+
+        Without a shard_index, the areas are spread on the shards in turn.
+
+        """
+        self._area_id_max += 1
+        area_id = self._area_id_max
+        if shard_index is None:
+            shard_index = area_id % len(self._shards)
+        self._call(shard_index, 'createArea', area_id)
+        self._area_shards[area_id] = shard_index
+        return area_id
+    def createEntity(self, factory, area_id=None):
+        """Create a new entity in that area and return its id.
+
+        The entities that are in no area go to the first shard.
+
+        """
+        shard_index = self._area_shards.get(area_id, 0)
+        return self._call(shard_index, 'createEntity', factory, area_id)
+    def destroyEntity(self, entity_id):
+        """Remove an entity from the world, forever."""
+        self._call(self._entity_shards[entity_id], 'destroyEntity', entity_id)
+    def moveEntityToArea(self, entity_id, area_id_new):
+        """Move the entity to the new area, migrating it if needed."""
+        shard_old = self._entity_shards[entity_id]
+        shard_new = self._area_shards.get(area_id_new, shard_old)
+        if shard_old == shard_new:
+            self._call(shard_old, 'moveEntityToArea', entity_id, area_id_new)
+        else:
+            entity = self._call(shard_old, 'exportEntity', entity_id)
+            self._call(shard_new, 'importEntity', entity, area_id_new)
+        LOGGER.debug("Entity %r moved to area %r." % (entity_id, area_id_new))
+    def callInArea(self, area_id, function, *args):
+        """Return function(world, *args) run in the shard owning the area.
+
+        `world` is the LocalWorldModel of the shard.  That's how you reach
+        the models of a shard, to set a tile map or to plant a spawner for
+        example.  The function and its arguments must be picklable.
+
+        """
+        return self._call(self._area_shards[area_id], 'call', function, args)
+    def nextEntity(self, entity_id, offset):
+        """Return the previous or next entity_id in use."""
+        return nextThing(sorted(self.entities), entity_id, offset)
+    def nextArea(self, area_id, offset):
+        """Return the previous or next area_id in use."""
+        return nextThing(sorted(self._area_shards), area_id, offset)
+
+    def forwardEvent(self, event):
+        """Send the event down to all the shards."""
+        for shard in self._shards:
+            shard.send('post', event)
+    def onRunPhysicsEvent(self, event):
+        """Time passes, in all the shards at the same time."""
+        for shard in self._shards:
+            shard.send('runPhysics', event.timestep)
+        # Get all the answers before processing them: processing can send
+        # more commands, for migrations.
+        replies = [shard.receive() for shard in self._shards]
+        for shard_index, reply in enumerate(replies):
+            self._processReply(shard_index, reply)
+    def onDestroyEntityRequest(self, event):
+        """Something wants an entity to disappear forever."""
+        self.destroyEntity(event.entity_id)
+    def onCreateEntityCommand(self, unused):
+        """Player wants to create a new entity."""
+        self.createEntity(EntityModel)
+    def onCreateAreaCommand(self, unused):
+        """Player wants to create a new area."""
+        self.createArea()
+    def onViewNextAreaRequest(self, event):
+        """Player wants to see another area."""
+        area_id = self.nextArea(event.area_id, event.offset)
+        self.post(events.ViewAreaEvent(area_id))
+    def onControlNextEntityRequest(self, event):
+        """Player wants to control another entity."""
+        entity_id = self.nextEntity(event.entity_id, event.offset)
+        self.post(events.ControlEntityEvent(entity_id))
+    def onMoveEntityToNextAreaRequest(self, event):
+        """Player wants to move an entity to another area."""
+        if event.entity_id is None:
+            return
+        area_id = self.nextArea(self.entities[event.entity_id], event.offset)
+        self.moveEntityToArea(event.entity_id, area_id)
+    def onEntitySummaryRequest(self, event):
+        """Someone needs info about an entity.  We have it at hand."""
+        summary = self.summaries[event.entity_id]
+        self.post(events.EntitySummaryEvent(summary))
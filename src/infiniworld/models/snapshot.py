@@ -0,0 +1,197 @@
+#! /usr/bin/python
+"""Snapshots of the simulation state, for rolling back in time.
+
+Rollback netcode, AI looking ahead and the instant retry of the game all
+need to go back to an earlier state of the world, and fast.  Deep-copying the
+models is out of the question: they are listeners, full of references to the
+event manager, the areas and each other.
+
+A Snapshot only copies numbers.  For each entity it packs into an
+array('d'):
+
+* the position and the velocity of the body,
+* the vector of the walk force and the coefficient of the friction force,
+* the attributes named in SNAPSHOT_FIELDS, a class attribute of the entity.
+  Games extend it in their entity classes: health, cooldowns...
+
+Other objects with SNAPSHOT_FIELDS, like the spawners, can be given as
+`extras`.  The snapshot also keeps the state of the `random` module, of the
+random streams of the world (see WorldModel.getRandom), the clock of the
+world (see WorldModel.timers), and the bookkeeping of the areas (contacts,
+levels of detail...).
+
+Restoring writes the numbers back into the very same models: nothing is
+registered again to the event manager.  Entities created since the snapshot
+are destroyed.  Entities destroyed since the snapshot are created again with
+their old entity_id, the only case where a constructor runs.  The values
+get back the type they have in the model: an int health stays an int.
+
+Restore between two physics updates: the events waiting in the queue are
+not rolled back, and neither are the timers waiting in the timer wheel.
+
+"""
+from array import array
+from collections import deque
+import random
+
+from infiniworld.geometry import Vector
+
+# Number of values per entity before its SNAPSHOT_FIELDS.
+BODY_VALUES = 7
+
+
+class Snapshot(object):
+    """The state of some entities, areas and other objects at one moment.
+
+    Use takeWorldSnapshot or takeAreaSnapshot to make one.
+
+    """
+    def __init__(self, world, entities, areas, extras, whole_world):
+        object.__init__(self)
+        self._world = world
+        self._whole_world = whole_world
+        self._entity_id_max = world._entity_id_max
+        self._time = world.timers.now
+        self._random_state = random.getstate()
+        self._random_streams = dict((name, stream.getstate())
+                                    for name, stream
+                                    in world._randoms.iteritems())
+        # Per entity.  The values are in self._values, starting at the
+        # offset.
+        count = len(entities)
+        self._entity_ids = array('l')
+        self._offsets = array('l')
+        self._factories = [None] * count
+        self._area_ids = [None] * count
+        self._values = array('d')
+        values = self._values
+        for index, entity in enumerate(entities):
+            self._entity_ids.append(entity.entity_id)
+            self._offsets.append(len(values))
+            self._factories[index] = entity.__class__
+            self._area_ids[index] = entity.area_id
+            body = entity.body
+            pos = body.pos
+            vel = body.vel
+            walk = entity._walk_force.vector
+            values.extend((pos.x, pos.y, vel.x, vel.y, walk.x, walk.y,
+                           entity.friction_force.mu))
+            values.extend([getattr(entity, name)
+                           for name in entity.SNAPSHOT_FIELDS])
+        # Other objects.
+        self._extras = list(extras)
+        self._extra_values = array('d')
+        for extra in self._extras:
+            self._extra_values.extend([getattr(extra, name)
+                                       for name in extra.SNAPSHOT_FIELDS])
+        # Areas.  Their bookkeeping is made of small dictionaries, and of the
+        # queue of the entities waiting to perceive.
+        self._areas = [(area, area._physics_updates,
+                        dict(area._lod_time),
+                        dict(area._tiers),
+                        set(area._overlaps),
+                        dict((entity_id, dict(contacts))
+                             for entity_id, contacts
+                             in area._contacts.iteritems()),
+                        list(area._ai_queue),
+                        set(area._ai_queued))
+                       for area in areas]
+
+    def __len__(self):
+        """Number of entities in the snapshot."""
+        return len(self._entity_ids)
+
+    def _destroyNewEntities(self):
+        """Destroy the entities that appeared since the snapshot."""
+        world = self._world
+        known = set(self._entity_ids)
+        if self._whole_world:
+            candidates = world.entities.values()
+        else:
+            candidates = [entity
+                          for area_state in self._areas
+                          for entity in area_state[0].entities.values()]
+        for entity in candidates:
+            entity_id = entity.entity_id
+            if entity_id not in known and entity_id > self._entity_id_max:
+                world.destroyEntity(entity)
+
+    def restore(self):
+        """Put everything back as it was when the snapshot was taken."""
+        world = self._world
+        self._destroyNewEntities()
+        values = self._values
+        for index, entity_id in enumerate(self._entity_ids):
+            entity = world.entities.get(entity_id)
+            area_id = self._area_ids[index]
+            if entity is None:
+                entity = self._factories[index](world._event_manager,
+                                                entity_id)
+                world.entities[entity_id] = entity
+            offset = self._offsets[index]
+            body = entity.body
+            body.pos = Vector(values[offset], values[offset + 1])
+            body.vel = Vector(values[offset + 2], values[offset + 3])
+            entity._walk_force.vector = Vector(values[offset + 4],
+                                               values[offset + 5])
+            entity.friction_force.mu = values[offset + 6]
+            offset += BODY_VALUES
+            for name in entity.SNAPSHOT_FIELDS:
+                kind = type(getattr(entity, name))
+                setattr(entity, name, kind(values[offset]))
+                offset += 1
+            if entity.area_id != area_id:
+                world.moveEntityToArea(entity_id, area_id)
+            elif entity.area is not None:
+                entity.area.entity_map.move(entity)
+        offset = 0
+        for extra in self._extras:
+            for name in extra.SNAPSHOT_FIELDS:
+                kind = type(getattr(extra, name))
+                setattr(extra, name, kind(self._extra_values[offset]))
+                offset += 1
+        for (area, physics_updates, lod_time, tiers,
+             overlaps, contacts, ai_queue, ai_queued) in self._areas:
+            area._physics_updates = physics_updates
+            area._lod_time = dict(lod_time)
+            area._tiers = dict(tiers)
+            area._overlaps = set(overlaps)
+            area._contacts = dict((entity_id, dict(entity_contacts))
+                                  for entity_id, entity_contacts
+                                  in contacts.iteritems())
+            area._ai_queue = deque(ai_queue)
+            area._ai_queued = set(ai_queued)
+        if self._whole_world:
+            world._entity_id_max = self._entity_id_max
+        world.timers.now = self._time
+        random.setstate(self._random_state)
+        # The streams created since will start over from their seed.
+        streams = world._randoms
+        for name in streams.keys():
+            if name in self._random_streams:
+                streams[name].setstate(self._random_streams[name])
+            else:
+                del streams[name]
+
+
+def takeWorldSnapshot(world, extras=()):
+    """Return a Snapshot of all the entities and areas of the world.
+
+    `extras` are other objects with SNAPSHOT_FIELDS, like spawners.
+
+    """
+    entities = [world.entities[entity_id]
+                for entity_id in sorted(world.entities)]
+    areas = [world._areas[area_id] for area_id in sorted(world._areas)]
+    return Snapshot(world, entities, areas, extras, True)
+
+def takeAreaSnapshot(area, extras=()):
+    """Return a Snapshot of an area and of the entities it contains.
+
+    The entities created since the snapshot are destroyed on restore, but
+    only if they are in the area by then.
+
+    """
+    entities = [area.entities[entity_id]
+                for entity_id in sorted(area.entities.keys())]
+    return Snapshot(area.world, entities, [area], extras, False)
@@ -0,0 +1,94 @@
+#! /usr/bin/python
+"""Where new entities may appear.
+
+A spawner used to keep the floor tiles in a set, and to draw one with
+random.choice(list(coords)): thousands of tiles copied into a list for every
+fox.  Sometimes on top of another fox, and the collisions had to push them
+apart.
+
+A SpawnPointTable keeps the coordinates in a list, with the index of each
+one in a dictionary: drawing one is picking an index, removing one is moving
+the last one into its place.  Given the area, it skips the points where an
+entity already stands.
+
+"""
+from infiniworld.geometry import Vector
+
+
+class SpawnPointTable(object):
+    """A set of tile coordinates (x, y), with fast random draws.
+
+    It behaves like the set it replaces: add, discard, len, in, iteration.
+
+    """
+    # How many draws per point asked for before giving up, see sample.
+    TRIES = 8
+    def __init__(self, coords=()):
+        object.__init__(self)
+        self._coords = []
+        # {coord: index in self._coords}.
+        self._indexes = {}
+        for coord in coords:
+            self.add(coord)
+
+    def __len__(self):
+        return len(self._coords)
+    def __contains__(self, coord):
+        return coord in self._indexes
+    def __iter__(self):
+        return iter(self._coords)
+    def add(self, coord):
+        """A new point to spawn at, if it is not there yet."""
+        if coord not in self._indexes:
+            self._indexes[coord] = len(self._coords)
+            self._coords.append(coord)
+    def discard(self, coord):
+        """Nothing spawns there anymore, if it was there at all."""
+        index = self._indexes.pop(coord, None)
+        if index is None:
+            return
+        last = self._coords.pop()
+        if last != coord:
+            self._coords[index] = last
+            self._indexes[last] = index
+
+    def choice(self, rng):
+        """Return a random point, free or not.  IndexError if empty."""
+        return rng.choice(self._coords)
+    def isFree(self, coord, area, radius):
+        """True if an entity of that radius can stand there alone."""
+        pos = Vector(coord)
+        # Like AreaModel.detectCollisionsWithEntities: anybody overlapping us
+        # has its center closer than our radius plus the biggest one around.
+        # pylint: disable-msg=W0212
+        near = area.entity_map.getNear(pos,
+                                       radius + area._biggest_entity_radius)
+        for entity in near:
+            if (entity.exists and
+                entity.body.pos.dist(pos) < radius + entity.body.radius):
+                return False
+        return True
+    def sample(self, rng, count, area=None, radius=.5):
+        """Return up to `count` different random points.
+
+        With an area, the points where an entity of that radius would
+        overlap another one are skipped.  After TRIES * count draws it gives
+        up: a crowded area gets fewer points than asked.  The points are
+        not free from each other: keep the radius at most half a tile.
+
+        """
+        chosen = []
+        if not self._coords:
+            return chosen
+        taken = set()
+        for unused in xrange(self.TRIES * count):
+            coord = rng.choice(self._coords)
+            if coord in taken:
+                continue
+            if area is not None and not self.isFree(coord, area, radius):
+                continue
+            taken.add(coord)
+            chosen.append(coord)
+            if len(chosen) == count:
+                break
+        return chosen
@@ -5,6 +5,8 @@ A tile covers an entire 1 by 1 meter surface.  So a boulder is not a tile,
 a boulder is ON a tile.
 
 """
+import math
+
 import materials
 
 # Natural.
@@ -28,6 +30,24 @@ for _name, _value in globals().items():
         NATURES_FROM_ID[_value] = _name
         MATERIALS[_value] = getattr(materials, 'MATERIAL_%s' % _name)
 
+# A tile is packed in a single byte: the nature in the 7 low bits and the
+# height in the high bit.  NO_TILE marks the places where there is no tile at
+# all.  It would be a nature 127, which does not exist.
+HEIGHT_BIT = 0x80
+NATURE_MASK = 0x7f
+NO_TILE = 0xff
+assert max(NATURES_FROM_ID) < NATURE_MASK
+
+def packTile(nature, height):
+    """Return the byte representing a tile."""
+    if height:
+        return nature | HEIGHT_BIT
+    return nature
+
+def unpackTile(byte):
+    """Return the (nature, height) of a packed tile."""
+    return byte & NATURE_MASK, byte >> 7
+
 # pylint: disable-msg=R0903
 # Too few public methods.  Well, that's a dumb container, so yeah.
 class Tile(object):
@@ -47,22 +67,671 @@ class Tile(object):
     def __repr__(self):
         nature = 'NATURE_%s' % NATURES_FROM_ID[self.nature]
         return "%s(%s, %i)" % (self.__class__.__name__, nature, self.height)
+    def __eq__(self, other):
+        return (isinstance(other, Tile) and
+                self.makeSummary() == other.makeSummary())
+    def __ne__(self, other):
+        return not self == other
     def isSolid(self):
         """Solid tiles are subject to collision check."""
         return self.height == 1
     def makeSummary(self):
         """Serialization-friendly data for passing around in events."""
         return (self.nature, self.height)
+
+class TileView(Tile):
+    """A Tile that is in fact a byte in the buffer of a TileChunk.
+
+    The TileMap does not store Tile objects, they are way too big.  It makes
+    these views when someone asks for a tile.  Changing the nature or the
+    height of a view changes the tile map.
+
+    """
+    def __init__(self, tile_map, chunk, index):
+        # pylint: disable-msg=W0231
+        # Not calling Tile.__init__: nature and height are properties here.
+        object.__init__(self)
+        self._tile_map = tile_map
+        self._chunk = chunk
+        self._index = index
+    def _getNature(self):
+        """Return the nature of the tile."""
+        return self._chunk.data[self._index] & NATURE_MASK
+    def _setNature(self, nature):
+        """Change the nature of the tile in the chunk."""
+        self._tile_map.setPacked(self._chunk, self._index,
+                                 packTile(nature, self.height))
+    nature = property(_getNature, _setNature, None, "Nature of the tile.")
+    def _getHeight(self):
+        """Return the height of the tile."""
+        return self._chunk.data[self._index] >> 7
+    def _setHeight(self, height):
+        """Change the height of the tile in the chunk."""
+        self._tile_map.setPacked(self._chunk, self._index,
+                                 packTile(self.nature, height))
+    height = property(_getHeight, _setHeight, None, "Height of the tile.")
 # pylint: enable-msg=R0903
 
 
+class MemoryChunkStore(object):
+    """Where the evicted chunks of a TileMap go, in RAM.
+
+    A store has four methods: loadChunk(chunk_coord) returns what saveChunk
+    (chunk_coord, data) was given for these coordinates, or None if nothing
+    was ever saved there.  The data is the string of the packed tiles of the
+    chunk, see TileChunk.  hasChunk(chunk_coord) says if something was saved
+    there, without reading it.  iterChunks iterates over the (chunk_coord,
+    data) of everything that was saved.  See also areafile.AreaFile.
+
+    """
+    def __init__(self):
+        object.__init__(self)
+        self._chunks = {}
+    def __len__(self):
+        return len(self._chunks)
+    def loadChunk(self, chunk_coord):
+        """Return the data saved for the chunk, or None."""
+        return self._chunks.get(chunk_coord)
+    def hasChunk(self, chunk_coord):
+        """Was something saved for the chunk?"""
+        return chunk_coord in self._chunks
+    def saveChunk(self, chunk_coord, data):
+        """Remember the data of the chunk."""
+        self._chunks[chunk_coord] = data
+    def iterChunks(self):
+        """Iterate over the (chunk_coord, data) of the saved chunks."""
+        return self._chunks.iteritems()
+
+
+class TileChunk(object):
+    """A square of size * size tiles of a TileMap.
+
+    The tiles are packed bytes (see packTile) in a bytearray, row after row:
+    the tile (x, y) is at the index (x - x0) + (y - y0) * size, (x0, y0) being
+    the tile in the corner of the chunk with the smallest coordinates.
+
+    """
+    # There are a lot of chunks in a big map, and the dictionary of a normal
+    # object weights as much as the 256 bytes of tiles.
+    __slots__ = ('size', 'x0', 'y0', 'data', 'dirty', 'last_used', 'version')
+    def __init__(self, chunk_coord, size, data=None):
+        object.__init__(self)
+        self.size = size
+        self.x0 = chunk_coord[0] * size
+        self.y0 = chunk_coord[1] * size
+        if data is None:
+            self.data = bytearray(chr(NO_TILE) * (size * size))
+        else:
+            self.data = bytearray(data)
+        # Modified since it was generated or loaded: must be saved.
+        self.dirty = False
+        # Value of the clock of the TileMap when it was last used.
+        self.last_used = 0
+        # Value of the edit counter of the TileMap when it was last changed.
+        self.version = 0
+    @classmethod
+    def fromTiles(cls, chunk_coord, size, tiles):
+        """Return a chunk containing the {coord: Tile} dictionary."""
+        chunk = cls(chunk_coord, size)
+        for coord, tile in tiles.iteritems():
+            chunk.data[chunk.indexOf(coord)] = packTile(tile.nature,
+                                                        tile.height)
+        return chunk
+    def indexOf(self, (x, y)):
+        """Return the index of the tile in the buffer."""
+        return (x - self.x0) + (y - self.y0) * self.size
+    def makeData(self):
+        """Return the content in the format of the chunk stores."""
+        return str(self.data)
+    def iterBytes(self):
+        """Iterate over the (coord, byte) of the tiles that exist."""
+        size = self.size
+        x0 = self.x0
+        y0 = self.y0
+        for index, byte in enumerate(self.data):
+            if byte != NO_TILE:
+                yield (x0 + index % size, y0 + index // size), byte
+    def countTiles(self):
+        """Return the number of tiles that exist in the chunk."""
+        return len(self.data) - self.data.count(chr(NO_TILE))
+
+
+class TileAccess(object):
+    """The `tiles` attribute of a TileMap: looks like a dictionary.
+
+    It is indexed by tile coordinates and gives Tile objects.  Reading a
+    tile of a chunk that is not in memory loads or generates that chunk.
+
+    """
+    def __init__(self, tile_map):
+        object.__init__(self)
+        self._tile_map = tile_map
+    def __getitem__(self, coord):
+        return self._tile_map.getTile(coord)
+    def __setitem__(self, coord, tile):
+        self._tile_map.setTile(coord, tile)
+    def __contains__(self, coord):
+        try:
+            self._tile_map.getPacked(coord)
+        except KeyError:
+            return False
+        return True
+    def get(self, coord, default=None):
+        """Like dict.get."""
+        try:
+            return self._tile_map.getTile(coord)
+        except KeyError:
+            return default
+    def iteritems(self):
+        """Iterate over the tiles of the chunks that are in memory."""
+        for chunk in self._tile_map.getChunks():
+            for coord, unused in chunk.iterBytes():
+                yield coord, TileView(self._tile_map, chunk,
+                                      chunk.indexOf(coord))
+    def __len__(self):
+        return sum(chunk.countTiles()
+                   for chunk in self._tile_map.getChunks())
+
+
 class TileMap(object):
-    """A collection of tiles make a tile map."""
-    def __init__(self, tiles=None):
-        self.tiles = {} if tiles is None else tiles
+    """A collection of tiles make a tile map.
+
+    The tiles are grouped in square chunks.  A tile map can be finite: you
+    give it the tiles and that's all there is.  Or it can be infinite: you
+    give it a generator, a function (chunk_x, chunk_y, chunk_size) that
+    returns the tiles of that chunk: a dictionary {coord: Tile}, or directly
+    the packed bytes of the chunk (see TileChunk).  The chunks are generated
+    when something needs them: an entity walking there, an area preloading
+    what's around the player (see loadAround).
+
+    To keep the memory in check, give it a maximum number of chunks.  When
+    there are too many, those that were not used for the longest time are
+    evicted.  The chunks that were modified are written back to the store
+    first, so that they come back as they were.  The others are simply
+    generated again: the generator must always give the same chunk for the
+    same coordinates.  A generator that can do several chunks at once (on
+    other processes, for example) also has a method generateChunks(
+    chunk_coords, chunk_size) that returns {chunk_coord: tiles}: loadAround
+    gives it all the chunks it needs in one go.
+
+    Each tile takes a single byte in the chunks.  Everything is reached
+    through `tiles`, which looks like the dictionary {(x, y): Tile} it used
+    to be, and makes Tile views on demand.  Code that runs often should
+    prefer getPacked, isSolidAt and getNature, which don't make any.
+
+    The map remembers which tiles were changed (a door opening) until someone
+    takes the changes, see takeChanges.  Sending them is much cheaper than
+    sending the whole map again.
+
+    """
+    CHUNK_SIZE = 16
+    # Fraction of max_chunks we go down to when we evict.  Evicting a few
+    # chunks at once means we don't look for the oldest chunk all the time.
+    EVICT_TO = .9
+    def __init__(self, tiles=None, generator=None, store=None,
+                 max_chunks=None):
+        object.__init__(self)
+        self.generator = generator
+        self.store = MemoryChunkStore() if store is None else store
+        self.max_chunks = max_chunks
+        self._chunks = {}
+        self._clock = 0
+        # Incremented at every change, it gives the chunks their version.
+        self._edits = 0
+        # Called with the chunk coordinates when a chunk arrives in memory.
+        # The AreaModel uses that to tell the views.
+        self.chunk_loaded_callback = None
+        # Number of chunks the generator was asked for.  Each one is a hitch
+        # if it happens during a physics update, see prefetch.
+        self.generated_chunks = 0
+        # The changes nobody took yet: {chunk_coord: [version, {index: byte}]}.
+        self._changes = {}
+        self.tiles = TileAccess(self)
+        if tiles:
+            for coord, tile in tiles.iteritems():
+                self.setTile(coord, tile)
+            # That's the content of the map, not changes to it.
+            self._changes.clear()
+
+    def chunkCoordAt(self, (x, y)):
+        """Return the coordinates of the chunk containing the tile."""
+        size = self.CHUNK_SIZE
+        return x // size, y // size
+    def getChunks(self):
+        """Return the list of the chunks in memory."""
+        return self._chunks.values()
+    def getChunkCoords(self):
+        """Return the list of the coordinates of the chunks in memory."""
+        return self._chunks.keys()
+    def getChunkCoordsAround(self, pos, radius):
+        """Return the coordinates of the chunks within radius of pos.
+
+        In memory or not.  They cover the square around the position.
+
+        """
+        size = self.CHUNK_SIZE
+        # Tiles are centered on integer coordinates.
+        x_min = int(math.floor(pos.x - radius + .5)) // size
+        x_max = int(math.floor(pos.x + radius + .5)) // size
+        y_min = int(math.floor(pos.y - radius + .5)) // size
+        y_max = int(math.floor(pos.y + radius + .5)) // size
+        return [(chunk_x, chunk_y)
+                for chunk_x in xrange(x_min, x_max + 1)
+                for chunk_y in xrange(y_min, y_max + 1)]
+    def countChunksAround(self, radius):
+        """Return the most chunks getChunkCoordsAround gives for the radius."""
+        # 2 * radius + 1 tiles at most on a side, wherever the position.
+        span = int(math.ceil(2 * radius))
+        side = -(-span // self.CHUNK_SIZE) + 1
+        return side * side
+    def _getChunk(self, chunk_coord, create):
+        """Return the chunk, bringing it in memory if possible.
+
+        Return None if the chunk does not exist and `create` is False.
+
+        """
+        self._clock += 1
+        chunk = self._chunks.get(chunk_coord)
+        if chunk is None:
+            chunk = self._loadChunk(chunk_coord, create)
+            if chunk is None:
+                return None
+        chunk.last_used = self._clock
+        return chunk
+    def _loadChunk(self, chunk_coord, create):
+        """Load, generate or create a chunk that is not in memory."""
+        size = self.CHUNK_SIZE
+        data = self.store.loadChunk(chunk_coord)
+        if data is not None:
+            chunk = TileChunk(chunk_coord, size, data)
+        elif self.generator is not None:
+            tiles = self.generator(chunk_coord[0], chunk_coord[1], size)
+            self.generated_chunks += 1
+            chunk = self._makeChunk(chunk_coord, tiles)
+        elif create:
+            chunk = TileChunk(chunk_coord, size)
+        else:
+            return None
+        return self._addChunk(chunk_coord, chunk)
+    def _makeChunk(self, chunk_coord, tiles):
+        """Return a chunk with what a generator returned."""
+        if isinstance(tiles, dict):
+            return TileChunk.fromTiles(chunk_coord, self.CHUNK_SIZE, tiles)
+        return TileChunk(chunk_coord, self.CHUNK_SIZE, tiles)
+    def _addChunk(self, chunk_coord, chunk):
+        """Put in memory a chunk that was not there, and return it."""
+        # Used right now: the newest of all, before anything is evicted.
+        self._clock += 1
+        chunk.last_used = self._clock
+        self._edits += 1
+        chunk.version = self._edits
+        self._chunks[chunk_coord] = chunk
+        if self.max_chunks is not None and len(self._chunks) > self.max_chunks:
+            self.evict(chunk_coord)
+        if self.chunk_loaded_callback is not None:
+            self.chunk_loaded_callback(chunk_coord)
+        return chunk
+    def hasChunk(self, chunk_coord):
+        """Is the chunk in memory or in the store?  Nothing is loaded."""
+        return (chunk_coord in self._chunks or
+                self.store.hasChunk(chunk_coord))
+    def offerChunk(self, chunk_coord, tiles):
+        """Take a chunk that was generated elsewhere, if we don't have it.
+
+        The chunk in the store, if any, wins: it was modified.  Return True
+        if the chunk was taken.
+
+        """
+        if self.hasChunk(chunk_coord):
+            return False
+        self._addChunk(chunk_coord, self._makeChunk(chunk_coord, tiles))
+        return True
+    def evict(self, keep=None):
+        """Remove the least recently used chunks from memory.
+
+        The chunk at `keep` stays whatever its age: it is being loaded.
+
+        """
+        # Never all of them: somebody is using the last one.
+        target = max(1, int(self.max_chunks * self.EVICT_TO))
+        ages = sorted((chunk.last_used, chunk_coord)
+                      for chunk_coord, chunk in self._chunks.iteritems()
+                      if chunk_coord != keep)
+        for unused, chunk_coord in ages[:len(self._chunks) - target]:
+            chunk = self._chunks.pop(chunk_coord)
+            if chunk.dirty:
+                self.store.saveChunk(chunk_coord, chunk.makeData())
+    def setStore(self, store):
+        """Use another store.  What the old one had is copied to the new."""
+        for chunk_coord, data in self.store.iterChunks():
+            store.saveChunk(chunk_coord, data)
+        self.store = store
+    def flush(self):
+        """Write back all the modified chunks, keep them in memory."""
+        for chunk_coord, chunk in self._chunks.iteritems():
+            if chunk.dirty:
+                self.store.saveChunk(chunk_coord, chunk.makeData())
+                chunk.dirty = False
+
+    def _find(self, coord):
+        """Return the chunk containing the tile and the index of the tile.
+
+        Raise KeyError if there is no such tile.
+
+        """
+        size = self.CHUNK_SIZE
+        x, y = coord
+        chunk_x = x // size
+        chunk_y = y // size
+        chunk = self._chunks.get((chunk_x, chunk_y))
+        if chunk is None:
+            chunk = self._getChunk((chunk_x, chunk_y), False)
+            if chunk is None:
+                raise KeyError(coord)
+        else:
+            self._clock += 1
+            chunk.last_used = self._clock
+        index = (x - chunk_x * size) + (y - chunk_y * size) * size
+        if chunk.data[index] == NO_TILE:
+            raise KeyError(coord)
+        return chunk, index
+    def getPacked(self, coord):
+        """Return the packed byte of the tile.  KeyError if there's none."""
+        chunk, index = self._find(coord)
+        return chunk.data[index]
+    def getNature(self, coord):
+        """Return the nature of the tile.  KeyError if there's none."""
+        chunk, index = self._find(coord)
+        return chunk.data[index] & NATURE_MASK
+    def isSolidAt(self, coord):
+        """Is there a solid tile there?"""
+        try:
+            chunk, index = self._find(coord)
+        except KeyError:
+            return False
+        return chunk.data[index] & HEIGHT_BIT != 0
+    def getTile(self, coord):
+        """Return a view of the Tile there.  KeyError if there's none."""
+        chunk, index = self._find(coord)
+        return TileView(self, chunk, index)
+    def setPacked(self, chunk, index, byte):
+        """Change a packed tile of a chunk, and remember the change."""
+        if chunk.data[index] == byte:
+            return
+        chunk.data[index] = byte
+        chunk.dirty = True
+        self._edits += 1
+        chunk.version = self._edits
+        size = self.CHUNK_SIZE
+        chunk_coord = (chunk.x0 // size, chunk.y0 // size)
+        changes = self._changes.get(chunk_coord)
+        if changes is None:
+            changes = self._changes[chunk_coord] = [0, {}]
+        changes[0] = self._edits
+        changes[1][index] = byte
+    def setTile(self, coord, tile):
+        """Put a tile at these coordinates."""
+        chunk = self._getChunk(self.chunkCoordAt(coord), True)
+        self.setPacked(chunk, chunk.indexOf(coord),
+                       packTile(tile.nature, tile.height))
+    def takeChanges(self):
+        """Return the TileChanges since the last call, None if there's none."""
+        if not self._changes:
+            return None
+        chunks = dict((chunk_coord, (version, tiles))
+                      for chunk_coord, (version, tiles)
+                      in self._changes.iteritems())
+        self._changes = {}
+        return TileChanges(self.CHUNK_SIZE, chunks, self._edits)
+    def applyChanges(self, changes):
+        """Make the changes that were taken from another TileMap."""
+        if changes.chunk_size != self.CHUNK_SIZE:
+            raise ValueError("Chunk sizes differ: %r and %r." %
+                             (self.CHUNK_SIZE, changes.chunk_size))
+        for chunk_coord, unused, tiles in changes.iterChunks():
+            chunk = self._getChunk(chunk_coord, True)
+            for index, byte in tiles.iteritems():
+                self.setPacked(chunk, index, byte)
+    def loadAround(self, pos, radius):
+        """Make sure the chunks around the position are in memory.
+
+        Only does something for infinite maps.
+
+        """
+        if self.generator is None:
+            return
+        chunk_coords = self.getChunkCoordsAround(pos, radius)
+        missing = [chunk_coord for chunk_coord in chunk_coords
+                   if chunk_coord not in self._chunks]
+        if len(missing) > 1 and hasattr(self.generator, 'generateChunks'):
+            self._loadChunks(missing)
+        for chunk_coord in chunk_coords:
+            self._getChunk(chunk_coord, True)
+    def _loadChunks(self, chunk_coords):
+        """Load or generate several chunks, the generator does them at once."""
+        to_generate = []
+        for chunk_coord in chunk_coords:
+            data = self.store.loadChunk(chunk_coord)
+            if data is None:
+                to_generate.append(chunk_coord)
+            else:
+                self._addChunk(chunk_coord,
+                               TileChunk(chunk_coord, self.CHUNK_SIZE, data))
+        generated = self.generator.generateChunks(to_generate,
+                                                  self.CHUNK_SIZE)
+        self.generated_chunks += len(to_generate)
+        for chunk_coord in to_generate:
+            self._addChunk(chunk_coord,
+                           self._makeChunk(chunk_coord,
+                                           generated[chunk_coord]))
+
+    def makeChunkSummary(self, chunk_coord):
+        """Return a TileMapSummary of one chunk in memory."""
+        chunk = self._chunks[chunk_coord]
+        return TileMapSummary(self.CHUNK_SIZE,
+                              {chunk_coord: (buffer(chunk.data),
+                                             chunk.version)})
     def makeSummary(self):
-        """Serialization-friendly data for passing around in events."""
-        summary = {}
-        for coord, tile in self.tiles.iteritems():
-            summary[coord] = tile.makeSummary()
-        return summary
+        """Return a TileMapSummary of the chunks in memory.  No copy."""
+        chunks = dict((chunk_coord, (buffer(chunk.data), chunk.version))
+                      for chunk_coord, chunk in self._chunks.iteritems())
+        return TileMapSummary(self.CHUNK_SIZE, chunks)
+    @classmethod
+    def fromGrid(cls, (x0, y0), width, packed):
+        """Return a finite TileMap with a rectangle of packed tiles.
+
+        `packed` has the packed bytes of the tiles row after row, starting
+        with (x0, y0).  The rows are `width` tiles long.  The rows are copied
+        in the chunks by slices: that's how generators make big maps fast.
+
+        """
+        tile_map = cls()
+        size = tile_map.CHUNK_SIZE
+        for y in xrange(y0, y0 + len(packed) // width):
+            start = (y - y0) * width
+            x = x0
+            while x < x0 + width:
+                end = min((x // size + 1) * size, x0 + width)
+                chunk = tile_map._getChunk(tile_map.chunkCoordAt((x, y)),
+                                           True)
+                index = chunk.indexOf((x, y))
+                row = packed[start + x - x0:start + end - x0]
+                chunk.data[index:index + end - x] = row
+                # It could not be generated again if it was evicted.
+                chunk.dirty = True
+                x = end
+        return tile_map
+    @classmethod
+    def fromSummary(cls, summary):
+        """Return a finite TileMap with a copy of the tiles of a summary."""
+        tile_map = cls()
+        tile_map.CHUNK_SIZE = summary.chunk_size
+        for chunk_coord, data in summary.iterChunks():
+            tile_map._chunks[chunk_coord] = TileChunk(chunk_coord,
+                                                      summary.chunk_size,
+                                                      data)
+        return tile_map
+
+
+class TileChanges(object):
+    """The tiles that changed in a TileMap, to patch the copies of the map.
+
+    For each chunk, it has the version of the chunk after the changes, and
+    the new packed bytes of the tiles that changed, by index in the chunk (see
+    TileChunk).  A door opening costs a few bytes, not the whole map.
+
+    """
+    def __init__(self, chunk_size, chunks, version):
+        object.__init__(self)
+        self.chunk_size = chunk_size
+        # {chunk_coord: (version, {index: byte})}
+        self._chunks = chunks
+        # The version of the tile map when the changes were taken: all the
+        # chunks are at most that recent.
+        self.version = version
+    def __len__(self):
+        return sum(len(tiles) for unused, tiles in self._chunks.itervalues())
+    def iterChunks(self):
+        """Iterate over the (chunk_coord, version, {index: byte})."""
+        for chunk_coord, (version, tiles) in self._chunks.iteritems():
+            yield chunk_coord, version, tiles
+    def iteritems(self):
+        """Iterate over the (coord, (nature, height)) of the changed tiles."""
+        size = self.chunk_size
+        for (chunk_x, chunk_y), (unused, tiles) in self._chunks.iteritems():
+            for index, byte in tiles.iteritems():
+                yield ((chunk_x * size + index % size,
+                        chunk_y * size + index // size),
+                       (byte & NATURE_MASK, byte >> 7))
+
+
+def patchChunk(data, tiles):
+    """Return a buffer on a copy of the chunk bytes with the new tiles."""
+    data = bytearray(data)
+    for index, byte in tiles.iteritems():
+        data[index] = byte
+    return buffer(data)
+
+def rebuildSummary(chunk_size, chunk_coords, versions, blob):
+    """Unpickle a TileMapSummary.  The chunks are slices of the blob."""
+    length = chunk_size * chunk_size
+    chunks = {}
+    for index, chunk_coord in enumerate(chunk_coords):
+        chunks[chunk_coord] = (buffer(blob, index * length, length),
+                               versions[index])
+    return TileMapSummary(chunk_size, chunks)
+
+class TileMapSummary(object):
+    """What the views need to know of a TileMap, without copying it.
+
+    It is a collection of read-only buffers on the bytes of the chunks of the
+    tile map (see TileChunk), with their versions.  Making one does not copy
+    the tiles, and views can share it.  It is indexed like the tiles of a
+    TileMap, but gives (nature, height) tuples.
+
+    The buffers see the changes of the tile map: the versions tell which
+    chunks changed since.  When it has to go to another process, it is
+    pickled as a single string with all the chunks.
+
+    """
+    def __init__(self, chunk_size, chunks=None):
+        object.__init__(self)
+        self.chunk_size = chunk_size
+        # {chunk_coord: (buffer, version)}
+        self._chunks = {} if chunks is None else chunks
+    def __reduce__(self):
+        chunk_coords = sorted(self._chunks)
+        versions = [self._chunks[chunk_coord][1]
+                    for chunk_coord in chunk_coords]
+        blob = ''.join([str(self._chunks[chunk_coord][0])
+                        for chunk_coord in chunk_coords])
+        return rebuildSummary, (self.chunk_size, chunk_coords, versions, blob)
+    def __len__(self):
+        return sum(len(data) - data[:].count(chr(NO_TILE))
+                   for data, unused in self._chunks.itervalues())
+    def __getitem__(self, (x, y)):
+        size = self.chunk_size
+        chunk_x = x // size
+        chunk_y = y // size
+        try:
+            data = self._chunks[(chunk_x, chunk_y)][0]
+        except KeyError:
+            raise KeyError((x, y))
+        byte = ord(data[(x - chunk_x * size) + (y - chunk_y * size) * size])
+        if byte == NO_TILE:
+            raise KeyError((x, y))
+        return byte & NATURE_MASK, byte >> 7
+    def __contains__(self, coord):
+        try:
+            self[coord]
+        except KeyError:
+            return False
+        return True
+    def get(self, coord, default=None):
+        """Like dict.get."""
+        try:
+            return self[coord]
+        except KeyError:
+            return default
+    def getVersion(self, chunk_coord):
+        """Return the version of a chunk, None if it's not in there."""
+        try:
+            return self._chunks[chunk_coord][1]
+        except KeyError:
+            return None
+    def iterChunks(self):
+        """Iterate over the (chunk_coord, buffer) of the chunks."""
+        for chunk_coord, (data, unused) in self._chunks.iteritems():
+            yield chunk_coord, data
+    def iteritems(self):
+        """Iterate over the (coord, (nature, height)) of the tiles."""
+        size = self.chunk_size
+        for (chunk_x, chunk_y), (data, unused) in self._chunks.iteritems():
+            x0 = chunk_x * size
+            y0 = chunk_y * size
+            for index, char in enumerate(data):
+                byte = ord(char)
+                if byte != NO_TILE:
+                    yield ((x0 + index % size, y0 + index // size),
+                           (byte & NATURE_MASK, byte >> 7))
+    def copy(self):
+        """Return another summary on the same buffers.  Cheap."""
+        return TileMapSummary(self.chunk_size, dict(self._chunks))
+    def clear(self):
+        """Forget all the chunks."""
+        self._chunks.clear()
+    def update(self, other):
+        """Take the chunks of the other summary that are more recent."""
+        if not self._chunks:
+            self.chunk_size = other.chunk_size
+        elif other.chunk_size != self.chunk_size:
+            raise ValueError("Chunk sizes differ: %r and %r." %
+                             (self.chunk_size, other.chunk_size))
+        for chunk_coord, (data, version) in other._chunks.iteritems():
+            mine = self._chunks.get(chunk_coord)
+            if mine is None or mine[1] < version:
+                self._chunks[chunk_coord] = (data, version)
+    def applyChanges(self, changes):
+        """Patch the chunks we have with a TileChanges.
+
+        The chunks we don't have are not our business: they'll come whole if
+        they must.  The buffers of the tile map in this process already show
+        the changes, only their versions change.  The others, like those that
+        came from another process, are replaced by a patched copy of the chunk.
+
+        """
+        if not self._chunks:
+            return
+        if changes.chunk_size != self.chunk_size:
+            raise ValueError("Chunk sizes differ: %r and %r." %
+                             (self.chunk_size, changes.chunk_size))
+        for chunk_coord, version, tiles in changes.iterChunks():
+            mine = self._chunks.get(chunk_coord)
+            if mine is None or mine[1] >= version:
+                continue
+            data = mine[0]
+            for index, byte in tiles.iteritems():
+                if ord(data[index]) != byte:
+                    data = patchChunk(data, tiles)
+                    break
+            self._chunks[chunk_coord] = (data, version)
@@ -3,12 +3,15 @@
 
 """
 # Standard library.
+import hashlib
 import logging
+import random
 # My stuff.
 import events
 from entity import EntityModel
 from area import AreaModel
 from infiniworld.evtman import SingleListener
+from infiniworld.timers import TimerWheel
 
 LOGGER = logging.getLogger('world')
 
@@ -62,20 +65,62 @@ def nextThing(things, thing, offset):
 class WorldModel(SingleListener):
     """The unique and authoritative top-level representation of the game world.
 
+    Give it a seed and it becomes deterministic: two worlds with the same seed
+    and the same inputs evolve exactly the same.  For that:
+
+    * the areas do everything in the order of the entity ids, and their
+      entity maps return sorted lists instead of sets,
+    * the random numbers come from streams seeded by the world, see
+      getRandom,
+    * the event manager must be created with ordered=True, so that the
+      listeners receive the events in the order they registered.
+
     """
-    def __init__(self, event_manager):
+    # How many dead entities of each class are kept for reuse.
+    POOL_SIZE = 64
+    def __init__(self, event_manager, seed=None):
         SingleListener.__init__(self, event_manager)
+        self.seed = seed
+        self.deterministic = seed is not None
+        self._randoms = {}
         self._entity_id_max = -1
         self.entities = {}
         self._area_id_max = -1
         self._areas = {}
+        # {entity class: [dead entities]}, see createEntity.
+        self._pools = {}
+        # The clock of the game, and the timers waiting for it.
+        self.timers = TimerWheel(event_manager)
     def unregister(self):
         """Also unregisters its content."""
         for area in self._areas.values():
             area.unregister()
         for entity in self.entities.values():
             entity.unregister()
+        for pool in self._pools.itervalues():
+            for entity in pool:
+                entity.unregister()
+        self._pools = {}
+        self.timers.unregister()
         SingleListener.unregister(self)
+    def getRandom(self, name):
+        """Return the random number generator to use for that purpose.
+
+        Each purpose ('ai', 'spawn'...) has its own stream, so that drawing
+        more numbers for one doesn't change what the others get.  The
+        streams are seeded from the seed of the world and the name.
+
+        A world without a seed just returns the random module.
+
+        """
+        if self.seed is None:
+            return random
+        stream = self._randoms.get(name)
+        if stream is None:
+            digest = hashlib.sha1("%r/%s" % (self.seed, name)).hexdigest()
+            stream = random.Random(int(digest, 16))
+            self._randoms[name] = stream
+        return stream
     def createArea(self):
         """Create a new area."""
         self._area_id_max += 1
@@ -83,21 +128,73 @@ class WorldModel(SingleListener):
         area = AreaModel(self._event_manager, self, area_id)
         self._areas[area_id] = area
         return area
-    def createEntity(self, factory):
-        """Populate the world with a new entity."""
+    def newEntityId(self):
+        """Return an entity_id that has never been used."""
         self._entity_id_max += 1
-        entity_id = self._entity_id_max
-        entity = factory(self._event_manager, entity_id)
+        return self._entity_id_max
+    def createEntity(self, factory):
+        """Populate the world with a new entity.
+
+        If the class is POOLED and an entity of that class was destroyed, that
+        one is reset and comes back with the new entity_id.  It is still
+        registered: that's the expensive part of a new entity.
+
+        """
+        entity_id = self.newEntityId()
+        pool = self._pools.get(factory)
+        if pool:
+            entity = pool.pop()
+            entity.reset(entity_id)
+        else:
+            entity = factory(self._event_manager, entity_id)
         self.entities[entity_id] = entity
         return entity
     def destroyEntity(self, entity):
-        """Remove an entity from the world, forever."""
-        del self.entities[entity.entity_id]
+        """Remove an entity from the world, forever.
+
+        Forever for its entity_id.  The object itself may go to the pool of
+        its class, see createEntity.  It stays registered but has no
+        entity_id and no area, so it does not react to anything.
+
+        """
+        entity_id = entity.entity_id
+        del self.entities[entity_id]
+        area = entity.area
+        if area:
+            area.removeEntity(entity)
+        pool = self._pools.setdefault(entity.__class__, [])
+        if entity.POOLED and len(pool) < self.POOL_SIZE:
+            entity.exists = False
+            entity.entity_id = None
+            pool.append(entity)
+        else:
+            entity.unregister()
+        self.post(events.EntityDestroyedEvent(entity_id))
+    def exportEntity(self, entity_id):
+        """Take an entity out of the world so that it can go to another one.
+
+        The entity leaves its area, stops listening to its event manager and
+        can be pickled.  Nobody is told it's destroyed: it still exists,
+        elsewhere.  See importEntity.
+
+        """
+        entity = self.entities.pop(entity_id)
         area = entity.area
         if area:
             area.removeEntity(entity)
         entity.unregister()
-        self.post(events.EntityDestroyedEvent(entity.entity_id))
+        return entity
+    def importEntity(self, entity, area_id):
+        """Welcome an entity exported from another world, in that area.
+
+        The entity keeps its entity_id: the worlds exchanging entities must
+        make sure their ids don't clash.
+
+        """
+        entity.register(self._event_manager)
+        self.entities[entity.entity_id] = entity
+        if area_id is not None:
+            self._areas[area_id].addEntity(entity)
     def moveEntityToArea(self, entity_id, area_id_new):
         """Move the entity to the new area.
 
@@ -50,6 +50,20 @@ def rk4(x, v, a, dt):
 
     return xf, vf
 
+def rk2(x, v, a, dt):
+    """Same as rk4, but with the midpoint method.
+
+    Half the evaluations of the acceleration, and a lot less precise.  Good
+    enough for what's happening far away from the player.
+
+    """
+    a1 = a(x, v, 0)
+    v2 = v + 0.5 * a1 * dt
+    a2 = a(x + 0.5 * v * dt, v2, dt / 2)
+    xf = x + dt * v2
+    vf = v + dt * a2
+    return xf, vf
+
 
 
 class Particle(object):
@@ -78,7 +92,9 @@ class Particle(object):
         # And the rest.
         self.pos = pos
         self.vel = Vector()
-        self.forces = set()
+        # A list and not a set: the forces are summed in the order they were
+        # added, so the rounding errors are the same from one run to the next.
+        self.forces = []
 
     def __repr__(self):
         return "%s(id=0x%x, pos=%r, vel=%r)" % (self.__class__.__name__,
@@ -92,14 +108,14 @@ class Particle(object):
             total_force += force(pos, vel, dt)
         return total_force * self.one_over_mass
 
-    def integrate(self, dt):
+    def integrate(self, dt, integrator=rk4):
         """Return the position and speed for the next dt.
 
         This is not directly applied to the particle since collisions are
         expected to happen along the way.
 
         """
-        return rk4(self.pos, self.vel, self.accel, dt)
+        return integrator(self.pos, self.vel, self.accel, dt)
 
 # pylint: disable-msg=R0903
 # Too few public methods.  They're just dumb calculators, they don't need
@@ -141,6 +157,21 @@ class KineticFrictionForce(object):
 
 # pylint: enable-msg=R0903
 
+# Collision layers.  Every body lives on one (or several) layers, and its mask
+# says which layers it wants to interact with.  Two bodies interact only if
+# each of them is on a layer the other one is interested in.  This is checked
+# with a couple of bitwise ands, long before any distance is computed.  The
+# engine only needs the terrain layer and a default one, the games define
+# their own layers with the remaining bits.
+LAYER_NONE = 0
+LAYER_TERRAIN = 1 << 0
+LAYER_DEFAULT = 1 << 1
+LAYER_ALL = 0xffffffff
+
+def interact(body1, body2):
+    """Are the layers and masks of the two bodies compatible?"""
+    return bool(body1.layer & body2.mask and body2.layer & body1.mask)
+
 # In infiniworld, all the entities are circle.  Therefore we only have to check
 # collisions between a circle and something else.
 
@@ -165,6 +196,10 @@ class Collision(object):
         # This is usef to signal the collidee that the collider bumped into it.
         # Leave to None if the collidee is not an entity.
         self.entity = entity
+        # Whoever detects the collision can put something identifying the
+        # collidee here (an entity id, a tile coordinate...) to remember the
+        # contact for the next time step.
+        self.contact_key = None
     def __str__(self):
         return "\n".join((self.__class__.__name__,
                           "    distance: %r" % self.distance,
@@ -186,17 +221,36 @@ class Collision(object):
         self.collidee.vel = vdee
 
 class Body(Particle):
-    """A body has a material and can be solid."""
-    def __init__(self, mass, pos, solid, material):
+    """A body has a material and can be solid.
+
+    It also has collision layer and mask bitfields, see `interact`.
+
+    """
+    def __init__(self, mass, pos, solid, material,
+                 layer=LAYER_DEFAULT, mask=LAYER_ALL):
         Particle.__init__(self, mass, pos)
         self.solid = solid
         self.material = material
+        self.layer = layer
+        self.mask = mask
 
 class CircularBody(Body):
     """A physical body represented by a circle for collision purposes."""
-    def __init__(self, mass, pos, solid, material, radius):
-        Body.__init__(self, mass, pos, solid, material)
+    def __init__(self, mass, pos, solid, material, radius,
+                 layer=LAYER_DEFAULT, mask=LAYER_ALL):
+        Body.__init__(self, mass, pos, solid, material, layer, mask)
         self.radius = radius
+    def overlapsCircle(self, other):
+        """Do the two circles overlap?
+
+        Cheaper than collidesCircle: no square root, no Collision object.  Used
+        by the triggers, which do not need to be pushed back.
+
+        """
+        d_x = other.pos.x - self.pos.x
+        d_y = other.pos.y - self.pos.y
+        radii = self.radius + other.radius
+        return d_x * d_x + d_y * d_y < radii * radii
     def collidesCircle(self, collider):
         """Is the circular `collider` colliding self?"""
         # If the distance between the centers is smaller than the sum of the
@@ -234,8 +288,9 @@ class RectangularBody(Body):
     rectangle.
 
     """
-    def __init__(self, mass, pos, solid, material, size_x, size_y):
-        Body.__init__(self, mass, pos, solid, material)
+    def __init__(self, mass, pos, solid, material, size_x, size_y,
+                 layer=LAYER_TERRAIN, mask=LAYER_ALL):
+        Body.__init__(self, mass, pos, solid, material, layer, mask)
         self.size_x = size_x
         self.size_y = size_y
     def _withCorner(self, corner, collider):
@@ -0,0 +1,374 @@
+#! /usr/bin/python
+"""AreaModel test suite.
+
+"""
+import time
+import unittest
+
+from infiniworld.evtman import EventManager, SingleListener
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld import physics
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes.  ----------
+
+class SensorModel(EntityModel):
+    """Remembers who walked on it."""
+    SOLID = False
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.triggered_by = []
+    def reactToTrigger(self, entity):
+        self.triggered_by.append(entity.entity_id)
+
+class GhostModel(EntityModel):
+    """Walks through the other entities, and through walls."""
+    COLLISION_LAYER = 1 << 5
+    COLLISION_MASK = 1 << 5
+
+class ThinkerModel(EntityModel):
+    """Remembers when it thought."""
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.thoughts = []
+    def runAI(self, timestep):
+        self.thoughts.append(timestep)
+
+class WatcherModel(EntityModel):
+    """Counts the times it looked around, slowly."""
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.looks = 0
+    def perceive(self):
+        self.looks += 1
+        # Slow enough to blow any budget.
+        start = time.time()
+        while time.time() - start < .002:
+            pass
+
+class BumpedModel(EntityModel):
+    """Counts who bumps into it."""
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.bumped_by = []
+    def reactToCollision(self, collider):
+        self.bumped_by.append(collider.entity_id)
+
+class HeavyModel(EntityModel):
+    """Four times harder to push."""
+    BODY_MASS = 4
+
+class EventRecorder(SingleListener):
+    """Keeps the events we care about."""
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.events = []
+    def onTriggerEnteredEvent(self, event):
+        self.events.append(event)
+    def onAreaAttackEvent(self, event):
+        self.events.append(event)
+
+#----------  Test suite.  ----------
+
+class AreaTestCase(unittest.TestCase):
+    """Creates a world with an empty area."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+
+    def createEntity(self, factory, pos):
+        entity = self.world.createEntity(factory)
+        entity.body.pos = Vector(pos)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        return entity
+
+class TestTriggers(AreaTestCase):
+    """Test the trigger pass of AreaModel."""
+    def testEnter(self):
+        """A sensor reacts once when an entity walks on it."""
+        recorder = EventRecorder(self.event_manager)
+        sensor = self.createEntity(SensorModel, (0, 0))
+        walker = self.createEntity(EntityModel, (3, 0))
+        self.area.runPhysics(.05)
+        self.assertEquals(sensor.triggered_by, [])
+        walker.body.pos = Vector(.5, 0)
+        self.area.entity_map.move(walker)
+        self.area.runPhysics(.05)
+        self.area.runPhysics(.05)
+        self.assertEquals(sensor.triggered_by, [walker.entity_id])
+        self.event_manager.pump()
+        self.assertEquals([(event.sensor_id, event.entity_id)
+                           for event in recorder.events],
+                          [(sensor.entity_id, walker.entity_id)])
+
+    def testLeaveAndEnterAgain(self):
+        """A sensor reacts again when the entity comes back."""
+        sensor = self.createEntity(SensorModel, (0, 0))
+        walker = self.createEntity(EntityModel, (.5, 0))
+        self.area.runPhysics(.05)
+        walker.body.pos = Vector(5, 0)
+        self.area.entity_map.move(walker)
+        self.area.runPhysics(.05)
+        walker.body.pos = Vector(.5, 0)
+        self.area.entity_map.move(walker)
+        self.area.runPhysics(.05)
+        self.assertEquals(sensor.triggered_by, [walker.entity_id] * 2)
+
+    def testSensorsDoNotCollide(self):
+        """Solid entities walk through sensors without bouncing."""
+        self.createEntity(SensorModel, (0, 0))
+        walker = self.createEntity(EntityModel, (.5, 0))
+        walker.body.vel = Vector(-1, 0)
+        self.area.runPhysics(.05)
+        self.assertTrue(walker.body.vel.x < 0)
+        self.assertTrue(walker.body.pos.x < .5)
+
+class TestLayers(AreaTestCase):
+    """Test the collision layers and masks."""
+    def testInteract(self):
+        """physics.interact needs both bodies to agree."""
+        entity = self.createEntity(EntityModel, (0, 0))
+        ghost = self.createEntity(GhostModel, (5, 0))
+        # The entity is interested in every layer, but the ghost is not
+        # interested in the default layer.
+        self.assertFalse(physics.interact(entity.body, ghost.body))
+        ghost.body.mask |= physics.LAYER_DEFAULT
+        self.assertTrue(physics.interact(entity.body, ghost.body))
+        entity.body.mask = physics.LAYER_DEFAULT
+        self.assertFalse(physics.interact(entity.body, ghost.body))
+
+    def testFilteredPairsDoNotCollide(self):
+        """Entities on layers they don't care about don't collide."""
+        entity = self.createEntity(EntityModel, (0, 0))
+        ghost = self.createEntity(GhostModel, (.5, 0))
+        self.assertEquals(self.area.detectCollisionsWithEntities(entity),
+                          set())
+        self.assertEquals(self.area.detectCollisionsWithEntities(ghost),
+                          set())
+        other = self.createEntity(EntityModel, (-.5, 0))
+        collisions = self.area.detectCollisionsWithEntities(entity)
+        self.assertEquals([collision.entity for collision in collisions],
+                          [other])
+
+    def testGhostsIgnoreTerrain(self):
+        """Entities without the terrain layer in their mask ignore tiles."""
+        from infiniworld.models import tile
+        self.area.tile_map.tiles[(0, 0)] = tile.Tile(tile.NATURE_STONE, 1)
+        entity = self.createEntity(EntityModel, (.6, 0))
+        ghost = self.createEntity(GhostModel, (-.6, 0))
+        self.assertEquals(len(self.area.detectCollisionsWithTiles(entity)), 1)
+        self.assertEquals(self.area.detectCollisionsWithTiles(ghost), set())
+
+class TestContacts(AreaTestCase):
+    """Test the persistent contacts."""
+    def setUp(self):
+        AreaTestCase.setUp(self)
+        from infiniworld.models import tile
+        self.area.tile_map.tiles[(1, 0)] = tile.Tile(tile.NATURE_STONE, 1)
+
+    def testContactWithWallIsRemembered(self):
+        """Pushing against a wall leaves a contact with its tile."""
+        entity = self.createEntity(EntityModel, (0, 0))
+        entity._walk_force.vector = Vector(10, 0)
+        contacts = []
+        for unused in xrange(20):
+            self.area.runPhysics(.05)
+            # The wall holds.
+            self.assertTrue(entity.body.pos.x <= 1e-6)
+            contacts.append(self.area._contacts.get(entity.entity_id, {}))
+            # It bounces a bit, so it does not touch the wall all the time,
+            # but that's not long enough to be forgotten.
+            self.assertEquals(contacts[-1].keys(), [(1, 0)])
+
+    def testContactIsForgotten(self):
+        """Contacts that don't touch anymore are forgotten."""
+        entity = self.createEntity(EntityModel, (0, 0))
+        entity._walk_force.vector = Vector(10, 0)
+        for unused in xrange(5):
+            self.area.runPhysics(.05)
+        entity._walk_force.vector = Vector(-10, 0)
+        for unused in xrange(10):
+            self.area.runPhysics(.05)
+        self.assertFalse(entity.entity_id in self.area._contacts)
+
+    def testContactWithEntity(self):
+        """Entities pushing each other remember each other."""
+        pusher = self.createEntity(EntityModel, (-2, 0))
+        pushed = self.createEntity(EntityModel, (-1, 0))
+        pusher._walk_force.vector = Vector(10, 0)
+        for unused in xrange(10):
+            self.area.runPhysics(.05)
+        self.assertTrue(pusher.body.pos.dist(pushed.body.pos) >= 1 - 1e-6)
+        self.assertTrue(pushed.entity_id in
+                        self.area._contacts.get(pusher.entity_id, ()))
+        self.world.destroyEntity(pushed)
+        for unused in xrange(5):
+            self.area.runPhysics(.05)
+        self.assertFalse(pushed.entity_id in
+                         self.area._contacts.get(pusher.entity_id, ()))
+
+    def testReactOncePerUpdate(self):
+        """A known contact found again and again reacts once per update."""
+        pusher = self.createEntity(EntityModel, (-1, 0))
+        pusher._walk_force.vector = Vector(200, 0)
+        # Against the wall, it does not move.
+        pinned = self.createEntity(BumpedModel, (0, 0))
+        for unused in xrange(5):
+            # Fast enough to cut the time step in pieces, each of them
+            # touching the pinned entity again.
+            pusher.body.vel = Vector(30, 0)
+            self.area.runPhysics(.05)
+        self.assertEquals(pinned.bumped_by, [pusher.entity_id] * 5)
+        self.assertTrue(pinned.entity_id in
+                        self.area._contacts[pusher.entity_id])
+
+class TestLevelOfDetail(AreaTestCase):
+    """Test the simulation tiers."""
+    def testNoInterestPoint(self):
+        """Without interest points, everybody is simulated every time."""
+        thinker = self.createEntity(ThinkerModel, (1000, 0))
+        for unused in xrange(6):
+            self.area.runPhysics(.05)
+        self.assertEquals(thinker.thoughts, [.05] * 6)
+
+    def testFarEntitiesAccumulateTime(self):
+        """Far entities are simulated less often, but nothing is lost."""
+        self.area.setInterestPoint('camera', Vector(0, 0))
+        near = self.createEntity(ThinkerModel, (1, 0))
+        far = self.createEntity(ThinkerModel, (1000, 0))
+        far.body.vel = Vector(1, 0)
+        for unused in xrange(12):
+            self.area.runPhysics(.05)
+        self.assertEquals(len(near.thoughts), 12)
+        period = self.area.LOD_TIERS[-1][1]
+        self.assertEquals(len(far.thoughts), 12 // period)
+        # Depending on its entity_id, it may still be waiting for its turn.
+        waiting = self.area._lod_time[far.entity_id]
+        self.assertTrue(waiting < period * .05)
+        self.assertAlmostEquals(sum(far.thoughts) + waiting, .6)
+        # There is no friction outside of the tile map.
+        self.assertAlmostEquals(far.body.pos.x, 1000 + sum(far.thoughts))
+
+    def testCatchUpWhenComingCloser(self):
+        """An entity entering a better tier is simulated right away."""
+        far = self.createEntity(ThinkerModel, (1000, 0))
+        self.area.setInterestPoint('camera', Vector(0, 0))
+        for unused in xrange(5):
+            self.area.runPhysics(.05)
+        thought = sum(far.thoughts)
+        self.area.setInterestPoint('camera', Vector(1000, 0))
+        self.area.runPhysics(.05)
+        self.assertAlmostEquals(sum(far.thoughts), .3)
+        self.assertTrue(sum(far.thoughts) > thought)
+
+    def testControlledEntityIsAnInterestPoint(self):
+        """The entity controlled by the player is an interest point."""
+        from infiniworld.models import events
+        controlled = self.createEntity(ThinkerModel, (1000, 0))
+        far = self.createEntity(ThinkerModel, (0, 0))
+        self.event_manager.post(events.ControlEntityEvent(
+            controlled.entity_id))
+        self.event_manager.pump()
+        for unused in xrange(6):
+            self.area.runPhysics(.05)
+        self.assertEquals(len(controlled.thoughts), 6)
+        self.assertTrue(len(far.thoughts) < 6)
+
+class TestPerception(AreaTestCase):
+    """Test the scheduling of the expensive part of the AI."""
+    def testBuckets(self):
+        """Everybody perceives once every AI_BUCKETS updates."""
+        self.area.AI_BUDGET = 1
+        watchers = [self.createEntity(WatcherModel, (index * 2, 0))
+                    for index in xrange(6)]
+        buckets = self.area.AI_BUCKETS
+        for unused in xrange(buckets):
+            self.area.runPhysics(.05)
+        self.assertEquals([watcher.looks for watcher in watchers], [1] * 6)
+        # Not all during the same update.
+        self.area.runPhysics(.05)
+        self.assertEquals(sum(watcher.looks for watcher in watchers), 8)
+
+    def testBudget(self):
+        """What does not fit in the budget is done at the next update."""
+        self.area.AI_BUCKETS = 1
+        self.area._ai_buckets = [set()]
+        self.area.AI_BUDGET = .003
+        watchers = [self.createEntity(WatcherModel, (index * 2, 0))
+                    for index in xrange(6)]
+        self.area.runPhysics(.05)
+        looks = sum(watcher.looks for watcher in watchers)
+        self.assertTrue(0 < looks < 6)
+        self.assertEquals(len(self.area._ai_queue), 6 - looks)
+        for unused in xrange(6):
+            self.area.runPhysics(.05)
+        # Those who waited went first, nobody was forgotten or queued twice.
+        self.assertTrue(min(watcher.looks for watcher in watchers) >= 1)
+        self.assertTrue(len(self.area._ai_queue) <= 6)
+
+    def testLeftArea(self):
+        """An entity that leaves while waiting is skipped."""
+        self.area.AI_BUCKETS = 1
+        self.area._ai_buckets = [set()]
+        self.area.AI_BUDGET = 0
+        watchers = [self.createEntity(WatcherModel, (index * 2, 0))
+                    for index in xrange(2)]
+        # One at a time: the second one waits.
+        self.area.runPhysics(.05)
+        self.assertEquals([watcher.looks for watcher in watchers], [1, 0])
+        self.world.moveEntityToArea(watchers[1].entity_id, None)
+        for unused in xrange(2):
+            self.area.runPhysics(.05)
+        self.assertEquals([watcher.looks for watcher in watchers], [3, 0])
+
+class TestAreaOfEffect(AreaTestCase):
+    """Test the radial impulses."""
+    def testRadialImpulse(self):
+        """Pushed away, less when heavy or far, not beyond the radius."""
+        center = self.createEntity(EntityModel, (0, 0))
+        near = self.createEntity(EntityModel, (1, 0))
+        heavy = self.createEntity(HeavyModel, (0, -1))
+        far = self.createEntity(EntityModel, (0, 4))
+        sensor = self.createEntity(SensorModel, (1, 1))
+        # In the square, out of the circle.
+        corner = self.createEntity(EntityModel, (2.5, 2.5))
+        pushed = self.area.applyRadialImpulse(Vector(0, 0), 3, 8)
+        self.assertEquals(sorted(pushed),
+                          [(near.entity_id, 8), (heavy.entity_id, 2)])
+        self.assertEquals(near.body.vel, Vector(8, 0))
+        self.assertEquals(heavy.body.vel, Vector(0, -2))
+        for entity in (center, far, sensor, corner):
+            self.assertEquals(entity.body.vel, Vector(0, 0))
+        pushed = dict(self.area.applyRadialImpulse(Vector(0, 0), 5, 8,
+                                                   exclude=(near.entity_id,)))
+        self.assertEquals(sorted(pushed), [heavy.entity_id, far.entity_id,
+                                           corner.entity_id])
+        self.assertEquals(pushed[far.entity_id], 4)
+        self.assertAlmostEquals(pushed[corner.entity_id], 8 / 12.5 ** .25)
+
+    def testHits(self):
+        """Those pushed hard enough are hit, in a single event."""
+        recorder = EventRecorder(self.event_manager)
+        hit = [self.createEntity(EntityModel, (x, 0)) for x in (-1, 1)]
+        missed = self.createEntity(EntityModel, (0, 4))
+        self.area.applyRadialImpulse(Vector(0, 0), 5, 8, attacker=7,
+                                     hit_impulse=5)
+        self.area.applyRadialImpulse(Vector(0, 0), 5, 8, attacker=7,
+                                     hit_impulse=100)
+        self.event_manager.pump()
+        self.assertEquals(len(recorder.events), 1)
+        self.assertEquals(recorder.events[0].attacker, 7)
+        self.assertEquals(recorder.events[0].victims,
+                          frozenset(entity.entity_id for entity in hit))
+        self.assertEquals(missed.body.vel, Vector(0, 8 / 4 ** .5) * 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+#! /usr/bin/python
+"""AreaFile test suite.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import areafile
+from infiniworld.models import tile
+from infiniworld.models.errors import AreaFileError
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+def makeChunk(nature):
+    """Return the data of a chunk full of that nature."""
+    return chr(tile.packTile(nature, 0)) * (tile.TileMap.CHUNK_SIZE ** 2)
+
+
+class TestAreaFile(unittest.TestCase):
+    """Test the AreaFile on its own."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.area')
+        self.area_file = areafile.AreaFile(self.path)
+
+    def tearDown(self):
+        self.area_file.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        """Close the file and open it again."""
+        self.area_file.close()
+        self.area_file = areafile.AreaFile(self.path)
+
+    def testChunks(self):
+        """The last data saved for a chunk is what we get back."""
+        self.assertEquals(self.area_file.loadChunk((0, 0)), None)
+        self.area_file.saveChunk((0, 0), makeChunk(tile.NATURE_SAND))
+        self.area_file.saveChunk((-3, 7), makeChunk(tile.NATURE_DIRT))
+        self.area_file.saveChunk((0, 0), makeChunk(tile.NATURE_GRASS))
+        self.assertEquals(self.area_file.loadChunk((0, 0)),
+                          makeChunk(tile.NATURE_GRASS))
+        self.reopen()
+        self.assertEquals(sorted(self.area_file.getChunkCoords()),
+                          [(-3, 7), (0, 0)])
+        self.assertTrue(self.area_file.hasChunk((-3, 7)))
+        self.assertFalse(self.area_file.hasChunk((7, -3)))
+        self.assertEquals(self.area_file.loadChunk((-3, 7)),
+                          makeChunk(tile.NATURE_DIRT))
+        self.assertEquals(self.area_file.loadChunk((0, 0)),
+                          makeChunk(tile.NATURE_GRASS))
+
+    def testEntities(self):
+        """Deleted entities stay deleted."""
+        self.area_file.saveEntity(4, 'four')
+        self.area_file.saveEntity(2, 'two')
+        self.area_file.deleteEntity(4)
+        self.reopen()
+        self.assertEquals(self.area_file.getEntityIds(), [2])
+        self.assertEquals(self.area_file.loadEntity(2), 'two')
+        self.assertEquals(self.area_file.loadEntity(4), None)
+
+    def testCrash(self):
+        """What made it to the data without the index is recovered."""
+        self.area_file.saveChunk((0, 0), makeChunk(tile.NATURE_SAND))
+        self.area_file.saveChunk((1, 0), makeChunk(tile.NATURE_DIRT))
+        self.area_file.close()
+        # The index lost its last entry and a half, the data half a record.
+        index_size = os.path.getsize(self.path + '.idx')
+        with open(self.path + '.idx', 'r+b') as index:
+            index.truncate(index_size - areafile.INDEX_ENTRY.size * 3 // 2)
+        with open(self.path, 'ab') as data:
+            data.write(areafile.RECORD.pack(areafile.CHUNK, 2, 0, 256))
+            data.write('garbage')
+        self.area_file = areafile.AreaFile(self.path)
+        self.assertEquals(sorted(self.area_file.getChunkCoords()),
+                          [(0, 0), (1, 0)])
+        self.area_file.saveChunk((2, 0), makeChunk(tile.NATURE_STONE))
+        self.reopen()
+        self.assertEquals(self.area_file.loadChunk((1, 0)),
+                          makeChunk(tile.NATURE_DIRT))
+        self.assertEquals(self.area_file.loadChunk((2, 0)),
+                          makeChunk(tile.NATURE_STONE))
+
+    def testCompact(self):
+        """Compacting removes the garbage and keeps the rest."""
+        for nature in (tile.NATURE_SAND, tile.NATURE_DIRT, tile.NATURE_GRASS):
+            self.area_file.saveChunk((5, 5), makeChunk(nature))
+        self.area_file.saveEntity(1, 'one')
+        self.assertTrue(self.area_file.getGarbage() > .6)
+        self.area_file.flush()
+        size = os.path.getsize(self.path)
+        self.area_file.compact()
+        self.assertEquals(self.area_file.getGarbage(), 0)
+        self.assertTrue(os.path.getsize(self.path) < size / 2)
+        self.assertEquals(self.area_file.loadChunk((5, 5)),
+                          makeChunk(tile.NATURE_GRASS))
+        self.assertEquals(self.area_file.loadEntity(1), 'one')
+
+    def testNotAnAreaFile(self):
+        """Other files are refused."""
+        path = os.path.join(self.directory, 'other')
+        with open(path, 'wb') as other:
+            other.write('Hello world!')
+        self.assertRaises(AreaFileError, areafile.AreaFile, path)
+
+
+class TestSaveArea(unittest.TestCase):
+    """Save an area and load it back."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.area')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRoundTrip(self):
+        """Tiles and entities come back, and only changes are written."""
+        world = WorldModel(EventManager())
+        area = world.createArea()
+        area.tile_map = tile.TileMap(dict(
+            ((x, y), tile.Tile(tile.NATURE_GRASS, int(x == 10)))
+            for x in xrange(-20, 20) for y in xrange(-20, 20)))
+        entity = world.createEntity(EntityModel)
+        entity.body.pos = Vector(3, 4)
+        world.moveEntityToArea(entity.entity_id, area.area_id)
+        area_file = areafile.AreaFile(self.path)
+        areafile.saveArea(area, area_file)
+        self.assertEquals(len(area_file), 16)
+        size = os.path.getsize(self.path)
+        area.tile_map.tiles[(0, 0)].height = 1
+        areafile.saveArea(area, area_file)
+        self.assertTrue(os.path.getsize(self.path) <= size + 256 + 16)
+        area_file.close()
+
+        world = WorldModel(EventManager())
+        area_file = areafile.AreaFile(self.path)
+        loaded = areafile.loadArea(world, area_file)
+        # Only the chunk under the entity was read.
+        self.assertEquals(loaded.tile_map.getChunkCoords(), [(0, 0)])
+        self.assertTrue(loaded.tile_map.isSolidAt((0, 0)))
+        self.assertTrue(loaded.tile_map.isSolidAt((10, -20)))
+        self.assertEquals(loaded.tile_map.getNature((-20, 19)),
+                          tile.NATURE_GRASS)
+        self.assertEquals(sorted(loaded.tile_map.getChunkCoords()),
+                          [(-2, 1), (0, -2), (0, 0)])
+        copy = loaded.entities[entity.entity_id]
+        self.assertEquals(copy.body.pos, Vector(3, 4))
+        self.assertTrue(world.createEntity(EntityModel).entity_id >
+                        entity.entity_id)
+        area_file.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#! /usr/bin/python
+"""Autosave test suite.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import areafile
+from infiniworld.models import tile
+from infiniworld.models.autosave import Autosave
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+def generateFloor(chunk_x, chunk_y, size):
+    """A generator of sand floors."""
+    return chr(tile.packTile(tile.NATURE_SAND, 0)) * (size * size)
+
+
+class TestAutosave(unittest.TestCase):
+    """Test the Autosave class."""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.area')
+        self.area_file = areafile.AreaFile(self.path)
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+        self.area.tile_map = tile.TileMap(generator=generateFloor)
+        self.entity = self.world.createEntity(EntityModel)
+        self.entity.body.pos = Vector(3, 4)
+        self.world.moveEntityToArea(self.entity.entity_id, self.area.area_id)
+        self.autosave = Autosave(self.event_manager, self.area, self.area_file,
+                                 period=1)
+
+    def tearDown(self):
+        if self.area.tile_map.store is self.autosave:
+            self.autosave.close()
+        self.area_file.close()
+        shutil.rmtree(self.directory)
+
+    def testOnlyChanges(self):
+        """The first save writes everything, the next ones what changed."""
+        self.area.tile_map.tiles[(0, 0)].height = 1
+        self.area.tile_map.tiles[(40, 0)].height = 1
+        self.autosave.save()
+        self.autosave.waitForThread()
+        stats = self.autosave.getStats()
+        self.assertEquals((stats['chunks'], stats['entities']), (2, 1))
+        self.assertEquals(self.area_file.getEntityIds(),
+                          [self.entity.entity_id])
+        self.assertEquals(sorted(self.area_file.getChunkCoords()),
+                          [(0, 0), (2, 0)])
+        # Nothing changed.
+        self.autosave.save()
+        self.autosave.waitForThread()
+        stats = self.autosave.getStats()
+        self.assertEquals((stats['chunks'], stats['entities']), (2, 1))
+        # The entity moves.
+        self.entity.body.vel = Vector(1, 0)
+        self.area.runPhysics(.1)
+        self.event_manager.pump()
+        self.area.tile_map.tiles[(1, 0)].height = 1
+        self.autosave.save()
+        self.autosave.waitForThread()
+        stats = self.autosave.getStats()
+        self.assertEquals((stats['chunks'], stats['entities']), (3, 2))
+        self.assertEquals(stats['saves'], 3)
+        self.assertEquals(stats['backlog'], 0)
+        self.assertTrue(stats['bytes_written'] > 3 * 256)
+        self.assertTrue(stats['max_pause'] >= stats['last_pause'])
+
+    def testShortPause(self):
+        """The game waits a small time per entity that moved."""
+        entities = []
+        for index in xrange(400):
+            entity = self.world.createEntity(EntityModel)
+            entity.body.pos = Vector(index % 20, index // 20)
+            self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+            entities.append(entity)
+        self.autosave.save()
+        pauses = []
+        for unused in xrange(3):
+            for entity in entities:
+                self.autosave.markEntity(entity.entity_id)
+            self.autosave.save()
+            pauses.append(self.autosave.getStats()['last_pause'])
+        # The pure Python pickle takes about .3 ms per entity, cPickle .05.
+        self.assertTrue(min(pauses) / len(entities) < .0002, pauses)
+
+    def testPeriod(self):
+        """A save every `period` seconds of game."""
+        for unused in xrange(5):
+            self.event_manager.post(RunPhysicsEvent(.4))
+            self.event_manager.pump()
+        self.assertEquals(self.autosave.getStats()['saves'], 2)
+
+    def testEvictedChunks(self):
+        """Chunks evicted and not written yet are found again."""
+        tile_map = self.area.tile_map
+        tile_map.tiles[(100, 0)].height = 1
+        tile_map.max_chunks = 1
+        tile_map.getTile((0, 100))
+        self.assertFalse((6, 0) in tile_map.getChunkCoords())
+        self.assertTrue(self.autosave.hasChunk((6, 0)))
+        self.assertTrue(tile_map.isSolidAt((100, 0)))
+        self.autosave.waitForThread()
+        self.assertTrue(self.autosave.hasChunk((6, 0)))
+        self.assertTrue((6, 0) in self.area_file.getChunkCoords())
+
+    def testLoadBack(self):
+        """What was autosaved loads like what saveArea saves."""
+        other = self.world.createEntity(EntityModel)
+        self.world.moveEntityToArea(other.entity_id, self.area.area_id)
+        self.area.tile_map.tiles[(5, 5)].height = 1
+        self.autosave.save()
+        self.world.destroyEntity(self.entity)
+        self.event_manager.pump()
+        self.autosave.close()
+        self.assertTrue(self.area.tile_map.store is self.area_file)
+        self.area_file.close()
+
+        world = WorldModel(EventManager())
+        self.area_file = areafile.AreaFile(self.path)
+        loaded = areafile.loadArea(world, self.area_file, generateFloor)
+        self.assertEquals(sorted(loaded.entities), [other.entity_id])
+        self.assertTrue(loaded.tile_map.isSolidAt((5, 5)))
+        self.assertFalse(loaded.tile_map.isSolidAt((6, 5)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#! /usr/bin/python
+"""Deterministic mode and state hashes test suite.
+
+"""
+import unittest
+
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import tile
+from infiniworld.models.checksum import StateHashRecorder
+from infiniworld.models.checksum import findDivergence
+from infiniworld.models.checksum import hashWorld
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+#----------  Helper classes and functions.  ----------
+
+class WandererModel(EntityModel):
+    """Walks in random directions, drawn from the world's streams."""
+    WALK_STRENGTH = 10
+    def runAI(self, timestep):
+        rng = self.area.world.getRandom('ai')
+        self._walk_force.vector = Vector(rng.uniform(-1, 1),
+                                         rng.uniform(-1, 1)) * 10
+
+def runWorld(seed, updates):
+    """Return the state hashes of a crowded walled arena."""
+    event_manager = EventManager(ordered=True)
+    world = WorldModel(event_manager, seed)
+    area = world.createArea()
+    for x in xrange(-6, 7):
+        for y in xrange(-6, 7):
+            height = 1 if max(abs(x), abs(y)) == 6 else 0
+            area.tile_map.tiles[(x, y)] = tile.Tile(tile.NATURE_STONE, height)
+    rng = world.getRandom('setup')
+    for unused in xrange(30):
+        entity = world.createEntity(WandererModel)
+        entity.body.pos = Vector(rng.uniform(-4, 4), rng.uniform(-4, 4))
+        world.moveEntityToArea(entity.entity_id, area.area_id)
+    recorder = StateHashRecorder(event_manager, world)
+    for unused in xrange(updates):
+        event_manager.post(RunPhysicsEvent(.05))
+        event_manager.pump()
+    return recorder.hashes
+
+#----------  Test suite.  ----------
+
+class TestDeterminism(unittest.TestCase):
+    """Two runs with the same seed are the same."""
+    def testSameSeed(self):
+        """Same seed, same hashes at every update."""
+        hashes1 = runWorld(42, 40)
+        hashes2 = runWorld(42, 40)
+        self.assertEquals(len(hashes1), 40)
+        self.assertEquals(findDivergence(hashes1, hashes2), None)
+    def testOtherSeed(self):
+        """Another seed, another world."""
+        self.assertEquals(findDivergence(runWorld(1, 5), runWorld(2, 5)), 0)
+    def testStreams(self):
+        """The streams are independent and reproducible."""
+        world1 = WorldModel(EventManager(), 7)
+        world2 = WorldModel(EventManager(), 7)
+        world1.getRandom('spawn').random()
+        self.assertEquals(world1.getRandom('ai').random(),
+                          world2.getRandom('ai').random())
+        self.assertNotEquals(world1.getRandom('ai').random(),
+                             world1.getRandom('spawn').random())
+    def testHashChanges(self):
+        """The hash sees a moving entity."""
+        world = WorldModel(EventManager(), 0)
+        entity = world.createEntity(EntityModel)
+        before = hashWorld(world)
+        entity.body.pos = Vector(0, 1e-9)
+        self.assertNotEquals(hashWorld(world), before)
+
+if __name__ == "__main__":
+    unittest.main()
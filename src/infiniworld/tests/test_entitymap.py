@@ -0,0 +1,125 @@
+#! /usr/bin/python
+"""EntityMap test suite.
+
+"""
+import random
+import unittest
+
+from infiniworld.geometry import Vector
+from infiniworld.models import entitymap
+from infiniworld.models.entitymap import EntityMap
+from infiniworld import physics
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes.  ----------
+
+class DummyEntity(object):
+    def __init__(self, x, y):
+        object.__init__(self)
+        self.body = physics.Particle(1, Vector(x, y))
+
+#----------  Test suite.  ----------
+
+class TestChunkKeys(unittest.TestCase):
+    """Test the packing of the chunk coordinates."""
+    def testRoundTrip(self):
+        """unpackChunkKey undoes packChunkCoord."""
+        for coord in ((0, 0), (-1, 0), (0, -1), (-5, 7), (123456, -654321)):
+            key = entitymap.packChunkCoord(*coord)
+            self.assertEquals(entitymap.unpackChunkKey(key), coord)
+
+    def testKeyAtMatchesCoordAt(self):
+        """chunkKeyAt is the packed version of chunkCoordAt."""
+        for pos in (Vector(0, 0), Vector(-.5, 4), Vector(-17.3, 42.1)):
+            for scale in EntityMap.SCALES:
+                coord = entitymap.chunkCoordAt(pos, scale)
+                key = entitymap.chunkKeyAt(pos, scale)
+                self.assertEquals(key, entitymap.packChunkCoord(*coord))
+
+class TestEntityMap(unittest.TestCase):
+    """Test the EntityMap class."""
+    def setUp(self):
+        random.seed(0)
+        self.entities = [DummyEntity(random.uniform(-30, 30),
+                                     random.uniform(-30, 30))
+                         for unused in xrange(200)]
+
+    def makeMap(self, scale):
+        entity_map = EntityMap(scale, False)
+        for entity in self.entities:
+            entity_map.add(entity)
+        return entity_map
+
+    def testGetNearFindsEverybodyInRange(self):
+        """EntityMap.getNear returns at least the entities within radius."""
+        pos = Vector(3, -2)
+        radius = 5
+        expected = set(entity for entity in self.entities
+                       if entity.body.pos.dist(pos) <= radius)
+        for scale in EntityMap.SCALES:
+            entity_map = self.makeMap(scale)
+            near = entity_map.getNear(pos, radius)
+            self.assertTrue(expected <= near)
+
+    def testGetNearDoesNotCreateChunks(self):
+        """EntityMap.getNear does not leave empty chunks behind."""
+        entity_map = self.makeMap(1)
+        chunks = len(entity_map._entities)
+        entity_map.getNear(Vector(500, 500), 10)
+        self.assertEquals(len(entity_map._entities), chunks)
+
+    def testMoveAndRemove(self):
+        """EntityMap.move follows the entity, remove forgets it."""
+        entity_map = self.makeMap(4)
+        entity = self.entities[0]
+        entity.body.pos = Vector(100, 100)
+        entity_map.move(entity)
+        self.assertTrue(entity in entity_map.getNear(Vector(100, 100), 1))
+        entity_map.remove(entity)
+        self.assertFalse(entity in entity_map.getNear(Vector(100, 100), 1))
+        self.assertEquals(len(entity_map), len(self.entities) - 1)
+
+    def testRebucketKeepsEverybody(self):
+        """EntityMap.rebucket does not lose anybody."""
+        entity_map = self.makeMap(8)
+        entity_map.rebucket(2)
+        self.assertEquals(entity_map.scale, 2)
+        everybody = entity_map.getNear(Vector(0, 0), 40)
+        self.assertEquals(everybody, set(self.entities))
+
+    def testRetuneForCrowds(self):
+        """EntityMap.retune picks smaller chunks when the crowd is dense."""
+        crowd = [DummyEntity(random.uniform(-5, 5), random.uniform(-5, 5))
+                 for unused in xrange(500)]
+        entity_map = EntityMap(32, True)
+        for entity in crowd:
+            entity_map.add(entity)
+        for entity in crowd:
+            entity_map.getNear(entity.body.pos, 1)
+        self.assertTrue(entity_map.retune())
+        self.assertTrue(entity_map.scale < 32)
+        self.assertEquals(len(entity_map), len(crowd))
+
+    def testRetuneNeedsEnoughQueries(self):
+        """EntityMap.retune does nothing before having measured enough."""
+        entity_map = self.makeMap(32)
+        entity_map.auto_scale = True
+        entity_map.getNear(Vector(0, 0), 1)
+        self.assertFalse(entity_map.retune())
+        self.assertEquals(entity_map.scale, 32)
+
+    def testRetuneIsOptIn(self):
+        """Without auto_scale, the scale stays whatever the queries."""
+        entity_map = self.makeMap(32)
+        for unused in xrange(EntityMap.RETUNE_QUERIES):
+            entity_map.getNear(Vector(0, 0), 1)
+        self.assertFalse(entity_map.retune())
+        self.assertEquals(entity_map.scale, 32)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,15 @@ from infiniworld.evtman import NotRegisteredError, AlreadyRegisteredError
 class SubEvent(Event):
     attributes = ('egg', 'spam')
 
+class OrderListener(Listener):
+    """Writes down its name when it hears a SubEvent."""
+    def __init__(self, name, heard):
+        Listener.__init__(self)
+        self.name = name
+        self.heard = heard
+    def onSubEvent(self, unused):
+        self.heard.append(self.name)
+
 class SubListener(Listener):
     egg_plus_spam = 0
     def __init__(self):
@@ -156,5 +165,22 @@ class TestEventManager(unittest.TestCase):
         event_manager.pump()
         self.assertEquals(SubListener.egg_plus_spam, (666 + 42 + 13 + 7) * 2)
 
+    def testOrderedPump(self):
+        """An ordered EventManager calls the listeners as they registered."""
+        event_manager = EventManager(ordered=True)
+        heard = []
+        listeners = [OrderListener(index, heard) for index in xrange(20)]
+        for listener in reversed(listeners):
+            event_manager.register(listener)
+        # Registering again puts you at the end.
+        event_manager.unregister(listeners[10])
+        event_manager.register(listeners[10])
+        event_manager.post(SubEvent(0, 0))
+        event_manager.pump()
+        expected = range(19, -1, -1)
+        expected.remove(10)
+        expected.append(10)
+        self.assertEquals(heard, expected)
+
 if __name__ == "__main__":
     unittest.main()
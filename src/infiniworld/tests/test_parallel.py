@@ -0,0 +1,168 @@
+#! /usr/bin/python
+"""ParallelPhysics test suite.
+
+"""
+import random
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import tile
+from infiniworld.models.parallel import ParallelPhysics
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+def makeWorld(positions, walls=()):
+    """Return a world and its area populated with entities."""
+    event_manager = EventManager()
+    world = WorldModel(event_manager)
+    area = world.createArea()
+    for coord in walls:
+        area.tile_map.tiles[coord] = tile.Tile(tile.NATURE_STONE, 1)
+    entities = []
+    for pos, vel in positions:
+        entity = world.createEntity(EntityModel)
+        entity.body.pos = Vector(pos)
+        entity.body.vel = Vector(vel)
+        world.moveEntityToArea(entity.entity_id, area.area_id)
+        entities.append(entity)
+    return world, area, entities
+
+class TestParallelPhysics(unittest.TestCase):
+    """Test the ParallelPhysics class."""
+    def setUp(self):
+        random.seed(0)
+        self.positions = [((random.uniform(-40, 40), random.uniform(-40, 40)),
+                           (random.uniform(-3, 3), random.uniform(-3, 3)))
+                          for unused in xrange(60)]
+        self.walls = [(x, 45) for x in xrange(-45, 46)]
+
+    def testSameAsSerialWithoutCollisions(self):
+        """Lonely entities end up where the serial physics puts them."""
+        positions = [((x * 10, 0), (1, 1)) for x in xrange(-5, 6)]
+        unused, area_serial, serial = makeWorld(positions)
+        unused, area_parallel, parallel = makeWorld(positions)
+        physics = ParallelPhysics(area_parallel, 2)
+        physics.MIN_ENTITIES = 0
+        try:
+            for unused in xrange(10):
+                area_serial.runPhysics(.05)
+                area_parallel.runPhysics(.05)
+        finally:
+            physics.close()
+        for entity_serial, entity_parallel in zip(serial, parallel):
+            self.assertEquals(entity_serial.body.pos,
+                              entity_parallel.body.pos)
+            self.assertEquals(entity_serial.body.vel,
+                              entity_parallel.body.vel)
+
+    def testSameAsSerialAcrossBorder(self):
+        """Bodies colliding over a border bounce like in the serial physics."""
+        # x = 0 is always the border of two regions.
+        positions = [((-.6, .3), (3, 0)), ((.6, .3), (-3, 0)),
+                     ((-1.7, .3), (0, 0)), ((30, 0), (1, 1))]
+        unused, area_serial, serial = makeWorld(positions)
+        unused, area_parallel, parallel = makeWorld(positions)
+        physics = ParallelPhysics(area_parallel, 2)
+        physics.MIN_ENTITIES = 0
+        try:
+            for unused in xrange(10):
+                area_serial.runPhysics(.05)
+                area_parallel.runPhysics(.05)
+        finally:
+            physics.close()
+        # They did bounce, and the first one pushed the resting one.
+        self.assertTrue(serial[1].body.vel.x > 0)
+        self.assertTrue(serial[2].body.vel.x < 0)
+        for entity_serial, entity_parallel in zip(serial, parallel):
+            self.assertEquals(entity_serial.body.pos,
+                              entity_parallel.body.pos)
+            self.assertEquals(entity_serial.body.vel,
+                              entity_parallel.body.vel)
+
+    def testSameAsSerialWhenPushed(self):
+        """Bodies at rest that their forces throw together over a border."""
+        positions = [((-.6, .3), (0, 0)), ((.6, .3), (0, 0))]
+        worlds = [makeWorld(positions), makeWorld(positions)]
+        for unused, unused, entities in worlds:
+            entities[0]._walk_force.vector = Vector(100, 0)
+            entities[1]._walk_force.vector = Vector(-100, 0)
+        unused, area_serial, serial = worlds[0]
+        unused, area_parallel, parallel = worlds[1]
+        physics = ParallelPhysics(area_parallel, 2)
+        physics.MIN_ENTITIES = 0
+        try:
+            for unused in xrange(3):
+                area_serial.runPhysics(.05)
+                area_parallel.runPhysics(.05)
+        finally:
+            physics.close()
+        self.assertTrue(serial[0].body.pos.dist(serial[1].body.pos) >=
+                        1 - 1e-6)
+        for entity_serial, entity_parallel in zip(serial, parallel):
+            self.assertEquals(entity_serial.body.pos,
+                              entity_parallel.body.pos)
+            self.assertEquals(entity_serial.body.vel,
+                              entity_parallel.body.vel)
+
+    def testCrowd(self):
+        """Entities of a crowd keep moving and don't end up in walls."""
+        unused, area, entities = makeWorld(self.positions, self.walls)
+        physics = ParallelPhysics(area, 2)
+        physics.MIN_ENTITIES = 0
+        try:
+            for unused in xrange(20):
+                area.runPhysics(.05)
+        finally:
+            physics.close()
+        self.assertTrue(area.parallel_physics is None)
+        for entity, (pos, unused) in zip(entities, self.positions):
+            self.assertNotEquals(entity.body.pos, Vector(pos))
+            self.assertTrue(entity.body.pos.y <= 44.5 - .5 + 1e-6)
+            self.assertTrue(entity in area.entity_map.getNear(
+                entity.body.pos, 0))
+
+    def testDeterministic(self):
+        """Two parallel runs give exactly the same results."""
+        finals = []
+        for workers in (1, 3):
+            unused, area, entities = makeWorld(self.positions, self.walls)
+            physics = ParallelPhysics(area, workers)
+            physics.MIN_ENTITIES = 0
+            try:
+                for unused in xrange(20):
+                    area.runPhysics(.05)
+            finally:
+                physics.close()
+            finals.append([(entity.body.pos, entity.body.vel)
+                           for entity in entities])
+        self.assertEquals(finals[0], finals[1])
+
+    def testOpenedWall(self):
+        """The processes hear about the walls that disappear."""
+        walls = [(x, 45) for x in xrange(-10, 11)]
+        positions = [((x * 2, 43), (0, 5)) for x in xrange(-4, 5)]
+        unused, area, entities = makeWorld(positions, walls)
+        physics = ParallelPhysics(area, 2)
+        physics.MIN_ENTITIES = 0
+        try:
+            # The pool started with the walls, the entities are about to hit
+            # them.
+            for unused in xrange(2):
+                area.runPhysics(.05)
+            for coord in walls:
+                area.tile_map.tiles[coord].height = 0
+            for unused in xrange(20):
+                area.runPhysics(.05)
+        finally:
+            physics.close()
+        self.assertTrue(min(entity.body.pos.y for entity in entities) > 45)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#! /usr/bin/python
+"""Perception test suite.
+
+"""
+import random
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+class PreyModel(EntityModel):
+    """What the others look for."""
+    NAME = 'Prey'
+    SOLID = False
+
+class HunterModel(EntityModel):
+    """Looks for the closest prey when it perceives."""
+    NAME = 'Hunter'
+    SOLID = False
+    RADIUS = 4
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.seen = None
+    def perceive(self):
+        self.seen = self.area.perception.findClosest(self, 'Prey',
+                                                     self.RADIUS)
+
+
+class TestPerception(unittest.TestCase):
+    """Test the Perception class."""
+    def setUp(self):
+        self.world = WorldModel(EventManager())
+        self.area = self.world.createArea()
+
+    def createEntity(self, factory, pos):
+        """Put a new entity in the area."""
+        entity = self.world.createEntity(factory)
+        entity.body.pos = Vector(pos)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        return entity
+
+    def testSameAsQueries(self):
+        """The table says what the queries of the watchers say."""
+        rng = random.Random(3)
+        perception = self.area.perception
+        for unused in xrange(5):
+            self.createEntity(PreyModel, (rng.uniform(-20, 20),
+                                          rng.uniform(-20, 20)))
+        hunters = [self.createEntity(HunterModel, (rng.uniform(-30, 30),
+                                                   rng.uniform(-30, 30)))
+                   for unused in xrange(300)]
+        # On the borders of the chunks too.
+        hunters.append(self.createEntity(HunterModel, (12 - .5, 0)))
+        hunters.append(self.createEntity(HunterModel, (-4 + .5, 3.5)))
+        table = perception.makeTable('Prey', HunterModel.RADIUS)
+        seeing = 0
+        for hunter in hunters:
+            expected = perception.findClosestDirectly(hunter, 'Prey',
+                                                      HunterModel.RADIUS)
+            self.assertEquals(table.get(hunter.entity_id, (None, None)),
+                              expected)
+            if expected[0] is not None:
+                seeing += 1
+        self.assertTrue(seeing > 10)
+
+    def testDuringPass(self):
+        """The entities read the table while they perceive."""
+        prey = self.createEntity(PreyModel, (0, 0))
+        hunter = self.createEntity(HunterModel, (2, 0))
+        far = self.createEntity(HunterModel, (100, 0))
+        for unused in xrange(self.area.AI_BUCKETS):
+            self.area.runPhysics(.05)
+        self.assertEquals(hunter.seen, (prey, 2))
+        self.assertEquals(far.seen, (None, None))
+        self.assertEquals(self.area.perception._tables, None)
+
+    def testSameAtAnyScale(self):
+        """What a watcher sees does not depend on the entity map."""
+        prey = self.createEntity(PreyModel, (.2, .2))
+        near = self.createEntity(HunterModel, (3.9, .2))
+        # In the same chunk at scale 8, too far all the same.
+        far = self.createEntity(HunterModel, (7.2, .2))
+        perception = self.area.perception
+        for scale in (8, 4, 2):
+            self.area.entity_map.rebucket(scale)
+            for hunter, expected in ((near, prey), (far, None)):
+                seen = perception.findClosest(hunter, 'Prey', 4)
+                self.assertEquals(seen[0], expected)
+                table = perception.makeTable('Prey', 4)
+                self.assertEquals(table.get(hunter.entity_id, (None, None)),
+                                  seen)
+
+    def testGone(self):
+        """Targets that don't exist or left are not seen."""
+        prey = self.createEntity(PreyModel, (0, 0))
+        hunter = self.createEntity(HunterModel, (1, 0))
+        perception = self.area.perception
+        prey.exists = False
+        self.assertEquals(perception.findClosest(hunter, 'Prey', 4),
+                          (None, None))
+        self.assertEquals(perception.makeTable('Prey', 4), {})
+        prey.exists = True
+        self.world.moveEntityToArea(prey.entity_id, None)
+        self.assertEquals(perception.getNamed('Prey'), {})
+        self.assertEquals(perception.makeTable('Prey', 4), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#! /usr/bin/python
+"""ChunkPrefetcher test suite.
+
+"""
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import tile
+from infiniworld.models.prefetch import ChunkPrefetcher
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+def generateFloor(chunk_x, chunk_y, size):
+    """A generator of sand floors."""
+    return chr(tile.packTile(tile.NATURE_SAND, 0)) * (size * size)
+
+class CountingStore(tile.MemoryChunkStore):
+    """Counts the chunks that are read."""
+    def __init__(self):
+        tile.MemoryChunkStore.__init__(self)
+        self.loads = 0
+    def loadChunk(self, chunk_coord):
+        self.loads += 1
+        return tile.MemoryChunkStore.loadChunk(self, chunk_coord)
+
+
+class TestChunkPrefetcher(unittest.TestCase):
+    """Test the ChunkPrefetcher class."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+        self.area.tile_map = tile.TileMap(generator=generateFloor)
+        self.prefetcher = ChunkPrefetcher(self.event_manager, self.area)
+        self.entity = self.world.createEntity(EntityModel)
+        self.world.moveEntityToArea(self.entity.entity_id, self.area.area_id)
+        self.area._controlled_entity_id = self.entity.entity_id
+
+    def tearDown(self):
+        if self.area.chunk_prefetcher is not None:
+            self.prefetcher.close()
+
+    def testAhead(self):
+        """The chunks in front of a running entity are ready in time."""
+        # The first update needs the chunks around the entity right away.
+        self.area.runPhysics(.05)
+        self.assertEquals(self.prefetcher.getStats()['misses'], 9)
+        # It runs to the right.
+        self.entity.body.vel = Vector(20, 0)
+        self.entity.body.pos = Vector(.01, 0)
+        self.prefetcher.prefetchAround(self.entity.body.pos,
+                                       self.entity.body.vel)
+        self.prefetcher.waitForThread()
+        self.area.runPhysics(.05)
+        stats = self.prefetcher.getStats()
+        self.assertEquals(stats['pending'], 0)
+        self.assertTrue(stats['hits'] >= 6)
+        # It gets there: nothing left to generate.
+        self.entity.body.pos = Vector(40, 0)
+        self.area.runPhysics(.05)
+        self.assertEquals(self.prefetcher.getStats()['misses'], 9)
+        self.assertTrue(self.area.tile_map.getTile((40, 0)))
+
+    def testFollowsMoves(self):
+        """Moves of the controlled entity trigger the prefetch."""
+        self.entity.body.vel = Vector(0, -30)
+        for unused in xrange(3):
+            self.area.runPhysics(.05)
+            self.event_manager.pump()
+            self.prefetcher.waitForThread()
+        self.area.runPhysics(.05)
+        self.assertTrue((0, -4) in self.area.tile_map.getChunkCoords())
+        self.assertTrue(self.prefetcher.getStats()['hits'] > 0)
+
+    def testStoreNotRead(self):
+        """Knowing what the store has does not read it."""
+        tile_map = self.area.tile_map
+        store = CountingStore()
+        store.saveChunk((0, 0), generateFloor(0, 0, 16))
+        tile_map.setStore(store)
+        self.prefetcher.prefetchAround(Vector(0, 0), Vector(0, 0))
+        self.prefetcher.waitForThread()
+        self.assertFalse(tile_map.offerChunk((0, 0), generateFloor(0, 0, 16)))
+        self.assertEquals(store.loads, 0)
+        self.assertEquals(self.prefetcher.getStats()['pending'], 8)
+
+    def testModifiedChunksWin(self):
+        """A chunk that was modified is not replaced by a generated one."""
+        tile_map = self.area.tile_map
+        tile_map.tiles[(100, 0)] = tile.Tile(tile.NATURE_DIRT, 1)
+        tile_map.max_chunks = 1
+        tile_map.getTile((0, 100))
+        tile_map.max_chunks = None
+        self.assertFalse((6, 0) in tile_map.getChunkCoords())
+        self.assertFalse(tile_map.offerChunk((6, 0),
+                                             generateFloor(6, 0, 16)))
+        self.assertTrue(tile_map.isSolidAt((100, 0)))
+
+if __name__ == "__main__":
+    unittest.main()
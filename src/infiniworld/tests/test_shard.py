@@ -0,0 +1,151 @@
+#! /usr/bin/python
+"""ShardedWorldModel test suite.
+
+"""
+import unittest
+
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.evtman import EventManager, SingleListener
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import events
+from infiniworld.models.errors import ShardError
+from infiniworld.models.shard import ShardedWorldModel
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes and functions.  ----------
+
+class CounterModel(EntityModel):
+    """Counts the physics updates it lived, wherever it lived them."""
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.updates = 0
+    def runAI(self, timestep):
+        self.updates += 1
+
+class WalkerModel(EntityModel):
+    """Obeys MoveEntityRequest."""
+    WALK_STRENGTH = 10
+
+class MovedRecorder(SingleListener):
+    """Remembers which entities moved, in the main process."""
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.moved = set()
+    def onEntityMovedEvent(self, event):
+        self.moved.add(event.entity_id)
+
+def launch(world, entity_id, speed):
+    """Give a velocity to an entity.  Runs in a shard."""
+    world.entities[entity_id].body.vel = Vector(speed, 0)
+
+def countUpdates(world, entity_id):
+    """Return how many updates an entity lived.  Runs in a shard."""
+    return world.entities[entity_id].updates
+
+def listEntities(world):
+    """Return the ids of the entities of a shard.  Runs in a shard."""
+    return sorted(world.entities)
+
+def moveToArea(world, entity_id, area_id):
+    """Move an entity, maybe out of the shard.  Runs in a shard."""
+    world.moveEntityToArea(entity_id, area_id)
+
+def crash(unused):
+    """Fail.  Runs in a shard."""
+    raise ValueError("Crash!")
+
+#----------  Test cases.  ----------
+
+class TestShardedWorldModel(unittest.TestCase):
+    """Test the ShardedWorldModel and its shards."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = ShardedWorldModel(self.event_manager, 2)
+        self.recorder = MovedRecorder(self.event_manager)
+        self.area_ids = [self.world.createArea(), self.world.createArea()]
+    def tearDown(self):
+        self.world.unregister()
+    def runPhysics(self, times):
+        """Make time pass in the main process."""
+        for unused in xrange(times):
+            self.event_manager.post(RunPhysicsEvent(.05))
+            self.event_manager.pump()
+
+    def testAreasSpread(self):
+        """The areas go to the shards in turn."""
+        self.assertEquals(self.world._area_shards, {0: 0, 1: 1})
+
+    def testStripedIds(self):
+        """Entities created in different shards never share an id."""
+        ids = [self.world.createEntity(EntityModel, area_id)
+               for area_id in self.area_ids * 3]
+        self.assertEquals(len(set(ids)), 6)
+        self.assertEquals(sorted(self.world.entities), sorted(ids))
+
+    def testPhysicsAndSummaries(self):
+        """The shards simulate, the coordinator hears about it."""
+        entity_id = self.world.createEntity(EntityModel, 1)
+        self.world.callInArea(1, launch, entity_id, 2)
+        self.runPhysics(5)
+        self.assertTrue(entity_id in self.recorder.moved)
+        summary = self.world.summaries[entity_id]
+        self.assertEquals(summary['area_id'], 1)
+        self.assertTrue(summary['pos'].x > 0)
+
+    def testMigration(self):
+        """An entity keeps its state when it goes to another shard."""
+        entity_id = self.world.createEntity(CounterModel, 0)
+        self.runPhysics(3)
+        self.world.moveEntityToArea(entity_id, 1)
+        self.assertEquals(self.world.callInArea(0, listEntities), [])
+        self.assertEquals(self.world.callInArea(1, listEntities), [entity_id])
+        self.assertEquals(self.world.entities[entity_id], 1)
+        self.runPhysics(2)
+        self.assertEquals(self.world.callInArea(1, countUpdates, entity_id),
+                          5)
+
+    def testMigrationFromShard(self):
+        """A shard can send an entity away by itself."""
+        entity_id = self.world.createEntity(CounterModel, 0)
+        self.runPhysics(1)
+        self.world.callInArea(0, moveToArea, entity_id, 1)
+        self.assertEquals(self.world.entities[entity_id], 1)
+        self.assertEquals(self.world.callInArea(1, listEntities), [entity_id])
+        self.assertEquals(self.world.callInArea(1, countUpdates, entity_id),
+                          1)
+
+    def testMigrationToUnknownArea(self):
+        """An entity sent to an area nobody has stays home, in no area."""
+        entity_id = self.world.createEntity(CounterModel, 0)
+        self.world.callInArea(0, moveToArea, entity_id, 99)
+        self.assertEquals(self.world.entities[entity_id], None)
+        self.assertEquals(self.world.callInArea(0, listEntities), [entity_id])
+
+    def testForwardedEvents(self):
+        """Events of the main process reach the entities in the shards."""
+        entity_id = self.world.createEntity(WalkerModel, 0)
+        self.event_manager.post(
+            events.MoveEntityRequest(entity_id, Vector(1, 0)))
+        self.runPhysics(2)
+        self.assertTrue(self.world.summaries[entity_id]['pos'].x > 0)
+
+    def testDestroy(self):
+        """Destroyed entities are forgotten everywhere."""
+        entity_id = self.world.createEntity(EntityModel, 1)
+        self.event_manager.post(events.DestroyEntityRequest(entity_id))
+        self.event_manager.pump()
+        self.assertFalse(entity_id in self.world.entities)
+        self.assertEquals(self.world.callInArea(1, listEntities), [])
+
+    def testError(self):
+        """Errors in a shard are raised in the main process."""
+        self.assertRaises(ShardError, self.world.callInArea, 0, crash)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+#! /usr/bin/python
+"""Snapshot test suite.
+
+"""
+import random
+import unittest
+
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models.snapshot import takeAreaSnapshot
+from infiniworld.models.snapshot import takeWorldSnapshot
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes.  ----------
+
+class HealthyModel(EntityModel):
+    """Has an integer health."""
+    SNAPSHOT_FIELDS = EntityModel.SNAPSHOT_FIELDS + ('health',)
+    def __init__(self, event_manager, entity_id):
+        EntityModel.__init__(self, event_manager, entity_id)
+        self.health = 10
+
+class Timer(object):
+    """Not an entity, but has state to save."""
+    SNAPSHOT_FIELDS = ('elapsed', 'active')
+    def __init__(self):
+        object.__init__(self)
+        self.elapsed = 0.
+        self.active = True
+
+#----------  Test suite.  ----------
+
+class TestSnapshot(unittest.TestCase):
+    """Test snapshots of a world and of an area."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+        self.entities = []
+        for index in xrange(5):
+            entity = self.world.createEntity(HealthyModel)
+            entity.body.pos = Vector(index * 3, 0)
+            entity.body.vel = Vector(1, index)
+            self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+            self.entities.append(entity)
+    def runPhysics(self, times):
+        """Make time pass."""
+        for unused in xrange(times):
+            self.event_manager.post(RunPhysicsEvent(.05))
+            self.event_manager.pump()
+    def state(self):
+        """Return what should come back after a restore."""
+        return [(entity.entity_id, entity.body.pos.copy(),
+                 entity.body.vel.copy(), entity.health, entity._age)
+                for entity in sorted(self.world.entities.values(),
+                                     key=lambda entity: entity.entity_id)]
+
+    def testRestoreBodies(self):
+        """Positions, velocities and fields come back."""
+        self.runPhysics(3)
+        before = self.state()
+        snapshot = takeWorldSnapshot(self.world)
+        self.entities[0].health = 3
+        self.runPhysics(5)
+        self.assertNotEquals(self.state(), before)
+        snapshot.restore()
+        self.assertEquals(self.state(), before)
+        self.assertTrue(type(self.entities[0].health) is int)
+        # The entity map follows.
+        for entity in self.entities:
+            self.assertTrue(entity in self.area.entity_map.getNear(
+                entity.body.pos, 0))
+
+    def testRestoreTwice(self):
+        """A snapshot can be restored many times, identically."""
+        snapshot = takeWorldSnapshot(self.world)
+        self.runPhysics(4)
+        after = self.state()
+        snapshot.restore()
+        self.runPhysics(4)
+        self.assertEquals(self.state(), after)
+
+    def testNoNewListeners(self):
+        """Restoring does not register anything."""
+        handlers = self.event_manager._handlers['RunPhysicsEvent']
+        count = len(handlers)
+        snapshot = takeWorldSnapshot(self.world)
+        self.runPhysics(2)
+        snapshot.restore()
+        self.assertEquals(len(handlers), count)
+
+    def testCreatedAndDestroyed(self):
+        """New entities go away, dead ones come back."""
+        before = self.state()
+        snapshot = takeWorldSnapshot(self.world)
+        victim_id = self.entities[2].entity_id
+        self.world.destroyEntity(self.entities[2])
+        newcomer = self.world.createEntity(HealthyModel)
+        self.world.moveEntityToArea(newcomer.entity_id, self.area.area_id)
+        snapshot.restore()
+        self.assertEquals(self.state(), before)
+        self.assertFalse(newcomer.entity_id in self.world.entities)
+        self.assertEquals(self.world.entities[victim_id].area_id,
+                          self.area.area_id)
+        # The ids are given again in the same order.
+        self.assertEquals(self.world.createEntity(EntityModel).entity_id,
+                          newcomer.entity_id)
+
+    def testMovedBetweenAreas(self):
+        """Entities go back to the area they were in."""
+        other = self.world.createArea()
+        snapshot = takeAreaSnapshot(self.area)
+        entity_id = self.entities[1].entity_id
+        self.world.moveEntityToArea(entity_id, other.area_id)
+        snapshot.restore()
+        self.assertEquals(self.entities[1].area_id, self.area.area_id)
+
+    def testExtrasAndRandom(self):
+        """Other objects and the random generator come back too."""
+        timer = Timer()
+        snapshot = takeWorldSnapshot(self.world, [timer])
+        expected = [random.random() for unused in xrange(3)]
+        timer.elapsed = 5.
+        timer.active = False
+        snapshot.restore()
+        self.assertEquals(timer.elapsed, 0.)
+        self.assertTrue(timer.active is True)
+        self.assertEquals([random.random() for unused in xrange(3)],
+                          expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#! /usr/bin/python
+"""SpawnPointTable test suite.
+
+"""
+import random
+import unittest
+
+from infiniworld.evtman import EventManager
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models.spawnpoints import SpawnPointTable
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+#----------  Helper classes.  ----------
+
+class BigModel(EntityModel):
+    """Covers a few tiles."""
+    BODY_RADIUS = 3
+
+#----------  Test suite.  ----------
+
+class TestSpawnPointTable(unittest.TestCase):
+    """Test the SpawnPointTable class."""
+    def setUp(self):
+        self.world = WorldModel(EventManager())
+        self.area = self.world.createArea()
+        self.rng = random.Random(7)
+
+    def tearDown(self):
+        self.world.unregister()
+
+    def stand(self, coord, factory=EntityModel):
+        """Put an entity there."""
+        entity = self.world.createEntity(factory)
+        entity.body.pos = Vector(coord)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        return entity
+
+    def testLikeASet(self):
+        """Adding and removing keeps the points and only them."""
+        coords = [(x, y) for x in xrange(5) for y in xrange(5)]
+        table = SpawnPointTable(coords)
+        table.add((0, 0))
+        self.assertEquals(len(table), 25)
+        for coord in coords[::3]:
+            table.discard(coord)
+        table.discard((10, 10))
+        expected = set(coords) - set(coords[::3])
+        self.assertEquals(set(table), expected)
+        self.assertEquals(len(table), len(expected))
+        self.assertFalse((0, 0) in table)
+        self.assertTrue((0, 1) in table)
+        for unused in xrange(50):
+            self.assertTrue(table.choice(self.rng) in expected)
+
+    def testSkipOccupied(self):
+        """No point under an entity, and no point twice."""
+        table = SpawnPointTable([(x, 0) for x in xrange(6)])
+        self.stand((1, 0))
+        # Half way, overlaps both.
+        self.stand((3.5, 0))
+        chosen = table.sample(self.rng, 10, self.area)
+        self.assertEquals(sorted(chosen), [(0, 0), (2, 0), (5, 0)])
+        # Without the map, anywhere.
+        self.assertEquals(len(table.sample(self.rng, 6)), 6)
+
+    def testCrowded(self):
+        """A full area gives nothing, an empty table too."""
+        table = SpawnPointTable([(0, 0), (1, 0)])
+        self.stand((0, 0))
+        self.stand((1, 0))
+        self.assertEquals(table.sample(self.rng, 3, self.area), [])
+        self.assertEquals(SpawnPointTable().sample(self.rng, 1), [])
+
+    def testBigNeighbour(self):
+        """A big entity covers the points far from its center."""
+        table = SpawnPointTable([(x, 0) for x in xrange(8)])
+        self.stand((0, 0), BigModel)
+        chosen = table.sample(self.rng, 10, self.area)
+        self.assertEquals(sorted(chosen), [(4, 0), (5, 0), (6, 0), (7, 0)])
+
+if __name__ == "__main__":
+    unittest.main()
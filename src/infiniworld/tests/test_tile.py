@@ -0,0 +1,337 @@
+#! /usr/bin/python
+"""TileMap test suite.
+
+"""
+import pickle
+import unittest
+
+from infiniworld.evtman import EventManager, SingleListener
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import tile
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes and functions.  ----------
+
+class CountingGenerator(object):
+    """Generates stone floors with a wall at x = 20, counts the chunks."""
+    def __init__(self):
+        object.__init__(self)
+        self.generated = []
+    def __call__(self, chunk_x, chunk_y, size):
+        self.generated.append((chunk_x, chunk_y))
+        tiles = {}
+        for x in xrange(chunk_x * size, (chunk_x + 1) * size):
+            for y in xrange(chunk_y * size, (chunk_y + 1) * size):
+                height = 1 if x == 20 else 0
+                tiles[(x, y)] = tile.Tile(tile.NATURE_STONE, height)
+        return tiles
+
+class BatchGenerator(CountingGenerator):
+    """Can generate several chunks at once, counts the batches."""
+    def __init__(self):
+        CountingGenerator.__init__(self)
+        self.batches = []
+    def generateChunks(self, chunk_coords, size):
+        self.batches.append(sorted(chunk_coords))
+        return dict((chunk_coord, self(chunk_coord[0], chunk_coord[1], size))
+                    for chunk_coord in chunk_coords)
+
+class TilesRecorder(SingleListener):
+    """Remembers the tiles it was told about."""
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.tiles = tile.TileMapSummary(1)
+        self.changes = []
+    def onTilesChangedEvent(self, event):
+        if event.tiles is not None:
+            self.tiles.update(event.tiles)
+        if event.changes is not None:
+            self.tiles.applyChanges(event.changes)
+            self.changes.extend(event.changes.iteritems())
+
+#----------  Test suite.  ----------
+
+class TestTileMap(unittest.TestCase):
+    """Test the TileMap on its own."""
+    def testFinite(self):
+        """A map without generator behaves like a dictionary."""
+        tiles = {(0, 0): tile.Tile(tile.NATURE_GRASS, 0),
+                 (-20, 3): tile.Tile(tile.NATURE_SAND, 1)}
+        tile_map = tile.TileMap(tiles)
+        self.assertEquals(tile_map.tiles[(-20, 3)], tiles[(-20, 3)])
+        self.assertRaises(KeyError, tile_map.getTile, (100, 100))
+        self.assertFalse((1, 0) in tile_map.tiles)
+        self.assertEquals(dict(tile_map.tiles.iteritems()), tiles)
+        self.assertEquals(dict(tile_map.makeSummary().iteritems()),
+                          {(0, 0): (tile.NATURE_GRASS, 0),
+                           (-20, 3): (tile.NATURE_SAND, 1)})
+        # Looking outside did not create chunks.
+        self.assertEquals(len(tile_map.getChunks()), 2)
+
+    def testViews(self):
+        """Tiles are views on the packed bytes of the chunks."""
+        tile_map = tile.TileMap({(3, -7): tile.Tile(tile.NATURE_RUBBER, 0)})
+        view = tile_map.tiles[(3, -7)]
+        self.assertFalse(view.isSolid())
+        view.height = 1
+        self.assertEquals(tile_map.getNature((3, -7)), tile.NATURE_RUBBER)
+        self.assertTrue(tile_map.isSolidAt((3, -7)))
+        self.assertFalse(tile_map.isSolidAt((4, -7)))
+        self.assertRaises(KeyError, tile_map.getPacked, (4, -7))
+        self.assertEquals(len(tile_map.tiles), 1)
+        self.assertEquals(tile.unpackTile(tile_map.getPacked((3, -7))),
+                          (tile.NATURE_RUBBER, 1))
+
+    def testLazy(self):
+        """Chunks are only generated when needed, once."""
+        generator = CountingGenerator()
+        tile_map = tile.TileMap(generator=generator)
+        self.assertEquals(generator.generated, [])
+        self.assertTrue(tile_map.tiles[(20, -1)].isSolid())
+        self.assertTrue(tile_map.tiles[(21, -16)])
+        self.assertEquals(generator.generated, [(1, -1)])
+
+    def testEviction(self):
+        """Cold chunks go away, modified ones come back as they were."""
+        generator = CountingGenerator()
+        tile_map = tile.TileMap(generator=generator, max_chunks=10)
+        tile_map.tiles[(5, 5)] = tile.Tile(tile.NATURE_DIRT, 1)
+        for x in xrange(1, 30):
+            tile_map.getTile((x * 16, 0))
+        self.assertTrue(len(tile_map.getChunks()) <= 10)
+        self.assertFalse((0, 0) in tile_map.getChunkCoords())
+        self.assertEquals(tile_map.tiles[(5, 5)].nature, tile.NATURE_DIRT)
+        self.assertEquals(generator.generated.count((0, 0)), 1)
+        # Unmodified chunks are generated again.
+        tile_map.getTile((16, 0))
+        self.assertEquals(generator.generated.count((1, 0)), 2)
+
+    def testRecentlyUsedStay(self):
+        """The chunk we keep using is never evicted."""
+        tile_map = tile.TileMap(generator=CountingGenerator(), max_chunks=4)
+        for x in xrange(1, 30):
+            tile_map.getTile((0, 0))
+            tile_map.getTile((x * 16, 0))
+        self.assertTrue((0, 0) in tile_map.getChunkCoords())
+
+    def testNewChunkStays(self):
+        """The chunk being loaded is never the one evicted."""
+        tile_map = tile.TileMap(generator=CountingGenerator(), max_chunks=1)
+        loaded = []
+        tile_map.chunk_loaded_callback = loaded.append
+        for x in xrange(3):
+            tile_map.getTile((x * 16, 0))
+            self.assertEquals(tile_map.getChunkCoords(), [(x, 0)])
+            tile_map.makeChunkSummary(loaded[-1])
+        self.assertEquals(loaded, [(0, 0), (1, 0), (2, 0)])
+
+    def testCountChunksAround(self):
+        """The count is the worst case of getChunkCoordsAround."""
+        tile_map = tile.TileMap()
+        for radius in (0, 1, 7.5, 16, 20):
+            most = max(len(tile_map.getChunkCoordsAround(
+                        Vector(x / 4., x / 4.), radius))
+                       for x in xrange(64))
+            self.assertEquals(tile_map.countChunksAround(radius), most)
+
+    def testLoadAround(self):
+        """Preloading covers the radius."""
+        tile_map = tile.TileMap(generator=CountingGenerator())
+        tile_map.loadAround(Vector(0, 0), 16)
+        self.assertEquals(sorted(tile_map.getChunkCoords()),
+                          [(x, y) for x in (-1, 0, 1)
+                           for y in (-1, 0, 1)])
+
+    def testBatches(self):
+        """Preloading asks for the missing chunks at once, not the stored."""
+        generator = BatchGenerator()
+        tile_map = tile.TileMap(generator=generator)
+        tile_map.tiles[(0, 0)] = tile.Tile(tile.NATURE_DIRT, 0)
+        # Evict it, it goes to the store.
+        tile_map.max_chunks = 1
+        tile_map.getTile((16, 0))
+        # The chunk just loaded survives, the modified one is in the store.
+        self.assertEquals(tile_map.getChunkCoords(), [(1, 0)])
+        self.assertTrue(tile_map.store.loadChunk((0, 0)) is not None)
+        tile_map.max_chunks = None
+        tile_map.loadAround(Vector(0, 0), 16)
+        # Neither the one in memory nor the stored one is generated.
+        self.assertEquals(len(generator.batches), 1)
+        self.assertEquals(sorted(generator.batches[0]),
+                          [(x, y) for x in (-1, 0, 1) for y in (-1, 0, 1)
+                           if (x, y) not in ((0, 0), (1, 0))])
+        self.assertEquals(tile_map.tiles[(0, 0)].nature, tile.NATURE_DIRT)
+        self.assertEquals(len(tile_map.getChunks()), 9)
+
+    def testFromGrid(self):
+        """A rectangle of packed tiles straddling chunks."""
+        width = 21
+        packed = bytearray(tile.packTile(tile.NATURE_SAND, (x + y) % 2)
+                           for y in xrange(5) for x in xrange(width))
+        tile_map = tile.TileMap.fromGrid((-10, 14), width, packed)
+        self.assertEquals(len(tile_map.tiles), width * 5)
+        self.assertEquals(len(tile_map.getChunks()), 4)
+        self.assertEquals(tile_map.tiles[(10, 18)],
+                          tile.Tile(tile.NATURE_SAND, 0))
+        self.assertTrue(tile_map.isSolidAt((-10, 15)))
+        self.assertFalse((11, 18) in tile_map.tiles)
+        self.assertEquals(tile_map.takeChanges(), None)
+
+    def testChanges(self):
+        """Only the tiles that really changed are remembered, once."""
+        tile_map = tile.TileMap({(3, -7): tile.Tile(tile.NATURE_RUBBER, 0),
+                                 (40, 2): tile.Tile(tile.NATURE_DIRT, 1)})
+        self.assertEquals(tile_map.takeChanges(), None)
+        copy = tile.TileMap.fromSummary(tile_map.makeSummary())
+        tile_map.tiles[(3, -7)].height = 1
+        tile_map.tiles[(40, 2)].height = 1
+        changes = tile_map.takeChanges()
+        self.assertEquals(list(changes.iteritems()),
+                          [((3, -7), (tile.NATURE_RUBBER, 1))])
+        self.assertEquals(tile_map.takeChanges(), None)
+        copy.applyChanges(changes)
+        self.assertTrue(copy.isSolidAt((3, -7)))
+
+
+class TestTileMapSummary(unittest.TestCase):
+    """Test the summaries that go to the views."""
+    def setUp(self):
+        tiles = dict(((x, y), tile.Tile(tile.NATURE_GRASS, int(x == y)))
+                     for x in xrange(-20, 20) for y in xrange(-5, 5))
+        self.tile_map = tile.TileMap(tiles)
+        self.summary = self.tile_map.makeSummary()
+
+    def testContent(self):
+        """Same tiles as the map."""
+        self.assertEquals(len(self.summary), 400)
+        self.assertEquals(self.summary[(3, 3)], (tile.NATURE_GRASS, 1))
+        self.assertEquals(self.summary[(3, 4)], (tile.NATURE_GRASS, 0))
+        self.assertRaises(KeyError, self.summary.__getitem__, (3, 5))
+        self.assertEquals(self.summary.get((300, 5)), None)
+
+    def testNoCopy(self):
+        """The summary sees the changes, and the versions tell."""
+        chunk_coord = self.tile_map.chunkCoordAt((0, 0))
+        version = self.summary.getVersion(chunk_coord)
+        self.tile_map.tiles[(0, 0)].nature = tile.NATURE_SAND
+        self.assertEquals(self.summary[(0, 0)], (tile.NATURE_SAND, 1))
+        newer = self.tile_map.makeSummary()
+        self.assertTrue(newer.getVersion(chunk_coord) > version)
+
+    def testReadOnly(self):
+        """Nobody can write through a summary."""
+        for unused, data in self.summary.iterChunks():
+            self.assertRaises(TypeError, data.__setitem__, 0, 'a')
+
+    def testPickle(self):
+        """A summary is pickled as one string, and comes back the same."""
+        blob = pickle.dumps(self.summary, pickle.HIGHEST_PROTOCOL)
+        copy = pickle.loads(blob)
+        self.assertEquals(sorted(copy.iteritems()),
+                          sorted(self.summary.iteritems()))
+        tile_map = tile.TileMap.fromSummary(copy)
+        self.assertTrue(tile_map.isSolidAt((-4, -4)))
+
+    def testUpdate(self):
+        """Only more recent chunks replace the ones we have."""
+        old = self.summary.copy()
+        self.tile_map.tiles[(0, 0)] = tile.Tile(tile.NATURE_DIRT, 0)
+        changed = self.tile_map.makeChunkSummary((0, 0))
+        old.update(changed)
+        self.assertEquals(old[(0, 0)], (tile.NATURE_DIRT, 0))
+        changed.update(self.summary)
+        self.assertEquals(len(changed), 400)
+        self.assertEquals(changed[(0, 0)], (tile.NATURE_DIRT, 0))
+
+    def testApplyChanges(self):
+        """Copies from another process are patched, only once."""
+        copy = pickle.loads(pickle.dumps(self.summary))
+        self.tile_map.tiles[(0, 0)].height = 0
+        changes = self.tile_map.takeChanges()
+        copy.applyChanges(changes)
+        self.assertEquals(copy[(0, 0)], (tile.NATURE_GRASS, 0))
+        self.assertEquals(copy.getVersion((0, 0)),
+                          self.tile_map.makeSummary().getVersion((0, 0)))
+        # A chunk that arrived whole after the changes is not touched.
+        self.tile_map.tiles[(0, 0)].height = 1
+        newer = pickle.loads(pickle.dumps(self.tile_map.makeSummary()))
+        newer.applyChanges(changes)
+        self.assertEquals(newer[(0, 0)], (tile.NATURE_GRASS, 1))
+        # In this process, the buffers already show the changes.
+        shared = self.summary.copy()
+        shared.applyChanges(self.tile_map.takeChanges())
+        self.assertTrue(shared.iterChunks().next()[1] in
+                        [data for unused, data in self.summary.iterChunks()])
+
+
+class TestInfiniteArea(unittest.TestCase):
+    """An area on an infinite map."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+        self.area.tile_map = tile.TileMap(generator=CountingGenerator())
+        self.recorder = TilesRecorder(self.event_manager)
+
+    def testWalkIntoGeneratedWall(self):
+        """Entities collide with tiles of chunks generated on the fly."""
+        entity = self.world.createEntity(EntityModel)
+        entity.body.pos = Vector(17, 0)
+        entity.body.vel = Vector(10, 0)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        for unused in xrange(20):
+            self.area.runPhysics(.05)
+        self.assertTrue(entity.body.pos.x <= 19.5)
+
+    def testViewsHearAboutChunks(self):
+        """Chunks preloaded around the controlled entity are announced."""
+        entity = self.world.createEntity(EntityModel)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        self.area._controlled_entity_id = entity.entity_id
+        self.area.runPhysics(.05)
+        self.event_manager.pump()
+        self.assertEquals(len(self.recorder.tiles), 9 * 16 * 16)
+        self.assertEquals(self.recorder.tiles[(20, 5)],
+                          (tile.NATURE_STONE, 1))
+
+    def testDoor(self):
+        """Opening a door sends the door, and the bunny feels it."""
+        entity = self.world.createEntity(EntityModel)
+        entity.body.pos = Vector(2, 3)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        self.area._controlled_entity_id = entity.entity_id
+        self.area.runPhysics(.05)
+        self.event_manager.pump()
+        self.area.tile_map.tiles[(20, 5)].height = 0
+        self.area.tile_map.tiles[(2, 3)].nature = tile.NATURE_RUBBER
+        self.area.runPhysics(.05)
+        self.event_manager.pump()
+        self.assertEquals(len(self.recorder.changes), 2)
+        self.assertEquals(self.recorder.tiles[(20, 5)],
+                          (tile.NATURE_STONE, 0))
+        self.assertEquals(entity.friction_force.mu,
+                          tile.MATERIALS[tile.NATURE_RUBBER].friction)
+
+    def testTooFewChunks(self):
+        """A tiny max_chunks is raised to what the preloading needs."""
+        tile_map = self.area.tile_map
+        tile_map.max_chunks = 4
+        entity = self.world.createEntity(EntityModel)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        self.area._controlled_entity_id = entity.entity_id
+        self.area.runPhysics(.05)
+        self.assertEquals(tile_map.max_chunks, 9)
+        generated = tile_map.generated_chunks
+        for unused in xrange(5):
+            self.area.runPhysics(.05)
+        self.assertEquals(tile_map.generated_chunks, generated)
+
+if __name__ == "__main__":
+    unittest.main()
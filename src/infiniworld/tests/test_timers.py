@@ -0,0 +1,131 @@
+#! /usr/bin/python
+"""TimerWheel test suite.
+
+"""
+import unittest
+
+from infiniworld.evtman import Event, EventManager, SingleListener
+from infiniworld.events import RunPhysicsEvent
+from infiniworld.models import WorldModel
+from infiniworld.models.snapshot import takeWorldSnapshot
+from infiniworld.timers import TimerWheel
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes.  ----------
+
+class RingEvent(Event):
+    """Posted later."""
+    attributes = ('name',)
+
+class RingRecorder(SingleListener):
+    """Keeps the names of the RingEvents."""
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.rings = []
+    def onRingEvent(self, event):
+        self.rings.append(event.name)
+
+class SmallWheel(TimerWheel):
+    """Goes round quickly."""
+    SLOTS = 4
+    LEVELS = 2
+
+#----------  Test suite.  ----------
+
+class TestTimerWheel(unittest.TestCase):
+    """Test the TimerWheel class."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.wheel = TimerWheel(self.event_manager)
+        self.fired = []
+
+    def tearDown(self):
+        if self.wheel._event_manager is not None:
+            self.wheel.unregister()
+
+    def fire(self, name):
+        """The callback of the timers, writes down when it fired."""
+        self.fired.append((name, round(self.wheel.now, 6)))
+
+    def flow(self, seconds, timestep=.05):
+        """Let the time flow."""
+        for unused in xrange(int(round(seconds / timestep))):
+            self.event_manager.post(RunPhysicsEvent(timestep))
+            self.event_manager.pump()
+
+    def testOnTime(self):
+        """Timers fire at the first tick after their delay, in order."""
+        self.wheel.schedule(.5, self.fire, 'b')
+        self.wheel.schedule(.12, self.fire, 'a')
+        self.wheel.schedule(.5, self.fire, 'c')
+        self.flow(.45)
+        self.assertEquals(self.fired, [('a', .15)])
+        self.flow(.05)
+        self.assertEquals(self.fired, [('a', .15), ('b', .5), ('c', .5)])
+        self.flow(5)
+        self.assertEquals(len(self.fired), 3)
+
+    def testFarAway(self):
+        """Timers wait on the upper levels and in the overflow."""
+        self.wheel.unregister()
+        self.wheel = SmallWheel(self.event_manager)
+        # 4 ticks per turn of the first level, 16 per turn of the wheel.
+        delays = [.05, .2, .25, .75, .8, 1.05, 2.5, 4]
+        for delay in delays:
+            self.wheel.schedule(delay, self.fire, delay)
+        self.assertEquals(len(self.wheel._overflow), 4)
+        self.flow(5)
+        self.assertEquals(self.fired, [(delay, delay) for delay in delays])
+
+    def testCancel(self):
+        """Cancelled timers don't fire."""
+        timer = self.wheel.schedule(.2, self.fire, 'no')
+        self.wheel.schedule(30, self.fire, 'no').cancel()
+        self.wheel.schedule(.2, self.fire, 'yes')
+        timer.cancel()
+        self.flow(31)
+        self.assertEquals(self.fired, [('yes', .2)])
+
+    def testScheduleFromCallback(self):
+        """A timer can schedule the next one, even in the same slot."""
+        def again(count):
+            """Fire again, a turn of the wheel later."""
+            self.fire(count)
+            if count:
+                self.wheel.schedule(self.wheel.SLOTS * self.wheel.RESOLUTION,
+                                    again, count - 1)
+        self.wheel.schedule(.1, again, 2)
+        self.flow(10)
+        self.assertEquals(self.fired, [(2, .1), (1, 3.3), (0, 6.5)])
+
+    def testPostLater(self):
+        """Events are posted when their time comes."""
+        recorder = RingRecorder(self.event_manager)
+        self.wheel.postLater(1, RingEvent('alarm'))
+        self.flow(.95)
+        self.assertEquals(recorder.rings, [])
+        self.flow(.1)
+        self.assertEquals(recorder.rings, ['alarm'])
+
+    def testWorldClock(self):
+        """The world has a clock, snapshots roll it back."""
+        self.wheel.unregister()
+        world = WorldModel(self.event_manager)
+        self.wheel = world.timers
+        self.flow(1)
+        snapshot = takeWorldSnapshot(world)
+        self.wheel.schedule(.5, self.fire, 'later')
+        self.flow(1)
+        snapshot.restore()
+        self.assertEquals(round(world.timers.now, 6), 1)
+        # The timers don't go back in time.
+        self.assertEquals(self.fired, [('later', 1.5)])
+        world.unregister()
+
+if __name__ == "__main__":
+    unittest.main()
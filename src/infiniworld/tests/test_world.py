@@ -0,0 +1,109 @@
+#! /usr/bin/python
+"""WorldModel test suite.
+
+"""
+import unittest
+
+from infiniworld.evtman import EventManager, SingleListener
+from infiniworld.geometry import Vector
+from infiniworld.models import EntityModel
+from infiniworld.models import WorldModel
+from infiniworld.models import events
+
+# pylint: disable-msg=R0904
+# Because unit tests have tons of public methods and that's normal.
+
+# pylint: disable-msg=W0212
+# Because I know what I'm doing when I use a protected attribute in a test.
+
+#----------  Helper classes.  ----------
+
+class PooledModel(EntityModel):
+    """Reused, with a counter that must start over."""
+    POOLED = True
+    SNAPSHOT_FIELDS = EntityModel.SNAPSHOT_FIELDS + ('hits',)
+    def reset(self, entity_id):
+        EntityModel.reset(self, entity_id)
+        self.hits = 0
+        self.moved_to = []
+    def onMoveEntityRequest(self, event):
+        EntityModel.onMoveEntityRequest(self, event)
+        if event.entity_id == self.entity_id:
+            self.moved_to.append(event.force)
+
+class LifeRecorder(SingleListener):
+    """Keeps the ids of the entities created and destroyed."""
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.created = []
+        self.destroyed = []
+    def onEntityCreatedEvent(self, event):
+        self.created.append(event.entity_id)
+    def onEntityDestroyedEvent(self, event):
+        self.destroyed.append(event.entity_id)
+
+#----------  Test suite.  ----------
+
+class TestEntityPool(unittest.TestCase):
+    """Test the reuse of the dead entities."""
+    def setUp(self):
+        self.event_manager = EventManager()
+        self.world = WorldModel(self.event_manager)
+        self.area = self.world.createArea()
+        self.recorder = LifeRecorder(self.event_manager)
+
+    def killAndSpawn(self, factory):
+        """Destroy an entity of that class and create another one."""
+        entity = self.world.createEntity(factory)
+        entity.body.pos = Vector(1, 1)
+        entity.body.vel = Vector(2, 0)
+        self.world.moveEntityToArea(entity.entity_id, self.area.area_id)
+        self.world.destroyEntity(entity)
+        return entity, self.world.createEntity(factory)
+
+    def testReused(self):
+        """A pooled entity comes back new, with a new entity_id."""
+        dead, new = self.killAndSpawn(PooledModel)
+        dead.hits = 3
+        self.assertTrue(new is dead)
+        self.assertEquals(new.entity_id, 1)
+        self.assertTrue(new.exists)
+        self.assertEquals(new.area, None)
+        self.assertEquals(new.body.pos, Vector(0, 0))
+        self.assertEquals(new.body.vel, Vector(0, 0))
+        self.world.destroyEntity(new)
+        self.assertEquals(self.world.createEntity(PooledModel).hits, 0)
+        self.event_manager.pump()
+        self.assertEquals(self.recorder.created, [0, 1, 2])
+        self.assertEquals(self.recorder.destroyed, [0, 1])
+
+    def testNotPooled(self):
+        """The other classes are unregistered and forgotten."""
+        dead, new = self.killAndSpawn(EntityModel)
+        self.assertFalse(new is dead)
+        self.assertEquals(dead._event_manager, None)
+
+    def testDeafWhileDead(self):
+        """An entity in the pool does not react to its old entity_id."""
+        dead = self.world.createEntity(PooledModel)
+        self.world.destroyEntity(dead)
+        self.event_manager.post(events.MoveEntityRequest(0, Vector(1, 0)))
+        self.event_manager.pump()
+        self.assertEquals(dead.moved_to, [])
+        new = self.world.createEntity(PooledModel)
+        self.event_manager.post(events.MoveEntityRequest(1, Vector(1, 0)))
+        self.event_manager.pump()
+        self.assertEquals(new.moved_to, [Vector(1, 0)])
+
+    def testPoolSize(self):
+        """The pools don't grow forever."""
+        self.world.POOL_SIZE = 2
+        entities = [self.world.createEntity(PooledModel)
+                    for unused in xrange(3)]
+        for entity in entities:
+            self.world.destroyEntity(entity)
+        self.assertEquals(len(self.world._pools[PooledModel]), 2)
+        self.assertEquals(entities[2]._event_manager, None)
+
+if __name__ == "__main__":
+    unittest.main()
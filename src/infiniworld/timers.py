@@ -0,0 +1,136 @@
+#! /usr/bin/python
+"""Game clock and timers.
+
+Counting a cooldown down in every creature at every physics update costs a
+method call per creature per update, even when nothing is cooling down.  Two
+cheaper ways of waiting are offered here:
+
+* The clock: TimerWheel.now is the time of the game, in seconds.  Remember
+  when something will be ready again (now + cooldown), compare when you need
+  to know.  Nothing happens in between.
+* The timers: TimerWheel.schedule calls a function later, postLater posts an
+  event later.  They wait in a hierarchical timer wheel: a physics update
+  only looks at the timers of the current slot, however many timers are
+  waiting for later.
+
+The wheel has LEVELS levels of SLOTS slots.  A slot of the first level holds
+the timers of one tick (RESOLUTION seconds), a slot of the second level
+those of SLOTS ticks, and so on.  When the first level has gone round, the
+next slot of the second level is spread over the first level, like the
+hands of a clock.  The timers further away than the last level wait in a
+list that is looked at when the last level has gone round.
+
+A timer fires at the first tick after its delay: the precision is
+RESOLUTION.  The timers of the same tick fire in the order they were
+scheduled.
+
+"""
+from __future__ import division
+import math
+
+from evtman import SingleListener
+
+
+class Timer(object):
+    """A call waiting in a TimerWheel, see TimerWheel.schedule."""
+    def __init__(self, tick, order, callback, args):
+        object.__init__(self)
+        self.tick = tick
+        self.order = order
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+    def cancel(self):
+        """Don't call me, I'll call you."""
+        self.cancelled = True
+
+
+class TimerWheel(SingleListener):
+    """Clock of the game and timers, see the module docstring.
+
+    Time flows with the RunPhysicsEvents.  `now` can be set (a snapshot does
+    it when it rolls back), that does not move the timers: they wait for the
+    time that really flows.
+
+    """
+    RESOLUTION = .05 # seconds per tick.
+    SLOTS = 64
+    LEVELS = 3
+    def __init__(self, event_manager):
+        SingleListener.__init__(self, event_manager)
+        self.now = 0.
+        # The time seen by the wheel, and the last tick it did.
+        self._elapsed = 0.
+        self._tick = 0
+        self._order = 0
+        self._levels = [[[] for unused in xrange(self.SLOTS)]
+                        for unused in xrange(self.LEVELS)]
+        self._overflow = []
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) in `delay` seconds.  Return a Timer."""
+        ticks = max(1, int(math.ceil(delay / self.RESOLUTION - 1e-6)))
+        self._order += 1
+        timer = Timer(self._tick + ticks, self._order, callback, args)
+        self._place(timer)
+        return timer
+    def postLater(self, delay, event):
+        """Post the event in `delay` seconds.  Return a Timer."""
+        return self.schedule(delay, self.post, event)
+
+    def _place(self, timer):
+        """Put the timer in the slot of its tick, on the lowest level."""
+        tick = timer.tick
+        span = self.SLOTS
+        for level in self._levels:
+            if tick - self._tick < span:
+                level[(tick * self.SLOTS // span) % self.SLOTS].append(timer)
+                return
+            span *= self.SLOTS
+        self._overflow.append(timer)
+    def _cascade(self, level_index):
+        """Spread the current slot of that level over the lower levels."""
+        span = self.SLOTS ** level_index
+        level = self._levels[level_index]
+        index = (self._tick // span) % self.SLOTS
+        timers = level[index]
+        level[index] = []
+        for timer in timers:
+            if not timer.cancelled:
+                self._place(timer)
+    def advance(self):
+        """Do the next tick: fire its timers."""
+        self._tick += 1
+        tick = self._tick
+        slots = self.SLOTS
+        if tick % slots == 0:
+            # Gone round: from the top, the slots of the upper levels come
+            # down.
+            if tick % slots ** self.LEVELS == 0:
+                timers = self._overflow
+                self._overflow = []
+                for timer in timers:
+                    if not timer.cancelled:
+                        self._place(timer)
+            for level_index in xrange(self.LEVELS - 1, 0, -1):
+                if tick % slots ** level_index == 0:
+                    self._cascade(level_index)
+        level = self._levels[0]
+        index = tick % slots
+        timers = level[index]
+        if not timers:
+            return
+        level[index] = []
+        timers.sort(key=lambda timer: timer.order)
+        for timer in timers:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+
+    def onRunPhysicsEvent(self, event):
+        """Time flows: fire the timers that are due."""
+        self.now += event.timestep
+        self._elapsed += event.timestep
+        # The small epsilon keeps 20 * .05 from being 19 ticks.
+        ticks = int(self._elapsed / self.RESOLUTION + 1e-6)
+        while self._tick < ticks:
+            self.advance()
@@ -20,6 +20,7 @@ from infiniworld import events
 from infiniworld import evtman
 from infiniworld import geometry
 from infiniworld import models
+from infiniworld import timers
 
 LOGGER = logging.getLogger('pygame')
 
@@ -567,7 +568,7 @@ class AreaView(evtman.SingleListener):
         self._entities_mid_group = pygame.sprite.LayeredUpdates()
         self._entities_top_group = pygame.sprite.LayeredUpdates()
         # The information about the floor is stored in tiles:
-        self._tilemap = {}
+        self._tilemap = models.tile.TileMapSummary(1)
         self._visible_tiles_region = pygame.Rect((0, 0), (0, 0))
         # We need something to convert world coordinates (in meters) to
         # screen coordinates (in pixels).
@@ -594,6 +595,9 @@ class AreaView(evtman.SingleListener):
         # so we skip that part.
         self._paused_physics = False
         self._paused_shown = False
+        # The clock of the views, and their timers: hurt creatures turning
+        # back to normal...
+        self.timers = timers.TimerWheel(event_manager)
     def createSprite(self, size):
         """Instantiate the sprite, its image and its rect."""
         self.sprite = pygame.sprite.Sprite()
@@ -791,7 +795,15 @@ class AreaView(evtman.SingleListener):
         if event.area_id == self.area_id:
             for summary in event.entities:
                 self.createEntityViewFromSummary(summary)
-            self._tilemap = event.tilemap
+            # A copy of the summary, not of the tiles: we'll update it.
+            self._tilemap = event.tilemap.copy()
+    def onTilesChangedEvent(self, event):
+        """New tiles to show, or tiles that are not what they were."""
+        if event.area_id == self.area_id:
+            if event.tiles is not None:
+                self._tilemap.update(event.tiles)
+            if event.changes is not None:
+                self._tilemap.applyChanges(event.changes)
     def onViewAreaEvent(self, event):
         """We are looking at a new area."""
         self.setAreaId(event.area_id)